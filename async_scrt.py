@@ -0,0 +1,180 @@
+"""
+asyncio front end for fake_scrt, for driving many tabs at once from a single thread.
+
+Every fake_scrt Tab owns its own Screen, input queue and transport.  SessionManager opens
+tabs, and AsyncTab/AsyncScreen give them awaitable Send/WaitForString(s)/ReadString, so
+hundreds of tabs can wait on their devices at the same time:
+
+    async def show_version(host):
+        tab = manager.connect("/SSH2 {}".format(host))
+        await tab.Screen.WaitForString("#", 30)
+        await tab.Screen.Send("show version\\r")
+        return await tab.Screen.ReadString("#", 30)
+
+    manager = SessionManager(limit=100)
+    results = manager.run_all(show_version, hosts)
+
+The synchronous methods on fake_scrt.Screen are unchanged.  Both share the Screen's
+matching core (_scanner/_consume); only the waiting differs.  Needs Python 3 and a
+selector-based event loop (the default everywhere except Windows' proactor loop).
+"""
+import asyncio
+
+from fake_scrt import Tab, _string_list
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(True)
+
+
+async def _ready(conn, timeout, writer=False):
+    """Waits until a transport is readable (or writable).  Returns False on timeout."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    fd = conn.fileno()
+    if writer:
+        loop.add_writer(fd, _set_done, future)
+    else:
+        loop.add_reader(fd, _set_done, future)
+    try:
+        await asyncio.wait_for(future, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        if writer:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+
+class AsyncScreen(object):
+    """Awaitable versions of a fake_scrt Screen's blocking methods.  Everything else (Get,
+    Get2, Rows, CurrentRow, ...) is passed through to the Screen.  Only one coroutine at a time
+    should wait on a given screen, just as a SecureCRT script has one thread per tab."""
+    def __init__(self, screen):
+        self._screen = screen
+
+    def __getattr__(self, name):
+        return getattr(self._screen, name)
+
+    async def Send(self, string, send_to_screen_only=False):
+        """Sends a string of characters, waiting (without blocking the loop) if the remote is slow to take them."""
+        screen = self._screen
+        conn = screen._transport
+        if send_to_screen_only or conn is None:
+            return screen.Send(string, send_to_screen_only)
+        data = string.encode("utf-8") if not isinstance(string, bytes) else string
+        while data:
+            sent = conn.write_some(data)
+            data = data[sent:]
+            if data and not sent:
+                await _ready(conn, None, writer=True)
+        return string
+
+    async def WaitForString(self, string, timeout=0, case_insensitive=False):
+        """Wait for a string.  Returns True if it was seen, False on timeout."""
+        return (await self._wait_for([string], timeout, case_insensitive))[0] == 1
+
+    async def WaitForStrings(self, string_array, timeout=0, case_insensitive=False):
+        """Wait for one of several strings.  Returns the index of the string seen (first string
+        is index=1), or 0 on timeout."""
+        return (await self._wait_for(_string_list(string_array), timeout, case_insensitive))[0]
+
+    async def ReadString(self, string_array=(), timeout_seconds=0, case_insensitive=False):
+        """Returns the data received until one of string_array is seen (not including it)."""
+        screen = self._screen
+        string_array = _string_list(string_array)
+        if not string_array:
+            if not screen._input:
+                await self._read_more(timeout_seconds or None)
+            return screen._drain()
+        index, captured = await self._wait_for(string_array, timeout_seconds, case_insensitive, capture=True)
+        return screen._captured_text(string_array, index, captured)
+
+    async def _wait_for(self, strings, timeout, case_insensitive, capture=False):
+        """The asyncio twin of fake_scrt.Screen._wait_for."""
+        screen = self._screen
+        loop = asyncio.get_running_loop()
+        scanner = screen._scanner(strings, case_insensitive)
+        deadline = loop.time() + timeout if timeout else None
+        captured = [] if capture else None
+        while True:
+            index = screen._consume(scanner, captured)
+            if index:
+                return index, captured
+            remaining = None if deadline is None else deadline - loop.time()
+            if (remaining is not None and remaining <= 0) or not await self._read_more(remaining):
+                screen.MatchIndex = 0
+                return 0, captured
+
+    async def _read_more(self, timeout):
+        """Waits for data from the remote.  Returns False if nothing more can arrive."""
+        conn = self._screen._transport
+        if conn is None:
+            return False
+        if not await _ready(conn, timeout):
+            return True  # timed out: the caller checks its own deadline
+        return self._screen._read_more(0)
+
+
+class AsyncTab(object):
+    """A fake_scrt Tab with an AsyncScreen."""
+    def __init__(self, tab):
+        self.tab = tab
+        self.Screen = AsyncScreen(tab.Screen)
+        self.Session = tab.Session
+
+    def __getattr__(self, name):
+        return getattr(self.tab, name)
+
+    @property
+    def Caption(self):
+        return self.tab.Caption
+
+    @Caption.setter
+    def Caption(self, caption):
+        self.tab.Caption = caption
+
+
+class SessionManager(object):
+    """Opens tabs and runs a coroutine per tab, at most limit at a time (None: no limit)."""
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.tabs = []
+
+    def connect(self, arguments, wait_for_auth=True):
+        """Opens a new connected tab (see fake_scrt.Session.Connect) and returns it as an AsyncTab."""
+        tab = Tab()
+        tab.Session.Connect(arguments, wait_for_auth)
+        atab = AsyncTab(tab)
+        self.tabs.append(atab)
+        return atab
+
+    async def gather(self, func, items):
+        """Awaits func(item) for every item, at most limit at a time.  Returns the results in
+        order; an exception raised by func is returned in place of its result."""
+        semaphore = asyncio.Semaphore(self.limit) if self.limit else None
+
+        async def one(item):
+            if semaphore is None:
+                return await func(item)
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*[one(item) for item in items], return_exceptions=True)
+
+    def run_all(self, func, items):
+        """Synchronous wrapper around gather(), for plain (non-async) scripts."""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.gather(func, items))
+        finally:
+            loop.close()
+
+    def close_all(self):
+        """Closes every tab this manager opened."""
+        for atab in self.tabs:
+            atab.tab.Close()
+        self.tabs = []
@@ -0,0 +1,848 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the fake_scrt API surface and for our scripts' flows, run against
+synthetic device output (transport.ScriptedDevice), so regressions show up as the mock
+grows into a real engine.
+
+    python bench_scrt.py                  # run everything, compare with bench_baseline.json
+    python bench_scrt.py -k wait read     # only benchmarks whose name contains "wait" or "read"
+    python bench_scrt.py --lines 50000 --prompt-density 0.05
+    python bench_scrt.py --save-baseline  # make this run the new baseline
+    python bench_scrt.py --json out.json  # machine-readable results
+
+Each benchmark reports throughput (ops/s), p50/p99 latency of one op (ms) and peak memory
+allocated while it ran (KB, via tracemalloc): the medians of --runs runs (default 3).
+
+Timings only compare on the same machine, so the baseline is per machine: run
+--save-baseline on yours before comparing (the committed bench_baseline.json is one
+developer's).  Even on one machine, speed drifts with load and CPU clocks, so right before
+and after each run a fixed pure-Python calibration loop is timed, and the baseline's numbers
+are scaled by how much slower or faster that loop is now.  A benchmark is flagged as a
+regression when its scaled throughput drops, or its scaled p99 rises (p50 for benchmarks of
+fewer than TAIL_OPS ops, whose p99 is just their few slowest), by more than its tolerance:
+--tolerance (default 50%), or more if the runs saved in the baseline varied more than that
+(each entry records its own), and again in each of --confirm re-runs (default 2); the exit
+status is then 1.
+
+Needs Python 3.
+"""
+import argparse
+import collections
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import runpy
+import socket
+import sys
+import threading
+import time
+
+import tracemalloc
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, this_dir)
+
+import dialogue
+import fake_scrt
+import transport
+from fake_scrt import Screen, SecureCRT, Tab
+
+BASELINE_FILE = os.path.join(this_dir, "bench_baseline.json")
+TAIL_OPS = 1000  # fewer ops than this: compare on p50 (a p99 of them is just their few slowest)
+clock = time.perf_counter
+
+_benchmarks = []
+
+
+def bench(name):
+    """Registers a benchmark: func(cfg) -> list of per-op latencies (seconds)."""
+    def register(func):
+        _benchmarks.append((name, func))
+        return func
+    return register
+
+
+#####
+# synthetic devices
+
+PROMPTS = ["rtr{}#".format(i) for i in range(48)] + ["Password:", "--More--"]
+_WORDS = "interface GigabitEthernet0/1 is up line protocol description uplink to core mtu 1500 bytes".split()
+
+
+def synthetic_output(lines, prompt_density=0.01, seed=1):
+    """Device-like output: lines of words, with near-miss prompt text (e.g. "rtr12 #") on
+    about prompt_density of them, to make the matcher work."""
+    rnd = random.Random(seed)
+    out = []
+    for i in range(lines):
+        words = [rnd.choice(_WORDS) for _ in range(rnd.randint(4, 12))]
+        if rnd.random() < prompt_density:
+            words.insert(rnd.randint(0, len(words)), "rtr{} #".format(rnd.randint(0, 47)))
+        out.append(" ".join(words))
+    return "\r\n".join(out) + "\r\n"
+
+
+def device_factory(cfg):
+    output = synthetic_output(cfg.lines, cfg.prompt_density)
+    small = synthetic_output(20, cfg.prompt_density)
+    responses = {"show tech": output, "show clock": small, "": ""}
+    return lambda args: transport.ScriptedDevice(args.hostname, prompt="{hostname}#", responses=responses)
+
+
+def connected_tab(name="rtr47"):
+    tab = Tab()
+    tab.Session.Connect("/SSH2 " + name)
+    tab.Screen.WaitForString(name + "#", 5)
+    return tab
+
+
+#####
+# benchmarks
+
+@bench("screen_get_200x60")
+def bench_screen_get(cfg):
+    screen = Screen(60, 200)
+    screen.Send(synthetic_output(80), True)
+    latencies = []
+    for _ in range(cfg.repeat * 200):
+        t = clock()
+        screen.Get(1, 1, 60, 200)
+        latencies.append(clock() - t)
+    return latencies
+
+
+@bench("screen_get2_200x60")
+def bench_screen_get2(cfg):
+    screen = Screen(60, 200)
+    screen.Send(synthetic_output(80), True)
+    latencies = []
+    for _ in range(cfg.repeat * 200):
+        t = clock()
+        screen.Get2(1, 1, 60, 200)
+        latencies.append(clock() - t)
+    return latencies
+
+
+@bench("screen_feed_64k")
+def bench_screen_feed(cfg):
+    data = synthetic_output(cfg.lines, cfg.prompt_density).encode("utf-8")
+    chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+    screen = Screen()
+    latencies = []
+    for chunk in chunks:
+        t = clock()
+        screen._receive(chunk)
+        latencies.append(clock() - t)
+    return latencies
+
+
+@bench("scrollback_search_100k")
+def bench_scrollback_search(cfg):
+    screen = Screen()
+    screen._receive(synthetic_output(max(cfg.lines, 100000), cfg.prompt_density).encode("utf-8"))
+    latencies = []
+    for i in range(cfg.repeat * 20):
+        screen._receive("show ip interface brief {}\r\n".format(i).encode("utf-8"))
+        t = clock()
+        screen.search("rtr12 #", last=100000)
+        screen.search(r"^interface \S+ is down", last=100000, regex=True)
+        latencies.append(clock() - t)
+    return latencies
+
+
+@bench("wait_for_strings_50_prompts")
+def bench_wait_for_strings(cfg):
+    tab = connected_tab()
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        tab.Screen.Send("show tech\r")
+        index = tab.Screen.WaitForStrings(PROMPTS, 10)
+        latencies.append(clock() - t)
+        assert index == 48, index
+    tab.Close()
+    return latencies
+
+
+@bench("read_string_show_tech")
+def bench_read_string(cfg):
+    tab = connected_tab()
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        tab.Screen.Send("show tech\r")
+        tab.Screen.ReadString(["rtr47#"], 10)
+        latencies.append(clock() - t)
+    tab.Close()
+    return latencies
+
+
+@bench("command_round_trip")
+def bench_round_trip(cfg):
+    tab = connected_tab()
+    latencies = []
+    for _ in range(cfg.repeat * 20):
+        t = clock()
+        tab.Screen.Send("show clock\r")
+        tab.Screen.WaitForString("rtr47#", 5)
+        latencies.append(clock() - t)
+    tab.Close()
+    return latencies
+
+
+@bench("command_round_trip_traced")
+def bench_round_trip_traced(cfg):
+    """command_round_trip with tracing on: the difference is its overhead."""
+    import tracing
+    tracing.enable(summary=False)
+    try:
+        return bench_round_trip(cfg)
+    finally:
+        tracing.disable()
+
+
+@bench("dialogue_login_20_commands")
+def bench_dialogue(cfg):
+    """A compiled dialogue logging in to a device, then one running 20 commands."""
+    responses = {"show clock": synthetic_output(20, cfg.prompt_density), "": ""}
+    transport.register("auth47", lambda args: transport.ScriptedDevice(args.hostname, responses=responses,
+                                                                       username="admin", password="pw"))
+    login = {"start": [("Username: ", "{username}\r"), ("Password: ", "{password}\r"),
+                       ("% Authentication failed", None, "fail"), ("auth47#", None, "done")]}
+    commands = dict(("c{}".format(i), [("auth47#", "show clock\r", "c{}".format(i + 1))]) for i in range(20))
+    commands["c20"] = [("auth47#", None, "done")]
+    latencies = []
+    for _ in range(cfg.repeat * 4):
+        tab = Tab()
+        t = clock()
+        tab.Session.Connect("/SSH2 auth47")
+        result = tab.Screen.dialogue(login, timeout=5, username="admin", password="pw")
+        assert result.ok, result
+        result = tab.Screen.dialogue(dialogue.compile(commands, start="c0"), send="\r", timeout=5)
+        assert result.ok and len(result.transcript) == 21, result
+        latencies.append(clock() - t)
+        tab.Close()
+    return latencies
+
+
+@bench("tab_pool_checkout_48_hosts")
+def bench_tab_pool(cfg):
+    """A logged-in tab for one of 48 hosts from a warm pool: health check, one command, release."""
+    import tab_pool
+    crt = SecureCRT()
+    pool = tab_pool.TabPool(crt, max_size=48, login=lambda tab: tab.Screen.WaitForString("#", 5))
+    for i in range(48):
+        pool.release(pool.get("rtr{}".format(i)))
+    latencies = []
+    for i in range(cfg.repeat * 20):
+        host = "rtr{}".format(i % 48)
+        t = clock()
+        with pool.tab(host) as tab:
+            tab.Screen.Send("show clock\r")
+            tab.Screen.WaitForString(host + "#", 5)
+        latencies.append(clock() - t)
+    assert pool.misses == 48, pool
+    pool.close()
+    return latencies
+
+
+@bench("send_lines_2000_confirmed")
+def bench_send_lines(cfg):
+    """A 2000-line config pasted with echo confirmation, into a device that takes 20k lines/s
+    through a 4 KB input buffer: none may be lost."""
+    transport.register("slow47", lambda args: transport.ScriptedDevice(
+        args.hostname, responses={"": ""}, line_rate=20000, input_buffer=4096))
+    config = ["interface GigabitEthernet0/{}\r description uplink {}".format(i, i) for i in range(1000)]
+    tab = Tab()
+    tab.Session.Connect("/SSH2 slow47")
+    tab.Screen.WaitForString("slow47#", 5)
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        result = tab.Screen.send_lines(u"\r".join(config), confirm=True)
+        latencies.append(clock() - t)
+        assert len(result.lost) == 0 and result.lines_confirmed == 2000, result.summary()
+    tab.Close()
+    return latencies
+
+
+ARP_TEMPLATE = r"""
+Value ADDRESS (\d+\.\d+\.\d+\.\d+)
+Value AGE (\S+)
+Value MAC ([0-9a-f.]+)
+Value INTERFACE (\S+)
+
+Start
+  ^Internet\s+${ADDRESS}\s+${AGE}\s+${MAC}\s+ARPA\s+${INTERFACE}$$ -> Record
+"""
+
+
+@bench("read_records_arp_100k")
+def bench_read_records(cfg):
+    """A 100k-entry ARP table parsed with a template as it arrives, into a Table."""
+    import template_parser
+    rows = ["Internet  10.{}.{}.{}  {}  0011.22{:02x}.{:04x}  ARPA  Vlan{}".format(
+        i >> 16 & 255, i >> 8 & 255, i & 255, i % 240, i % 256, i % 65536, i % 40) for i in range(100000)]
+    arp = "\r\n".join(rows) + "\r\n"
+    transport.register("arp47", lambda args: transport.ScriptedDevice(args.hostname, responses={"show ip arp": arp}))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 arp47")
+    tab.Screen.WaitForString("arp47#", 5)
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        template = template_parser.compile_template(ARP_TEMPLATE)
+        table = template.table(tab.Screen.read_records(template, send="show ip arp\r"))
+        latencies.append(clock() - t)
+        assert len(table) == 100000, table
+    tab.Close()
+    return latencies
+
+
+@bench("connect_in_tab")
+def bench_connect(cfg):
+    crt = SecureCRT()
+    latencies = []
+    tabs = []
+    for i in range(cfg.repeat * 5):
+        t = clock()
+        tab = crt.Session.ConnectInTab("/SSH2 rtr{}".format(i % 48))
+        tab.Screen.WaitForString("#", 5)
+        crt.GetTab(crt.GetTabCount())
+        latencies.append(clock() - t)
+        tabs.append(tab)
+    for tab in tabs:
+        tab.Close()
+    return latencies
+
+
+@bench("broadcast_300_tabs")
+def bench_broadcast(cfg):
+    crt = SecureCRT()
+    tabs = [connected_tab("rtr{}".format(i % 48)) for i in range(300)]
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        result = crt.CommandWindow.broadcast("show clock", tabs)
+        latencies.append(clock() - t)
+        assert result.ok, result.summary()
+    for tab in tabs:
+        tab.Close()
+    return latencies
+
+
+@bench("async_100_tabs")
+def bench_async_tabs(cfg):
+    from async_scrt import SessionManager
+    manager = SessionManager(limit=50)
+    latencies = []
+
+    async def job(name):
+        t = clock()
+        tab = manager.connect("/SSH2 " + name)
+        await tab.Screen.WaitForString(name + "#", 10)
+        await tab.Screen.Send("show clock\r")
+        await tab.Screen.ReadString([name + "#"], 10)
+        latencies.append(clock() - t)
+
+    manager.run_all(job, ["rtr{}".format(i % 48) for i in range(100)])
+    manager.close_all()
+    return latencies
+
+
+@bench("replay_show_tech")
+def bench_replay(cfg):
+    import shutil
+    import tempfile
+    import capture
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "rtr47.cap")
+    transport.register("rtr47", capture.recording(device_factory(cfg), path))
+    tab = connected_tab()
+    tab.Screen.Send("show tech\r")
+    tab.Screen.WaitForString("rtr47#", 10)
+    tab.Close()
+    transport.register("rtr47", capture.replaying(path))
+    latencies = []
+    for _ in range(cfg.repeat):
+        t = clock()
+        tab = connected_tab()
+        tab.Screen.Send("show tech\r")
+        tab.Screen.WaitForString("rtr47#", 10)
+        latencies.append(clock() - t)
+        tab.Close()
+    transport.register("rtr47", device_factory(cfg))
+    shutil.rmtree(folder)
+    return latencies
+
+
+@bench("session_log_300_tabs")
+def bench_session_log(cfg):
+    import shutil
+    import tempfile
+    import session_log
+    folder = tempfile.mkdtemp()
+    logs = [session_log.SessionLog(os.path.join(folder, "%I.log"), {"tab_index": i}) for i in range(300)]
+    lines = synthetic_output(200, cfg.prompt_density).encode("utf-8").splitlines(True)
+    latencies = []
+    for line in lines * cfg.repeat:
+        for log in logs:
+            t = clock()
+            log.write(line)
+            latencies.append(clock() - t)
+    for log in logs:
+        log.close()
+    assert not sum(log.dropped for log in logs)
+    shutil.rmtree(folder)
+    return latencies
+
+
+@bench("script_runner_connect_py")
+def bench_script_runner(cfg):
+    """connect.py's imports and crt setup, run by a warm script_runner (client in-process)."""
+    import shutil
+    import tempfile
+    import script_runner
+    folder = tempfile.mkdtemp()
+    script = os.path.join(folder, "script.py")
+    with open(script, "w") as f:
+        f.write("import csv, inventory\nfrom find_localport import PortAllocator\n"
+                "from forward_registry import ForwardRegistry\ncrt.Session.SetStatusText('ready')\n")
+    state_file = os.path.join(folder, "runner.json")
+    thread = threading.Thread(target=script_runner.serve, args=(script_runner.Runner(), state_file))
+    thread.start()
+    while not script_runner.running(state_file):
+        time.sleep(0.01)
+    latencies = []
+    for _ in range(cfg.repeat * 20):
+        t = clock()
+        result = script_runner.run(script, state_file=state_file)
+        latencies.append(clock() - t)
+        assert result["status"] == "ok", result["error"]
+    script_runner.request({"op": "stop"}, state_file)
+    thread.join()
+    shutil.rmtree(folder)
+    return latencies
+
+
+_session_trees = []
+
+
+def _session_tree():
+    """A folder of 20k saved sessions, and its index: made once per process (writing the
+    files takes longer than the benchmark), removed at exit."""
+    import atexit
+    import shutil
+    import tempfile
+    import session_db
+    if _session_trees:
+        return _session_trees[0]
+    folder = tempfile.mkdtemp()
+    options = u"".join(u'D:"Option {}"=00000001\r\n'.format(i) for i in range(150))
+    for i in range(20000):
+        site = os.path.join(folder, "site{}".format(i // 500))
+        if not os.path.isdir(site):
+            os.makedirs(site)
+        with open(os.path.join(site, "rtr{}.ini".format(i)), "wb") as f:
+            f.write(u'S:"Hostname"=10.{}.{}.{}\r\n{}'.format(i >> 16, (i >> 8) & 255, i & 255, options).encode("utf-8"))
+    index_file = folder + ".json"
+    session_db.SessionDatabase(folder, index_file).paths()
+    atexit.register(shutil.rmtree, folder, True)
+    atexit.register(os.remove, index_file)
+    _session_trees.append((folder, index_file))
+    return folder, index_file
+
+
+@bench("session_lookup_20k")
+def bench_session_lookup(cfg):
+    """A script's first lookup in a tree of 20k saved sessions: open the database (the index
+    kept from an earlier run), find a session by host, and read one of its options."""
+    import session_db
+    folder, index_file = _session_tree()
+    latencies = []
+    for i in range(cfg.repeat):
+        t = clock()
+        db = session_db.SessionDatabase(folder, index_file)
+        path, = db.find_host("10.0.{}.{}".format(i % 78, i % 256))
+        db.load(path)["Option 1"]
+        latencies.append(clock() - t)
+    return latencies
+
+
+def _loopback_transfers(cfg, send, receive, megabytes=4):
+    """Times transfers of a file of random data over a loopback pair, the receiver on a
+    thread playing the remote."""
+    import hashlib
+    import shutil
+    import tempfile
+    import xyzmodem
+    folder = tempfile.mkdtemp()
+    source = os.path.join(folder, "image.bin")
+    digest = hashlib.sha256()
+    with open(source, "wb") as f:
+        for _ in range(megabytes):
+            block = os.urandom(1 << 20)
+            digest.update(block)
+            f.write(block)
+    received = os.path.join(folder, "received")
+    os.makedirs(received)
+    latencies = []
+    for _ in range(cfg.repeat):
+        ours, theirs = xyzmodem.loopback()
+        thread = threading.Thread(target=receive, args=(theirs, received))
+        thread.start()
+        t = clock()
+        send(ours, source)
+        thread.join()
+        latencies.append(clock() - t)
+        ours.close()
+        theirs.close()
+        with open(os.path.join(received, "image.bin"), "rb") as f:
+            assert hashlib.sha256(f.read()).digest() == digest.digest(), "received file differs"
+    shutil.rmtree(folder)
+    return latencies
+
+
+@bench("xmodem_1k_4mb")
+def bench_xmodem(cfg):
+    import xyzmodem
+    return _loopback_transfers(cfg, lambda conn, path: xyzmodem.send_xmodem(conn, path, block_size=1024),
+                               lambda conn, folder: xyzmodem.receive_xmodem(conn, os.path.join(folder, "image.bin")))
+
+
+@bench("ymodem_4mb")
+def bench_ymodem(cfg):
+    import xyzmodem
+    return _loopback_transfers(cfg, lambda conn, path: xyzmodem.send_ymodem(conn, [path]), xyzmodem.receive_ymodem)
+
+
+@bench("zmodem_4mb")
+def bench_zmodem(cfg):
+    import xyzmodem
+    return _loopback_transfers(cfg, lambda conn, path: xyzmodem.send_zmodem(conn, [path]), xyzmodem.receive_zmodem)
+
+
+@bench("kermit_4mb")
+def bench_kermit(cfg):
+    import kermit
+    return _loopback_transfers(cfg, lambda conn, path: kermit.send_kermit(conn, [path]), kermit.receive_kermit)
+
+
+def _http_server(body=b""):
+    """A throwaway local HTTP server, standing in for the web UI behind a forward."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(64)
+
+    def serve():
+        while True:
+            try:
+                client, _ = server.accept()
+            except socket.error:
+                return
+            try:
+                if client.recv(4096):  # (not a connection given up on unused)
+                    client.sendall("HTTP/1.0 200 OK\r\nContent-Length: {}\r\n\r\n".format(len(body)).encode("ascii")
+                                   + body)
+            except socket.error:
+                pass
+            client.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _quiet_crt(arg=None):
+    """Make the mock's dialogs non-interactive and silent for the script flows, and pass
+    the script arg as its /ARG."""
+    fake_scrt.SecureCRT.Dialog.MessageBox = staticmethod(lambda message, title=None, buttons=None: 1)
+    fake_scrt.SecureCRT.Arguments._args = [arg] if arg else []
+
+
+@contextlib.contextmanager
+def _scratch_forward_files():
+    """Points PortAllocator and ForwardRegistry at a lease file and registry in a temporary
+    folder, so the script flows leave the workstation's shared ones alone."""
+    import shutil
+    import tempfile
+    import find_localport
+    import forward_registry
+    folder = tempfile.mkdtemp()
+    saved = find_localport.LEASE_FILE, forward_registry.REGISTRY_FILE
+    find_localport.LEASE_FILE = os.path.join(folder, "leases.json")
+    forward_registry.REGISTRY_FILE = os.path.join(folder, "forwards.sqlite3")
+    try:
+        yield
+    finally:
+        find_localport.LEASE_FILE, forward_registry.REGISTRY_FILE = saved
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@bench("connect_py_flow")
+def bench_connect_py(cfg):
+    _quiet_crt("rtr5")
+    latencies = []
+    with _scratch_forward_files():
+        for _ in range(cfg.repeat):
+            before = len(fake_scrt._tabs)
+            t = clock()
+            runpy.run_path(os.path.join(this_dir, "connect.py"))
+            latencies.append(clock() - t)
+            for tab in fake_scrt._tabs[before:]:
+                tab.Close()
+    return latencies
+
+
+@bench("open_thru_proxy_flow")
+def bench_open_thru_proxy(cfg):
+    import webbrowser
+    _quiet_crt()
+    server = _http_server()
+    opened = []
+    webbrowser_open, webbrowser.open = webbrowser.open, opened.append
+    latencies = []
+    try:
+        with _scratch_forward_files():
+            for _ in range(cfg.repeat):
+                tab = Tab()
+                tab.Session.Connect("/SSH2 /LOCAL 0:127.0.0.1:{} rtr1".format(server.getsockname()[1]))
+                lport = tab.Screen._transport.forwards[0].listen_port
+                tab.Caption = "rtr1 {}".format(lport)  # as connect.py does
+                from forward_registry import ForwardRegistry
+                ForwardRegistry().add(lport, "rtr1", "127.0.0.1", 80, tab.Index, tab.Caption)
+                tab.Activate()
+                t = clock()
+                runpy.run_path(os.path.join(this_dir, "openThruProxy.py"))
+                latencies.append(clock() - t)
+                tab.Close()
+    finally:
+        webbrowser.open = webbrowser_open
+        server.close()
+    assert len(opened) == cfg.repeat, opened
+    return latencies
+
+
+@bench("forward_mux_http_1mb")
+def bench_forward_mux(cfg):
+    import forward_mux
+    body = os.urandom(1 << 20)
+    server = _http_server(body)
+    forward = transport.LocalForward(0, "127.0.0.1", server.getsockname()[1])  # stands in for the SSH forward
+    mux = forward_mux.start_background(0, routes={"rtr1": ("127.0.0.1", forward.listen_port)}, registry=False)
+    request = "GET / HTTP/1.1\r\nHost: rtr1.localhost:{}\r\n\r\n".format(mux.port).encode("ascii")
+    latencies = []
+    try:
+        for _ in range(cfg.repeat * 10):
+            t = clock()
+            client = socket.create_connection(("127.0.0.1", mux.port))
+            client.sendall(request)
+            received = 0
+            while True:
+                data = client.recv(1 << 18)
+                if not data:
+                    break
+                received += len(data)
+            client.close()
+            latencies.append(clock() - t)
+            assert received > len(body), received
+    finally:
+        mux.close()
+        forward.close()
+        server.close()
+    return latencies
+
+
+#####
+# harness
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+def latency_key(result):
+    """The latency a result is compared on: p99, or p50 if it has too few ops for a p99."""
+    return "p99_ms" if result["ops"] >= TAIL_OPS else "p50_ms"
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+_CALIBRATION_TEXT = synthetic_output(1200)
+
+
+def calibrate(rounds=10):
+    """Best time (ms) of a fixed pure-Python loop (splitting, searching, dicts): how fast
+    this interpreter is running right now."""
+    times = []
+    for _ in range(rounds):
+        t = clock()
+        counts = dict()
+        for line in _CALIBRATION_TEXT.split("\r\n"):
+            for word in line.split():
+                counts[word] = counts.get(word, 0) + 1
+            line.find("rtr12 #")
+        times.append(clock() - t)
+    return min(times) * 1000
+
+
+def run_one(func, cfg):
+    """Times a benchmark cfg.runs times (each between calibration loops), then runs it again
+    under tracemalloc for its peak memory.  Returns the medians, and how much the runs
+    varied."""
+    runs = []
+    for _ in range(cfg.runs):
+        before = calibrate()
+        gc.collect()
+        if hasattr(gc, "freeze"):  # (3.7+) so what earlier benchmarks left doesn't change how often gc runs
+            gc.freeze()
+        started = clock()
+        try:
+            latencies = sorted(func(cfg))
+        finally:
+            if hasattr(gc, "freeze"):
+                gc.unfreeze()
+        elapsed = clock() - started
+        calibration_ms = (before + calibrate()) / 2
+        if not latencies:
+            return None
+        runs.append({
+            "ops": len(latencies),
+            "ops_per_sec": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "calibration_ms": calibration_ms,
+        })
+    result = dict((key, median([run[key] for run in runs])) for key in runs[0])
+    # relative spread of the calibrated throughput and latency between runs (but the first, which
+    # pays for imports and warming caches, if there are enough)
+    spread = 0.0
+    steady = runs[1:] if len(runs) > 2 else runs
+    for key, sign in (("ops_per_sec", 1), (latency_key(result), -1)):
+        scaled = [run[key] * run["calibration_ms"] ** sign for run in steady]
+        spread = max(spread, (max(scaled) - min(scaled)) / median(scaled))
+    result["spread"] = spread
+    result["peak_kb"] = None
+    if not cfg.no_memory:
+        gc.collect()
+        tracemalloc.start()
+        func(cfg)
+        result["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024.0
+        tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Returns {benchmark: regression messages} for the ones that regressed.  Baseline numbers
+    are scaled by the calibration loop's time now vs then; each entry's own tolerance applies
+    if it's larger."""
+    regressions = collections.defaultdict(list)
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        scale = result["calibration_ms"] / base["calibration_ms"] if base.get("calibration_ms") else 1.0
+        allowed = max(tolerance, base.get("tolerance", 0))
+        expected_ops = base["ops_per_sec"] / scale
+        latency = latency_key(base)
+        expected_latency = base[latency] * scale
+        if result["ops_per_sec"] < expected_ops * (1 - allowed):
+            regressions[name].append("{}: throughput {:.0f}/s vs baseline {:.0f}/s (calibrated)".format(
+                name, result["ops_per_sec"], expected_ops))
+        if result[latency] > expected_latency * (1 + allowed):
+            regressions[name].append("{}: {} {:.3f}ms vs baseline {:.3f}ms (calibrated)".format(
+                name, latency[:3], result[latency], expected_latency))
+    return dict(regressions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-k", nargs="*", default=[], help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--lines", type=int, default=20000, help="lines of synthetic device output per command")
+    parser.add_argument("--prompt-density", type=float, default=0.01,
+                        help="fraction of output lines with prompt-like text")
+    parser.add_argument("--repeat", type=int, default=5, help="scales how many ops each benchmark runs")
+    parser.add_argument("--runs", type=int, default=3, help="times each benchmark is run (medians are reported)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="least relative change flagged (entries saved from noisier runs allow more)")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="times a benchmark that looks like a regression is run again: it's only "
+                             "reported if it regresses every time")
+    parser.add_argument("--json", help="also write the results to this file")
+    cfg = parser.parse_args(argv)
+
+    transport.register("rtr*", device_factory(cfg))
+    results = dict()
+    print("{:<30} {:>8} {:>12} {:>10} {:>10} {:>10}".format("benchmark", "ops", "ops/s", "p50 ms", "p99 ms", "peak KB"))
+    for name, func in _benchmarks:
+        if cfg.k and not any(k in name for k in cfg.k):
+            continue
+        result = run_one(func, cfg)
+        if result is None:
+            continue
+        results[name] = result
+        print("{:<30} {:>8} {:>12.1f} {:>10.3f} {:>10.3f} {:>10}".format(
+            name, result["ops"], result["ops_per_sec"], result["p50_ms"], result["p99_ms"],
+            "-" if result["peak_kb"] is None else "{:.0f}".format(result["peak_kb"])))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"lines": cfg.lines, "prompt_density": cfg.prompt_density, "repeat": cfg.repeat},
+        "results": results,
+    }
+    if cfg.json:
+        with open(cfg.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if cfg.save_baseline:
+        for result in results.values():
+            # twice what the runs varied by, so the usual noise doesn't fail the comparison
+            result["tolerance"] = round(max(cfg.tolerance, 2 * result["spread"]), 2)
+        if os.path.exists(cfg.baseline):
+            with open(cfg.baseline) as f:
+                old = json.load(f)
+            old["results"].update(results)
+            results = old["results"]
+            report["results"] = results
+        with open(cfg.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Saved baseline: {}".format(cfg.baseline))
+        return 0
+    if os.path.exists(cfg.baseline):
+        with open(cfg.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("(baseline was run with different settings: {})".format(baseline.get("settings")))
+        if (baseline.get("platform"), baseline.get("python")) != (report["platform"], report["python"]):
+            print("(baseline is from another machine or Python: {} {}; run --save-baseline here)".format(
+                baseline.get("platform"), baseline.get("python")))
+        regressions = compare(results, baseline["results"], cfg.tolerance)
+        again = argparse.Namespace(**dict(vars(cfg), no_memory=True))
+        for _ in range(cfg.confirm):
+            if not regressions:
+                break
+            print("(running {} again, to rule out noise)".format(", ".join(sorted(regressions))))
+            rerun = dict((name, run_one(func, again)) for name, func in _benchmarks if name in regressions)
+            rerun = dict((name, result) for name, result in rerun.items() if result)
+            regressions = compare(rerun, baseline["results"], cfg.tolerance)
+        for name in sorted(regressions):
+            for line in regressions[name]:
+                print("REGRESSION " + line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
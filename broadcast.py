@@ -0,0 +1,304 @@
+"""
+Send a command to many tabs at once and collect each tab's answer: what
+crt.CommandWindow.Send() does with SendToAllSessions set.
+
+Everything runs in the calling thread: the command is written to every tab (at most limit
+in flight at a time), and one select() loop waits for all of their prompts, feeding each
+tab's output through its Screen (so Get/Get2, the scrollback and logging all see it).  The
+loop uses the selectors module (epoll/kqueue where there is one), so it isn't limited to
+file descriptors below FD_SETSIZE (1024) like select() is; on Python 2 it falls back to
+transport.wait_ready() (poll()).
+
+    result = broadcast(crt.GetTab(i) for i in range(1, crt.GetTabCount() + 1), "show version")
+    for r in result:
+        print(r.host, r.status, r.elapsed, r.output.splitlines()[:1])
+    if not result.ok:
+        print(result.summary())
+
+Each tab's prompt is taken from its screen before sending (the text left of the cursor,
+trailing blanks and all), unless given.  It is only looked for after the echoed command
+line, so prompt text in the command (e.g. the "$" in "$?") doesn't end it early.  A tab
+whose output has one of error_patterns in it has status "error"; with exit_status=True
+(for shells), the command's exit status is fetched as well.
+"""
+import re
+import time
+
+from transport import wait_ready
+
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
+
+MAX_IN_FLIGHT = 64  # tabs with a command outstanding at once
+TIMEOUT = 30  # seconds, for each tab's prompt to come back
+ERROR_PATTERNS = ("% Invalid input", "% Incomplete command", "% Ambiguous command", "% Unknown command")
+
+_RC_MARKER = "__SCRT_RC="
+_RC_RE = re.compile(u"\r?\n?" + _RC_MARKER + u"(\\d+)\r?\n")
+
+
+class TabResult(object):
+    """One tab's answer to a broadcast command.
+
+    status is "ok", "error" (an error pattern showed up, or non-zero exit status), "timeout",
+    "disconnected", or "skipped" (never sent: too many failures already).
+    """
+    def __init__(self, tab, command):
+        self.tab = tab
+        self.index = tab.Index
+        self.host = getattr(tab.Session, "RemoteAddress", None)
+        self.command = command
+        self.output = u""  # what the command printed: no echo, no prompt
+        self.status = "skipped"
+        self.exit_status = None
+        self.error = None
+        self.started = None
+        self.elapsed = None  # seconds from sending the command to seeing the prompt
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def __repr__(self):
+        return "<TabResult tab {} {} {} {}>".format(self.index, self.host, self.status,
+                                                  "" if self.elapsed is None else "{:.3f}s".format(self.elapsed))
+
+
+class BroadcastResult(object):
+    """Every tab's TabResult (in the order the tabs were given), and the overall timing."""
+    def __init__(self, command, results, elapsed):
+        self.command = command
+        self.results = results
+        self.elapsed = elapsed
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, i):
+        return self.results[i]
+
+    @property
+    def ok(self):
+        """True if every tab answered without error."""
+        return all(r.ok for r in self.results)
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def by_host(self):
+        return dict((r.host, r) for r in self.results)
+
+    def summary(self):
+        """Human readable overview: counts, then one line per failed tab."""
+        lines = ["{!r} on {} tab(s) in {:.2f}s: {} ok, {} failed".format(
+            self.command, len(self.results), self.elapsed, len(self.succeeded), len(self.failed))]
+        for r in self.failed:
+            lines.append("  tab {} {}: {}{}".format(r.index, r.host, r.status, ": " + r.error if r.error else ""))
+        return "\n".join(lines)
+
+
+class _Job(object):
+    """A tab's progress through a broadcast."""
+    def __init__(self, tab, command, prompt, timeout, error_patterns, exit_status):
+        self.tab = tab
+        self.screen = tab.Screen
+        self.result = TabResult(tab, command)
+        self.timeout = timeout
+        self.error_patterns = error_patterns
+        self.exit_status = exit_status
+        self.prompts = [prompt] if isinstance(prompt, (type(u""), str)) else prompt
+        line = command + ("; echo {}$?".format(_RC_MARKER) if exit_status else "")
+        self.outgoing = (line + "\r").encode("utf-8")
+        self.echo = []  # the echoed command line
+        self.echoed = False
+        self.captured = []
+        self.echo_scanner = None
+        self.scanner = None
+        self.deadline = None
+
+    def start(self):
+        screen = self.screen
+        screen._poll()
+        if screen._transport is None:
+            self.result.status = "disconnected"
+            return False
+        if self.prompts is None:
+            term = screen._term
+            self.prompts = [term.line(term.cursor_row)[:term.cursor_col].lstrip()]
+        if not all(self.prompts):
+            self.result.status = "error"
+            self.result.error = "couldn't tell the prompt from the screen; pass prompt="
+            return False
+        screen._drain()  # only what the command prints counts
+        self.echo_scanner = screen._scanner([u"\n"], False)
+        self.scanner = screen._scanner(self.prompts, False)
+        self.result.started = time.time()
+        self.deadline = self.result.started + self.timeout
+        return True
+
+    def send_some(self):
+        try:
+            sent = self.screen._transport.write_some(self.outgoing)
+        except (IOError, OSError) as e:
+            self.fail("disconnected", str(e))
+            return
+        self.outgoing = self.outgoing[sent:]
+
+    def take_input(self):
+        """Reads what the tab has sent.  Returns True once the job is finished."""
+        if not self.screen._read_more(0):
+            self.fail("disconnected", "the remote hung up")
+            return True
+        if not self.echoed:
+            if not self.screen._consume(self.echo_scanner, self.echo):
+                return False
+            self.echoed = True
+        index = self.screen._consume(self.scanner, self.captured)
+        if index:
+            self.finish(self.prompts[index - 1])
+            return True
+        return False
+
+    def fail(self, status, error):
+        self.result.status = status
+        self.result.error = error
+        self.result.output = self._output()
+        if self.result.started is not None:
+            self.result.elapsed = time.time() - self.result.started
+
+    def finish(self, prompt):
+        result = self.result
+        result.elapsed = time.time() - result.started
+        output = self._output(prompt)
+        result.status = "ok"
+        if self.exit_status:
+            m = _RC_RE.search(output)
+            if m:
+                result.exit_status = int(m.group(1))
+                output = output[:m.start()] + output[m.end():]
+                if result.exit_status:
+                    result.status = "error"
+                    result.error = "exit status {}".format(result.exit_status)
+        result.output = output
+        for pattern in self.error_patterns or ():
+            if pattern in output:
+                result.status = "error"
+                result.error = [line for line in output.splitlines() if pattern in line][0].strip()
+                break
+
+    def _output(self, prompt=None):
+        """Captured text (after the echoed command line), less the prompt."""
+        if not self.echoed:
+            return u"".join(self.echo)
+        text = u"".join(self.captured)
+        if prompt:
+            text = text[:len(text) - len(prompt)]
+        return text
+
+
+class _Waiter(object):
+    """Waits for the transports of the active jobs, keeping them registered with one
+    selector between waits (only the changes cost a system call)."""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector() if selectors else None
+
+    def wait(self, active, timeout):
+        """Returns the sets of (readable, writable) transports of active, after up to timeout
+        seconds.  Jobs with output still to send are waited on for writing too."""
+        if self.selector is None:
+            readable, writable = wait_ready([job.screen._transport for job in active],
+                                            [job.screen._transport for job in active if job.outgoing], timeout)
+            return set(readable), set(writable)
+        wanted = dict((job.screen._transport, selectors.EVENT_READ | (selectors.EVENT_WRITE if job.outgoing else 0))
+                      for job in active)
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj not in wanted:
+                self.selector.unregister(key.fileobj)
+        for transport, events in wanted.items():
+            try:
+                key = self.selector.get_key(transport)
+            except KeyError:
+                self.selector.register(transport, events)
+            else:
+                if key.events != events:
+                    self.selector.modify(transport, events)
+        readable, writable = set(), set()
+        for key, events in self.selector.select(timeout):
+            if events & selectors.EVENT_READ:
+                readable.add(key.fileobj)
+            if events & selectors.EVENT_WRITE:
+                writable.add(key.fileobj)
+        return readable, writable
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+
+
+def broadcast(tabs, command, prompt=None, timeout=TIMEOUT, limit=MAX_IN_FLIGHT, max_failures=None,
+              error_patterns=ERROR_PATTERNS, exit_status=False):
+    """Sends command (a line; Enter is added) to every tab, and waits for their prompts.
+
+    Args:
+        tabs: fake_scrt Tabs
+        command (str): the command line
+        prompt (str or list): what each tab shows when the command is done; default: what
+            is left of the tab's cursor when the command is sent
+        timeout (float): seconds to wait for each tab's prompt
+        limit (int): at most this many tabs with the command outstanding at once
+        max_failures (int): once this many tabs have failed, tabs not sent to yet are skipped
+        error_patterns (list): text in the output that means the command failed
+        exit_status (bool): (POSIX shells) also fetch the command's exit status, and count
+            non-zero as failure
+    Returns:
+        BroadcastResult
+    """
+    started = time.time()
+    jobs = [_Job(tab, command, prompt, timeout, error_patterns, exit_status) for tab in tabs]
+    waiting = list(jobs)
+    active = []
+    failures = 0
+    waiter = _Waiter()
+    try:
+        while waiting or active:
+            while waiting and (not limit or len(active) < limit):
+                job = waiting.pop(0)
+                if max_failures is not None and failures >= max_failures:
+                    continue  # stays "skipped"
+                if job.start():
+                    active.append(job)
+                else:
+                    failures += 1
+            if not active:
+                continue
+            wait = max(min(job.deadline for job in active) - time.time(), 0)
+            readable, writable = waiter.wait(active, wait)
+            for job in active:
+                if job.screen._transport in writable:
+                    job.send_some()
+            now = time.time()
+            for job in list(active):
+                finished = job.result.status == "disconnected"
+                if not finished and job.screen._transport in readable:
+                    finished = job.take_input()
+                if not finished and now >= job.deadline:
+                    job.fail("timeout", "no prompt ({}) within {}s".format(", ".join(job.prompts), timeout))
+                    finished = True
+                if finished:
+                    active.remove(job)
+                    if not job.result.ok:
+                        failures += 1
+    finally:
+        waiter.close()
+    return BroadcastResult(command, [job.result for job in jobs], time.time() - started)
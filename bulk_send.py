@@ -0,0 +1,252 @@
+"""
+Bulk Send: pasting a long config (thousands of lines) into a session as fast as the device
+takes it, without overrunning its input buffer and losing lines.
+
+    result = crt.Screen.send_lines(open("rtr1-config.txt"), confirm=True)
+    print(result.summary())
+    if not result.ok:
+        for number, line in result.lost:
+            print("lost line {}: {}".format(number, line))
+
+Lines go out in chunks, with a window of lines allowed in flight (sent, but not yet seen
+back).  Each line the device acknowledges opens the window a little (by 1/window, so about
+one more line per window-full), and a lost line, or no feedback for stall_timeout seconds,
+halves it: the AIMD scheme TCP uses, so the rate settles just under what the device can do.
+
+What counts as the device acknowledging a line:
+- confirm=True: its echo.  Each line received is compared with the oldest lines in flight;
+  a line whose echo never came before a later line's did is lost (or garbled).  Other lines
+  received are the device's output, checked for error_patterns.
+- confirm=False: a prompt, so it works with echo off too.  A lost line then only shows up
+  as a stall: the lines in flight at the time are counted as unconfirmed.
+
+The prompt (prompt=) defaults to the one left of the cursor when sending starts, in any
+mode: "rtr1#" also matches "rtr1(config)#" and "rtr1(config-if)#", which the config being
+pasted is bound to go into.  With confirm=True it's stripped off echoes before comparing.
+"""
+import collections
+import io
+import re
+import time
+
+from broadcast import ERROR_PATTERNS
+
+WINDOW = 4  # lines in flight to start with
+MAX_WINDOW = 512
+STALL_TIMEOUT = 2  # seconds without any feedback before the lines in flight are given up on
+QUEUE_SLACK = 0.002  # seconds of round trip above twice the quickest allowed for before easing off
+
+
+class BulkSendResult(object):
+    """How a bulk send went.
+
+    status is "ok", "error" (lines were lost, or the device complained about some), or
+    "disconnected".
+    """
+    def __init__(self):
+        self.status = None
+        self.lines_sent = 0
+        self.lines_confirmed = 0
+        self.lost = []  # (line number, line) for lines whose echo never came (confirm=True)
+        self.unconfirmed = 0  # lines given up on after a stall
+        self.errors = []  # (line number, device output): output matching error_patterns
+        self.stalls = 0
+        self.window = None  # (smallest, largest, last) window, in lines
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    @property
+    def lines_per_second(self):
+        return self.lines_confirmed / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        lines = ["{}: {} line(s) sent, {} confirmed in {:.2f}s ({:.0f} lines/s), window {}-{} (last {:.0f})".format(
+            self.status, self.lines_sent, self.lines_confirmed, self.elapsed, self.lines_per_second,
+            *(int(w) for w in self.window or (0, 0, 0)))]
+        if self.lost:
+            lines.append("  {} lost, first: line {} {!r}".format(len(self.lost), *self.lost[0]))
+        if self.unconfirmed:
+            lines.append("  {} unconfirmed after {} stall(s)".format(self.unconfirmed, self.stalls))
+        for number, text in self.errors[:10]:
+            lines.append("  line {}: {}".format(number, text))
+        if len(self.errors) > 10:
+            lines.append("  ... {} more error(s)".format(len(self.errors) - 10))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<BulkSendResult {} {}/{} lines {:.0f}/s>".format(self.status, self.lines_confirmed, self.lines_sent,
+                                                                  self.lines_per_second)
+
+
+def send_lines(screen, lines, confirm=False, prompt=None, line_end="\r", window=WINDOW, max_window=MAX_WINDOW,
+               stall_timeout=STALL_TIMEOUT, error_patterns=ERROR_PATTERNS):
+    """Sends lines to a connected screen, paced by the device's feedback.  Returns a
+    BulkSendResult.
+
+    Args:
+        screen: the fake_scrt.Screen of a connected session
+        lines: an iterable of lines (e.g. an open file; line ends are stripped), or a string
+        confirm (bool): check each line's echo (see the module docstring)
+        prompt (str, list or compiled regex): what the device prints when it's done with a line
+        line_end (str): sent after each line
+        window (int): lines in flight to start with
+        max_window (int): most lines in flight
+        stall_timeout (float): seconds without feedback before the lines in flight are given up on
+        error_patterns (list): device output that means a line was rejected
+    """
+    result = BulkSendResult()
+    started = time.time()
+    screen._poll()
+    if screen._transport is None:
+        result.status = "disconnected"
+        return result
+    if isinstance(lines, (type(u""), bytes)):
+        lines = lines.splitlines()
+    if prompt is None:
+        term = screen._term
+        prompt = _any_mode(term.line(term.cursor_row)[:term.cursor_col].strip())
+    elif not hasattr(prompt, "search"):
+        prompt = re.compile(u"|".join(re.escape(p) for p in ([prompt] if isinstance(prompt, (type(u""), str))
+                                                             else prompt)))
+    feedback = _Echoes(error_patterns, prompt) if confirm else _Prompts(prompt)
+    screen._drain()
+    source = enumerate((line.rstrip("\r\n") for line in lines), 1)
+    in_flight = feedback.in_flight
+    smallest = largest = window = float(window)
+    heard = time.time()  # when there was last feedback (or a chunk went out)
+    base_rtt = float("inf")  # the quickest a line has come back: the round trip with no queue
+    more = True
+    while more or in_flight:
+        if more and len(in_flight) < int(window):
+            chunk = []
+            now = time.time()
+            for number, line in source:
+                in_flight.append((number, line, now))
+                chunk.append(line + line_end)
+                if len(in_flight) >= int(window):
+                    break
+            else:
+                more = False
+            if chunk:
+                screen.Send(u"".join(chunk))
+                result.lines_sent += len(chunk)
+                heard = time.time()
+            continue
+        if not screen._read_more(max(heard + stall_timeout - time.time(), 0)):
+            result.status = "disconnected"
+            break
+        text = screen._drain()
+        if text:
+            heard = time.time()
+        elif time.time() < heard + stall_timeout:
+            continue
+        else:  # nothing for stall_timeout seconds: those lines aren't coming back
+            result.stalls += 1
+            result.unconfirmed += len(in_flight)
+            in_flight.clear()
+            window = max(window / 2, 1.0)
+            smallest = min(smallest, window)
+            continue
+        confirmed, lost = feedback.feed(text)
+        result.lines_confirmed += len(confirmed)
+        if lost:
+            result.lost.extend(lost)
+            window = max(window / 2, 1.0)
+            smallest = min(smallest, window)
+        for sent_at in confirmed:
+            rtt = heard - sent_at
+            base_rtt = min(base_rtt, rtt)
+            if rtt > 2 * base_rtt + QUEUE_SLACK:  # the device is falling behind: lines are queueing up
+                window = max(window - 1 / window, 1.0)
+            else:
+                window = min(window + 1 / window, max_window)
+        smallest = min(smallest, window)
+        largest = max(largest, window)
+    if feedback.partial:
+        screen._input.appendleft(feedback.partial)  # e.g. the last prompt, for a WaitForString after
+    result.errors = feedback.errors
+    result.window = (smallest, largest, window)
+    if result.status is None:
+        result.status = "error" if result.lost or result.unconfirmed or result.errors else "ok"
+    result.elapsed = time.time() - started
+    return result
+
+
+def send_file(screen, path, encoding="utf-8", **options):
+    """send_lines() with the lines of a file.  Keyword args are as for send_lines()."""
+    with io.open(path, encoding=encoding) as f:
+        return send_lines(screen, f, **options)
+
+
+def _any_mode(prompt):
+    """A regex for prompt in any mode: "rtr1#" -> rtr1, maybe a "(config...)", then > or #."""
+    m = re.match(r"^(.*?)(\([^)]*\))?[>#]$", prompt)
+    if not m or not m.group(1):
+        return re.compile(re.escape(prompt))  # not a "host#" style prompt: take it as it is
+    return re.compile(re.escape(m.group(1)) + r"(\([^)\r\n]*\))?[>#]")
+
+
+class _Echoes(object):
+    """Confirms lines by their echo."""
+    def __init__(self, error_patterns, prompt):
+        self.in_flight = collections.deque()  # (line number, line, time sent)
+        self.error_patterns = error_patterns
+        self.prompt = prompt
+        self.errors = []
+        self.partial = u""
+        self.last = 0  # number of the last line confirmed
+
+    def feed(self, text):
+        """Takes text received.  Returns ([when each line confirmed was sent], [lost (number, line)])."""
+        received = (self.partial + text).split(u"\n")
+        self.partial = received.pop()
+        confirmed = []
+        lost = []
+        in_flight = self.in_flight
+        for line in received:
+            line = line.rstrip(u"\r")
+            m = self.prompt.match(line)
+            echo = line[m.end():] if m else None  # what was typed at a prompt
+            for i, (number, sent, sent_at) in enumerate(in_flight):
+                if echo == sent or (i == 0 and (line.endswith(sent) if sent else not line)):
+                    # only a full echo (prompt and all) can skip lines, so they're really lost
+                    for _ in range(i):
+                        lost.append(in_flight.popleft()[:2])
+                    in_flight.popleft()
+                    self.last = number
+                    confirmed.append(sent_at)
+                    break
+            else:
+                if any(pattern in line for pattern in self.error_patterns):
+                    self.errors.append((self.last, line))
+        return confirmed, lost
+
+
+class _Prompts(object):
+    """Confirms lines by the prompts that follow them."""
+    def __init__(self, prompt):
+        self.in_flight = collections.deque()
+        self.prompt = prompt
+        self.errors = []
+        self.partial = u""  # from the last prompt on (or the last line, if none yet)
+        self._pos = 0  # where in partial to look for the next prompt
+
+    def feed(self, text):
+        confirmed = []
+        text = self.partial + text
+        pos = self._pos
+        start = None
+        while self.in_flight:
+            m = self.prompt.search(text, pos)
+            if not m:
+                break
+            confirmed.append(self.in_flight.popleft()[2])
+            start, pos = m.start(), m.end()
+        if start is None:  # keep the last line: a prompt may be on its way
+            start = min(text.rfind(u"\n") + 1, pos)
+        self.partial = text[start:]
+        self._pos = pos - start
+        return confirmed, []
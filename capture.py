@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+Record a session's byte stream to a capture file, and replay captures into fake_scrt, so
+prompt-handling scripts can be tested against real device transcripts instead of live gear.
+
+Record, by wrapping the transport used for some hosts (e.g. ssh in a pty):
+
+    import capture, transport
+    transport.register("rtr-*", capture.recording(
+        lambda args: transport.PtyTransport(["ssh", args.hostname]), "captures/%H-%Y%M%D-%h%m%s.cap"))
+
+Replay (the file name takes session_log's %H etc. substitutions; see session_log.py):
+
+    transport.register("rtr-*", capture.replaying("captures/%H.cap"))              # as fast as possible
+    transport.register("rtr-*", capture.replaying("captures/%H.cap", speed=1.0))   # real time
+
+Replay is gated on what the script sends: output that was recorded after the Nth line end
+was sent isn't replayed until the script has sent N line ends too, so the script's Send and
+WaitFor* calls line up with the transcript.  What the script sends is kept in
+ReplayTransport.sent.
+
+A capture is memory-mapped and streamed a chunk at a time, so multi-GB captures are fine.
+
+    python capture.py info <capture>   # metadata, duration, bytes each way
+    python capture.py cat <capture>    # write the received bytes to stdout
+
+File format (all little-endian): the magic b"SCRTCAP1", a uint32 length and that many bytes
+of JSON metadata, then records of: uint64 microseconds since the start, uint32 length, uint8
+direction (0: received from the remote, 1: sent to it), and the data.
+"""
+import json
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+
+import session_log
+import transport
+
+MAGIC = b"SCRTCAP1"
+RECEIVED, SENT = 0, 1
+BUFFER_SIZE = 1024 * 1024
+
+_RECORD = struct.Struct("<QIB")
+_LENGTH = struct.Struct("<I")
+_LINE_END_RE = re.compile(b"\r\n?|\n")
+
+
+class CaptureWriter(object):
+    """Writes a capture file.
+
+    Args:
+        path (str): the capture file
+        metadata (dict): saved in the file's header, e.g. {"host": ...}
+    """
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = dict(metadata or (), started=time.time())
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._file = open(path, "wb", BUFFER_SIZE)
+        header = json.dumps(self.metadata).encode("utf-8")
+        self._file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def write(self, direction, data):
+        if not data:
+            return
+        micros = int((time.time() - self._started) * 1e6)
+        with self._lock:
+            self._file.write(_RECORD.pack(micros, len(data), direction))
+            self._file.write(data)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class CaptureReader(object):
+    """Reads a capture file, memory-mapped.
+
+    Args:
+        path (str): the capture file
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(MAGIC) + _LENGTH.size:  # e.g. empty: mmap can't map that
+                raise ValueError("Not a capture file (too short): {}".format(path))
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError("Not a capture file: {}".format(path))
+        length = _LENGTH.unpack_from(self._mm, len(MAGIC))[0]
+        start = len(MAGIC) + _LENGTH.size
+        self.metadata = json.loads(self._mm[start:start + length].decode("utf-8"))
+        self._records_start = start + length
+
+    def records(self):
+        """Yields (seconds since the start, direction, data) for each record.  A record cut
+        short (the recording was interrupted) ends the capture."""
+        mm = self._mm
+        pos = self._records_start
+        end = len(mm)
+        while pos + _RECORD.size <= end:
+            micros, length, direction = _RECORD.unpack_from(mm, pos)
+            pos += _RECORD.size
+            if pos + length > end:
+                return
+            yield micros / 1e6, direction, mm[pos:pos + length]
+            pos += length
+
+    def close(self):
+        self._mm.close()
+
+
+class RecordingTransport(transport.Transport):
+    """Passes everything through to another transport, recording both directions.
+
+    Args:
+        inner (transport.Transport): the real connection
+        path (str): capture file to write
+        metadata (dict): saved in the capture's header
+    """
+    def __init__(self, inner, path, metadata=None):
+        transport.Transport.__init__(self)
+        self.inner = inner
+        self.capture = CaptureWriter(path, metadata)
+
+    def fileno(self):
+        return self.inner.fileno()
+
+    def read(self):
+        data = self.inner.read()
+        if data:
+            self.capture.write(RECEIVED, data)
+        return data
+
+    def write(self, data):
+        self.capture.write(SENT, bytes(data))
+        self.inner.write(data)
+
+    def write_some(self, data):
+        sent = self.inner.write_some(data)
+        self.capture.write(SENT, bytes(data[:sent]))
+        return sent
+
+    def resolve_forward(self, host, port):
+        return self.inner.resolve_forward(host, port)
+
+    def close(self):
+        if self.closed:
+            return
+        transport.Transport.close(self)
+        self.inner.close()
+        self.capture.close()
+
+
+class ReplayTransport(transport.Transport):
+    """Plays a capture back as if it was the remote (see module docstring).
+
+    Args:
+        path (str): capture file
+        speed (float): None for as fast as possible; 1.0 for real time, 2.0 for twice as fast...
+        gate (bool): hold back output recorded after a line end was sent, until the script
+            sends a line end too
+        hangup (bool): hang up at the end of the capture; otherwise the session stays idle
+    """
+    def __init__(self, path, speed=None, gate=True, hangup=False):
+        transport.Transport.__init__(self)
+        self.speed = speed
+        self.gate = gate
+        self.hangup = hangup
+        self.sent = []  # what the script sent
+        self._reader = CaptureReader(path)
+        self.metadata = self._reader.metadata
+        self._records = self._reader.records()
+        self._next = None  # the record read ahead, not replayed yet
+        self._lines_recorded = 0  # line ends sent, in the capture so far
+        self._lines_sent = 0  # line ends the script has sent
+        self._gated_at = None  # capture time of the send we're waiting for the script to match
+        self._clock_base = (time.time(), 0.0)  # (wall time, capture time) that line up
+        self._timer = None
+        self._lock = threading.Lock()
+        self._signal_r, self._signal_w = socket.socketpair()
+        self._signal_r.setblocking(False)
+        self._signal()
+
+    def _signal(self):
+        """Makes fileno() readable."""
+        try:
+            self._signal_w.send(b"x")
+        except socket.error:
+            pass
+
+    def fileno(self):
+        return self._signal_r.fileno()
+
+    def read(self):
+        if self.closed:
+            return None
+        try:
+            self._signal_r.recv(65536)
+        except socket.error:
+            pass
+        with self._lock:
+            data, more = self._take(transport._READ_SIZE)
+        if more:
+            self._signal()  # stopped at the size limit: there's more to read now
+        if data is None:  # end of the capture
+            if self.hangup:
+                self.closed = True
+                return None
+            return b""
+        return data
+
+    def _take(self, limit):
+        """Collects up to limit bytes of received data that are due.  Returns (data, more),
+        with data None at the end of the capture."""
+        out = []
+        size = 0
+        while size < limit:
+            if self._next is None:
+                self._next = next(self._records, None)
+                if self._next is None:
+                    return (b"".join(out) if out else None), False
+            at, direction, data = self._next
+            if direction == SENT:
+                self._lines_recorded += len(_LINE_END_RE.findall(data))
+                self._next = None
+                continue
+            if self.gate and self._lines_sent < self._lines_recorded:
+                if self._gated_at is None:
+                    self._gated_at = at
+                break
+            if self.speed and not self._due(at):
+                break
+            out.append(data)
+            size += len(data)
+            self._next = None
+        return b"".join(out), size >= limit
+
+    def _due(self, at):
+        """True if the record at capture time at should be replayed by now; if not, sets a
+        timer to signal when it is."""
+        wall, captured = self._clock_base
+        delay = wall + (at - captured) / self.speed - time.time()
+        if delay <= 0:
+            return True
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Timer(delay, self._signal)
+            self._timer.daemon = True
+            self._timer.start()
+        return False
+
+    def write(self, data):
+        data = bytes(data)
+        self.sent.append(data)
+        with self._lock:
+            self._lines_sent += len(_LINE_END_RE.findall(data))
+            if self._gated_at is None or self._lines_sent < self._lines_recorded:
+                return
+            # the script caught up: replay what follows, timed from now
+            self._clock_base = (time.time(), self._gated_at)
+            self._gated_at = None
+        self._signal()
+
+    def close(self):
+        if self._signal_r is None:
+            return
+        transport.Transport.close(self)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._signal_r.close()
+        self._signal_w.close()
+        self._signal_r = None
+        self._records = iter(())
+        self._reader.close()
+
+
+def recording(factory, path_template):
+    """Wraps a transport factory (see transport.register) so each connection is recorded to
+    path_template, after %H etc. substitution (see session_log.expand_filename)."""
+    def open_recording(args):
+        fields = {"host": args.hostname, "port": args.port, "username": args.username,
+                  "session": args.session or args.hostname}
+        path = session_log.expand_filename(path_template, fields)
+        return RecordingTransport(factory(args), path, {"host": args.hostname, "port": args.port})
+    return open_recording
+
+
+def replaying(path_template, speed=None, gate=True, hangup=False):
+    """A transport factory (see transport.register) that replays the capture at
+    path_template, after %H etc. substitution.  Other args are as for ReplayTransport."""
+    def open_replay(args):
+        fields = {"host": args.hostname, "port": args.port, "username": args.username,
+                  "session": args.session or args.hostname}
+        return ReplayTransport(session_log.expand_filename(path_template, fields), speed, gate, hangup)
+    return open_replay
+
+
+def main(argv):
+    if len(argv) != 3 or argv[1] not in ("info", "cat"):
+        print(__doc__.split("\n\n")[-2])
+        return 2
+    reader = CaptureReader(argv[2])
+    try:
+        if argv[1] == "cat":
+            out = getattr(sys.stdout, "buffer", sys.stdout)
+            for _, direction, data in reader.records():
+                if direction == RECEIVED:
+                    out.write(data)
+            return 0
+        totals = {RECEIVED: 0, SENT: 0}
+        count = duration = 0
+        for at, direction, data in reader.records():
+            totals[direction] += len(data)
+            count += 1
+            duration = at
+        print(json.dumps(reader.metadata, sort_keys=True))
+        print("{} records over {:.3f}s: {} bytes received, {} bytes sent".format(
+            count, duration, totals[RECEIVED], totals[SENT]))
+        return 0
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -3,11 +3,18 @@
 """
 SecureCRT script to establish an SSH connection, with a local SSH proxy listening on a random port.
 """
+import collections
+import csv
 import os
-import shlex
-import subprocess
+import sys
+import time
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, this_dir)  # SecureCRT doesn't put the script's directory on the path
+
+import inventory
+from find_localport import PortAllocator, is_bound
+from forward_registry import ForwardRegistry
 
 # Detect if this script is being run by SecureCRT Python.  If not, then try to load my
 # hacky mock SecureCRT "API", so that my PyCharm/iPython/IDE can help me w/ docstrings
@@ -20,46 +27,142 @@ except (AssertionError, ImportError):
     pass
 
 
-def run_shell(cmd):
-    """Run a shell command, and return the output."""
-    try:
-        cmd_list = shlex.split(cmd)
-        output = subprocess.check_output(cmd_list, stderr=subprocess.STDOUT)
-        return output
-    except Exception as e:
-        crt.Dialog.MessageBox("ERROR: {}\nCommand list: {}".format(e, cmd_list))
-        raise
-
+# batch mode (an inventory file instead of a hostname) settings
+MAX_IN_FLIGHT = 10  # tabs connecting at the same time
+CONNECT_TIMEOUT = 30  # seconds, unless the inventory gives the host its own timeout
+POLL_MS = 100
+DEFAULT_FORWARD = ("127.0.0.1", 80)  # remote end of the /LOCAL forward, if the inventory has none
 
-def main():
-    cwd = os.getcwd()
-    os.chdir(this_dir)
-    l_lport = run_shell("python find_localport.py")
-    os.chdir(cwd)
 
-    crt.Screen.Synchronous = True
-    hostname = crt.Dialog.Prompt("Enter Hostname:")
-    # ssh_user = crt.Dialog.Prompt("Enter User:")
-    # ssh_pw = crt.Dialog.Prompt("Enter Password:", isPassword=True)
-    # l_lport = get_random_lport()
+def build_cmdline(hostname, forwards, username=None):
+    """SecureCRT command line for hostname, with forwards [(local port, remote host, remote port)]."""
     cmdline_opts = [
         # "/S {}".format(session_name)  # name of SecureCRT session to use
         # "/T"  # open specified session (/S) in a separate tab
         "/SSH2",  # open the default session w/ SSH2 protocol
-        "/LOCAL {}:127.0.0.1:80".format(l_lport),  # proxy <local port> to <remote host>:<remote port>
         # "/REMOTE {}:{}:{}".format(r_rport, r_lhost, r_lport),  # proxy <remote port> to <local host>:<local port>
         # "/I {}".format(ssh_key_file),  # use SSH private key file for authentication
-        # "/L {}".format(ssh_user),  # SSH username
         # "/PASSWORD {}".format(ssh_pw),  # SSH password
         "/ACCEPTHOSTKEYS",  # auto-accept remote SSH host key
         # "/FORWARDX11PACKETS",  # enable X11 forawrding
     ]
-    cmd = " ".join(cmdline_opts + [hostname])
-    # crt.Dialog.MessageBox("\n".join(cmdline_opts))
-    tab = crt.Session.ConnectInTab(cmd)
+    for forward in forwards:
+        cmdline_opts.append("/LOCAL {}:{}:{}".format(*forward))  # proxy <local port> to <remote host>:<remote port>
+    if username:
+        cmdline_opts.append("/L {}".format(username))  # SSH username
+    return " ".join(cmdline_opts + [hostname])
+
 
-    # save local proxy port in tab caption (seems like the best/only place to save per-session info)
+def connect_host(hostname):
+    ports = PortAllocator()
+    l_lport = ports.reserve()[0]  # held (and leased) until the forward is up
+    # ssh_user = crt.Dialog.Prompt("Enter User:")
+    # ssh_pw = crt.Dialog.Prompt("Enter Password:", isPassword=True)
+    cmd = build_cmdline(hostname, [(l_lport,) + DEFAULT_FORWARD])
+    ports.handoff(l_lport)  # let go of the port at the last moment, so SecureCRT can bind it
+    tab = crt.Session.ConnectInTab(cmd)
+    # also show the local proxy port in the tab caption, for humans (openThruProxy.py finds the
+    # tab's forward in the registry by its index and caption)
     tab.Caption = "{} {}".format(hostname, l_lport)  # e.g. "myserver.example.com 53879"
+    if ports.confirm(l_lport, hostname):
+        ForwardRegistry().add(l_lport, hostname, *DEFAULT_FORWARD, tab_index=tab.Index, caption=tab.Caption)
+    else:
+        crt.Dialog.MessageBox("Local proxy port {} for {} never started listening.".format(l_lport, hostname))
+
+
+def connect_inventory(path):
+    """Opens a tab for every host in an inventory file (see inventory.py), MAX_IN_FLIGHT at
+    a time, then reports how long each one took to connect."""
+    hosts = inventory.load(path)
+    for host in hosts:
+        host.forwards = host.forwards or [DEFAULT_FORWARD]
+    ports = PortAllocator()
+    registry = ForwardRegistry()
+    lports = iter(ports.reserve(sum(len(host.forwards) for host in hosts)))  # one batch for everything
+    results = []  # (host, local ports, status, seconds to connect)
+    pending = collections.deque(hosts)
+    connecting = []
+    started_all = time.time()
+    while pending or connecting:
+        while pending and len(connecting) < MAX_IN_FLIGHT:
+            host = pending.popleft()
+            forwards = [(next(lports), r_host, r_port) for r_host, r_port in host.forwards]
+            l_lports = [forward[0] for forward in forwards]
+            for l_lport in l_lports:
+                ports.handoff(l_lport)
+            started = time.time()
+            try:
+                # don't wait for auth, so the other tabs can connect meanwhile
+                tab = crt.Session.ConnectInTab(build_cmdline(host.name, forwards, host.username), False, True)
+            except Exception as e:
+                results.append((host, l_lports, "error: {}".format(e), None))
+                for l_lport in l_lports:
+                    ports.free(l_lport)
+                continue
+            tab.Caption = host.caption or "{} {}".format(host.name, l_lports[0])
+            connecting.append((host, forwards, tab, started))
+
+        still_connecting = []
+        for host, forwards, tab, started in connecting:
+            l_lports = [forward[0] for forward in forwards]
+            if tab.Session.Connected and all(is_bound(l_lport) for l_lport in l_lports):
+                lost = []
+                for l_lport, r_host, r_port in forwards:
+                    if ports.confirm(l_lport, host.name, timeout=0):
+                        registry.add(l_lport, host.name, r_host, r_port, tab.Index, tab.Caption)
+                    else:  # closed again (its lease is dropped)
+                        lost.append(str(l_lport))
+                if lost:
+                    results.append((host, l_lports, "forward lost: {}".format(" ".join(lost)), None))
+                else:
+                    results.append((host, l_lports, "ok", time.time() - started))
+            elif time.time() - started > (host.timeout or CONNECT_TIMEOUT):
+                results.append((host, l_lports, "timeout", None))
+                tab.Close()
+                for l_lport in l_lports:
+                    ports.free(l_lport)
+            else:
+                still_connecting.append((host, forwards, tab, started))
+        connecting = still_connecting
+        if connecting:
+            crt.Sleep(POLL_MS)
+    report_batch(path, results, time.time() - started_all)
+
+
+def report_batch(path, results, elapsed):
+    """Writes a per-host report next to the inventory file, and shows a summary."""
+    report_path = os.path.splitext(path)[0] + "-report.csv"
+    with open(report_path, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["host", "status", "connect_seconds", "local_ports"])
+        for host, l_lports, status, seconds in results:
+            writer.writerow([host.name, status, "" if seconds is None else "{:.3f}".format(seconds),
+                             " ".join(str(p) for p in l_lports)])
+
+    times = sorted(seconds for _, _, status, seconds in results if status == "ok")
+    failed = ["{} ({})".format(host.name, status) for host, _, status, _ in results if status != "ok"]
+    lines = ["Connected {}/{} hosts in {:.1f}s".format(len(times), len(results), elapsed)]
+    if times:
+        lines.append("connect time: median {:.2f}s, slowest {:.2f}s".format(times[len(times) // 2], times[-1]))
+    if failed:
+        lines.append("Failed: " + ", ".join(failed[:20]) + (" ..." if len(failed) > 20 else ""))
+    lines.append("Report: " + report_path)
+    crt.Dialog.MessageBox("\n".join(lines), "connect.py")
+
+
+def main():
+    crt.Screen.Synchronous = True
+    # a hostname, or the path to an inventory file (also accepted as a SecureCRT /ARG)
+    if crt.Arguments.Count:
+        target = crt.Arguments.GetArg(0)
+    else:
+        target = crt.Dialog.Prompt("Enter Hostname (or inventory file):")
+    if not target:
+        return
+    if os.path.isfile(target):
+        connect_inventory(target)
+    else:
+        connect_host(target)
 
 
 main()
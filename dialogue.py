@@ -0,0 +1,224 @@
+"""
+Expect-style dialogues: the WaitForStrings/Send ladders scripts keep writing (log in, enable,
+answer "--More--"...), declared once as a state machine and run in one call.
+
+    LOGIN = dialogue.compile({
+        "start": [
+            ("Username: ", "{username}\\r"),
+            ("Password: ", "{password}\\r"),
+            ("% Authentication failed", None, "fail"),
+            (">", "enable\\r", "enable"),
+            ("#", None, "done"),
+        ],
+        "enable": {"timeout": 5, "expect": [
+            ("Password: ", "{secret}\\r"),
+            ("% Access denied", None, "fail"),
+            ("#", None, "done"),
+        ]},
+    })
+    result = LOGIN.run(tab.Screen, username="admin", password="...", secret="...")
+    if not result.ok:
+        print(result.status, result.error)
+
+    PAGED = dialogue.compile({"start": [("--More--", " "), ("#", None, "done")]})
+    config = PAGED.run(tab.Screen, send="show running-config\\r").output
+
+Each state is a list of rules, (string, response, next state), tried together: one streaming
+match (stream_match.py) over the session's input finds whichever string shows up first,
+like WaitForStrings.  The response is sent (a str, with the run's keyword arguments, if
+any, filled in by str.format; or callable(result) -> str; None sends nothing), then the
+dialogue moves to the next state: left out or None stays in the same state, "done" ends
+it, "fail" ends it as a failure.  A state can also be a dict with the rules under
+"expect", a "timeout" in seconds, and "on_timeout": what to do then, (response, next
+state) or just a next state (default: the dialogue ends with status "timeout").
+
+compile() caches its result by spec, and states share stream_match's automaton cache, so
+running the same dialogue on any number of tabs compiles it once.
+"""
+import time
+
+from stream_match import compile_strings
+
+DONE = "done"
+FAIL = "fail"
+LIMIT = 10000  # responses in one run: a dialogue going round in circles stops there
+
+_CACHE_SIZE = 256
+_cache = dict()
+
+
+class DialogueResult(object):
+    """How a run went.
+
+    status is "done", "failed" (a rule said "fail"), "timeout", "disconnected", or "limit"
+    (it sent LIMIT responses without getting anywhere).
+    """
+    def __init__(self, state, variables):
+        self.state = state  # the state the dialogue is in (ended in)
+        self.variables = variables
+        self.status = None
+        self.error = None
+        self.output = u""  # all the text consumed, minus the strings the rules matched
+        self.transcript = []  # (state, string matched or None on timeout, response sent)
+        self.elapsed = None
+
+    @property
+    def ok(self):
+        return self.status == DONE
+
+    def __repr__(self):
+        return "<DialogueResult {} in state {} after {} step(s)>".format(self.status, self.state,
+                                                                          len(self.transcript))
+
+
+class _Rule(object):
+    __slots__ = ("string", "response", "target")
+
+    def __init__(self, string, response=None, target=None):
+        self.string = string
+        self.response = response
+        self.target = target
+
+
+class _State(object):
+    def __init__(self, name, spec, ignore_case):
+        if isinstance(spec, dict):
+            rules, self.timeout, on_timeout = spec.get("expect", ()), spec.get("timeout"), spec.get("on_timeout")
+        else:
+            rules, self.timeout, on_timeout = spec, None, None
+        self.name = name
+        self.rules = [_Rule(*rule) if isinstance(rule, (tuple, list)) else _Rule(rule) for rule in rules]
+        if not self.rules and not self.timeout:
+            raise ValueError("state {!r} has nothing to wait for".format(name))
+        if isinstance(on_timeout, (tuple, list)):
+            self.on_timeout = _Rule(None, *on_timeout)
+        else:
+            self.on_timeout = None if on_timeout is None else _Rule(None, None, on_timeout)
+        self.strings = [rule.string for rule in self.rules]
+        self.automaton = compile_strings(self.strings, ignore_case)
+
+
+class Dialogue(object):
+    """A compiled dialogue (see compile()).
+
+    Args:
+        states (dict): state name -> rules, or a dict with "expect", "timeout", "on_timeout"
+        start (str): the state to start in
+        timeout (float): seconds for the whole dialogue (None: no limit)
+        ignore_case (bool): case-insensitive matching
+    """
+    def __init__(self, states, start="start", timeout=None, ignore_case=False):
+        self.start = start
+        self.timeout = timeout
+        self.states = dict((name, _State(name, spec, ignore_case)) for name, spec in states.items())
+        if start not in self.states:
+            raise ValueError("no start state {!r}".format(start))
+        for state in self.states.values():
+            for rule in state.rules + [state.on_timeout]:
+                if rule is not None and rule.target not in self.states and rule.target not in (None, DONE, FAIL):
+                    raise ValueError("state {!r} goes to unknown state {!r}".format(state.name, rule.target))
+
+    def run(self, screen, send=None, timeout=None, **variables):
+        """Runs the dialogue on a screen (crt.Screen, or a tab's).  Returns a DialogueResult.
+
+        Args:
+            screen: the fake_scrt.Screen of a connected session
+            send (str): sent first, e.g. the command whose output the dialogue pages through
+            timeout (float): seconds for the whole dialogue (default: the dialogue's)
+            variables: filled into the responses
+        """
+        result = DialogueResult(self.start, variables)
+        started = time.time()
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = started + timeout if timeout else None
+        screen._poll()
+        if screen._transport is None:
+            result.status = "disconnected"
+            result.error = "not connected"
+            return result
+        if send:
+            screen.Send(send.format(**variables) if variables else send)
+        state = self.states[self.start]
+        output = []
+        while result.status is None:
+            rule = self._step(screen, state, deadline, result, output)
+            if rule is None:
+                break
+            response = rule.response
+            if callable(response):
+                response = response(result)
+            elif response and variables:
+                response = response.format(**variables)
+            if response:
+                screen.Send(response)
+            result.transcript.append((state.name, rule.string, response))
+            if rule.target == DONE:
+                result.status = DONE
+            elif rule.target == FAIL:
+                result.status = "failed"
+                result.error = "{!r} in state {!r}".format(rule.string, state.name)
+            elif len(result.transcript) >= LIMIT:
+                result.status = "limit"
+            elif rule.target is not None:
+                state = self.states[rule.target]
+                result.state = state.name
+        result.output = u"".join(output)
+        result.elapsed = time.time() - started
+        return result
+
+    @staticmethod
+    def _step(screen, state, deadline, result, output):
+        """Waits in a state for one of its strings.  Returns the rule that matched (or the
+        on_timeout one), or None with result.status set."""
+        automaton = state.automaton
+        if screen._ignorecase and not automaton.ignore_case:
+            automaton = compile_strings(state.strings, True)
+        scanner = automaton.scanner()
+        if state.timeout:
+            state_deadline = time.time() + state.timeout
+            deadline = state_deadline if deadline is None else min(deadline, state_deadline)
+        captured = []
+        index = screen._consume(scanner, captured)
+        while not index:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                output.extend(captured)
+                if state.on_timeout is not None and state.timeout and time.time() >= state_deadline:
+                    return state.on_timeout
+                result.status = "timeout"
+                return None
+            if not screen._read_more(remaining):
+                output.extend(captured)
+                result.status = "disconnected"
+                return None
+            index = screen._consume(scanner, captured)
+        rule = state.rules[index - 1]
+        text = u"".join(captured)
+        output.append(text[:len(text) - len(rule.string)])
+        return rule
+
+
+def compile(spec, start="start", timeout=None, ignore_case=False):
+    """Returns the (cached) Dialogue for spec: {state name: rules} (see the module docstring).
+    A Dialogue is returned as is."""
+    if isinstance(spec, Dialogue):
+        return spec
+    try:
+        key = (_freeze(spec), start, timeout, bool(ignore_case))
+        dialogue = _cache.get(key)
+    except TypeError:  # something unhashable in it: no caching
+        return Dialogue(spec, start, timeout, ignore_case)
+    if dialogue is None:
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        dialogue = _cache[key] = Dialogue(spec, start, timeout, ignore_case)
+    return dialogue
+
+
+def _freeze(spec):
+    """A hashable copy of a spec."""
+    if isinstance(spec, dict):
+        return tuple(sorted((key, _freeze(value)) for key, value in spec.items()))
+    if isinstance(spec, (tuple, list)):
+        return tuple(_freeze(value) for value in spec)
+    return spec
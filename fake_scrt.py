@@ -3,7 +3,8 @@ A skeleton/mock-up of the SecureCRT API, so you can write SecureCRT Python scrip
 logic in an IDE, without having to actually install SecureCRT.
 
 How to use:
-1. copy to the directory w/ your SecureCRT scripts
+1. copy to the directory w/ your SecureCRT scripts (with transport.py, stream_match.py,
+   vt100.py and scrollback.py, which it needs)
 2. In your scripts that make 'crt' calls, do this at the top, just after imports:
 
 # load fake SecureCRT API when not actually running in SecureCRT
@@ -12,10 +13,49 @@ if "crt" not in globals():
     crt = SecureCRT()
 
 """
+import codecs
+import collections
 import os
-import random
+import re
+import sys
+import tempfile
 import time
 
+import transport
+from stream_match import compile_strings
+from transport import wait_ready
+from vt100 import Terminal
+
+# The mock extensions' modules (bulk_send, dialogue, kermit, session_db...) are imported where
+# they're used, so this file still works copied next to your scripts with just the modules
+# every Screen needs: transport.py, stream_match.py, vt100.py and scrollback.py.
+
+
+# every open Tab, in tab bar order (a tab's Index is its position + 1)
+_tabs = []
+_active_tab = None  # the tab selected in the GUI
+
+
+def _string_list(strings):
+    """WaitForStrings/ReadString also accept a single string."""
+    if isinstance(strings, (type(u""), bytes)):
+        return [strings]
+    return list(strings)
+
+
+class _Lazy(object):
+    """A class attribute made on first use, from module.factory(): for the mock extensions
+    that need another module."""
+    def __init__(self, name, module, factory):
+        self.name = name
+        self.module = module
+        self.factory = factory
+
+    def __get__(self, obj, owner):
+        value = getattr(__import__(self.module), self.factory)()
+        setattr(owner, self.name, value)  # from now on, a plain class attribute
+        return value
+
 
 class Container(object):
     """Just a dummy container class."""
@@ -24,60 +64,190 @@ class Container(object):
 
 
 class SessionConfig(object):
-    def __init__(self):
-        self._options = dict()
+    """A session's configuration.  The mock reads a saved session's options from its file (see
+    session_db.py) when first asked for one, and Save() writes them back.
+
+    Args:
+        path (str): the session's path, e.g. "lab/rtr1"; None: options in memory only
+        database (session_db.SessionDatabase): where the session is saved
+    """
+    def __init__(self, path=None, database=None):
+        self._path = path
+        self._database = database
+        self._loaded = None  # {name: (type, value)}, once read
+
+    @property
+    def _options(self):
+        if self._loaded is None:
+            self._loaded = self._database.load(self._path) if self._database else collections.OrderedDict()
+        return self._loaded
 
     def ConnectInTab(self):
-        return Tab()
+        """Connects to this session in a new tab, and returns the Tab."""
+        if self._path is None or self._database is None:
+            return Tab()
+        return SecureCRT.Session.ConnectInTab('/S "{}"'.format(self._path))
 
     def GetOption(self, opt_name):
         """Gets the value of the specified option."""
-        return self._options.get(opt_name, '')
-
-    def Save(self):
+        kind, value = self._options.get(opt_name, (None, ''))
+        return list(value) if kind == "Z" else value
+
+    def Save(self, session_path=None):
+        """Saves the configuration, to session_path if given (a new session, or another one).
+        (The mock writes saved sessions in batches: see session_db.py.)"""
+        path = session_path or self._path
+        if self._database is None or path is None:
+            return True
+        options = self._options
+        self._database.save(path, collections.OrderedDict(
+            (name, (kind, list(value) if kind == "Z" else value)) for name, (kind, value) in options.items()))
         return True
 
     def SetOption(self, opt_name, opt_value):
-        option = {opt_name, opt_value}
-        self._options.update(option)
-        return option
+        """Sets the specified option.  A new option's type is taken from the value: a number,
+        a list (of strings), a bytearray, or a string."""
+        import session_db
+        kind = self._options.get(opt_name, (session_db.option_type(opt_value), None))[0]
+        self._options[opt_name] = (kind, session_db.convert(kind, opt_value))
+        return opt_value
 
 
-class Screen:
+class Screen(object):
     """The Screen object provides access to SecureCRT's terminal screen."""
     MatchIndex = 1
     Selection = "Selection"
     Synchronous = True
     #
-    Columns = 80
-    Rows = 24
-    CurrentColumn = 1
-    CurrentRow = 1
-    #
     _ignorecase = False
 
-    def __init__(self):
-        pass
+    def __init__(self, rows=24, columns=80):
+        # VT100 model of what's on screen (see vt100.py), so Get/Get2 return real text
+        self._term = Terminal(rows, columns)
+        # mock extension: lines that scrolled off the top of the screen (see scrollback.py)
+        from scrollback import Scrollback
+        self.scrollback = Scrollback()
+        self._term.on_scroll = self.scrollback.add
+        # data received from the remote, not yet consumed by a WaitFor*/ReadString call
+        self._input = collections.deque()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._transport = None  # a transport.Transport, once the session is connected
+        self._log = None  # a session_log.SessionLog, while logging
+        self.MatchIndex = 0
+
+    @property
+    def Columns(self):
+        """Number of columns on the screen."""
+        self._poll()
+        return self._term.columns
+
+    @property
+    def Rows(self):
+        """Number of rows on the screen."""
+        self._poll()
+        return self._term.rows
+
+    @property
+    def CurrentColumn(self):
+        """Column the cursor is in (first column is 1)."""
+        self._poll()
+        return self._term.cursor_col + 1
+
+    @property
+    def CurrentRow(self):
+        """Row the cursor is in (first row is 1)."""
+        self._poll()
+        return self._term.cursor_row + 1
 
     def Clear(self):
-        msg = "Screen cleared."
-        print msg
-        return msg
+        """Clears the screen."""
+        self._term.clear()
+        return "Screen cleared."
 
     def Get(self, row1, col1, row2, col2):
         """Returns a string of characters read for a portion of the screen. Returns a string containing
         the characters on the screen rectangle defined by the numeric values row1,col1 (upper-left)
         and row2,col2 (lower-right)."""
-        msg = "Got text within coordinates: {} {} {} {}".format(row1, col1, row2, col2)
-        print msg
-        return msg
+        self._poll()
+        return self._term.get(row1, col1, row2, col2)
 
     def Get2(self, row1, col1, row2, col2):
-        """Returns the characters on each row requested with a \n, so the rows can be split by looking
-        for \n. This allows the rows to be different lengths as required by the contents of the rows."""
-        msg = "Got text within coordinates: {} {} {} {}".format(row1, col1, row2, col2)
-        print msg
-        return msg
+        """Returns the characters on each row requested with a \r\n, so the rows can be split by looking
+        for \r\n. This allows the rows to be different lengths as required by the contents of the rows."""
+        self._poll()
+        return self._term.get2(row1, col1, row2, col2)
+
+    def search(self, text, last=None, since=None, regex=False, ignore_case=False):
+        """Mock extension: finds lines in the scrollback and on the screen (down to the cursor's
+        row) that contain text, or match it as a regular expression if regex.  Returns
+        [(line number, line)], oldest first.  Screen row r is line scrollback.total + r, so
+        line numbers stay the same as lines scroll off.
+
+        Args:
+            text (str): what to look for
+            last (int): only look in the last this many lines
+            since (int): only look in lines from this line number on
+            regex (bool): text is a regular expression
+            ignore_case (bool): case-insensitive
+        """
+        self._poll()
+        history = self.scrollback
+        rows = self._term.cursor_row + 1
+        history_last = None if last is None else max(last - rows, 0)
+        if history_last == 0:
+            found = []
+        elif regex:
+            found = history.search(text, history_last, since, ignore_case)
+        else:
+            found = history.find(text, history_last, since, ignore_case)
+        first_row = 0 if last is None else max(rows - last, 0)
+        if since is not None:
+            first_row = max(first_row, since - history.total - 1)
+        flags = re.IGNORECASE if ignore_case else 0
+        pattern = re.compile(text if regex else re.escape(text), flags)
+        for row in range(first_row, rows):
+            line = self._term.line(row).rstrip(u" ")
+            if pattern.search(line):
+                found.append((history.total + row + 1, line))
+        return found
+
+    def dialogue(self, spec, send=None, timeout=None, **variables):
+        """Mock extension: runs an expect-style dialogue (see dialogue.py) on this screen, e.g.
+        logging in, or paging through a command's output.  Returns a dialogue.DialogueResult.
+
+        Args:
+            spec: {state: rules}, or a dialogue.Dialogue (compiled specs are cached anyway)
+            send (str): sent first
+            timeout (float): seconds for the whole dialogue
+            variables: filled into the responses
+        """
+        from dialogue import compile as compile_dialogue
+        return compile_dialogue(spec).run(self, send, timeout, **variables)
+
+    def send_lines(self, lines, **options):
+        """Mock extension: sends many lines (e.g. a config) as fast as the remote takes them,
+        paced by its echo or prompts (see bulk_send.py).  Returns a bulk_send.BulkSendResult.
+
+        Args:
+            lines: an iterable of lines (e.g. an open file), or a string
+            options: as for bulk_send.send_lines(), e.g. confirm=True to check every line's echo
+        """
+        import bulk_send
+        return bulk_send.send_lines(self, lines, **options)
+
+    def read_records(self, template, send=None, prompt=None, timeout=30):
+        """Mock extension: parses what the remote sends, up to the prompt, with a TextFSM-style
+        template (see template_parser.py), yielding each record (a tuple) as soon as its lines
+        have arrived, instead of collecting the whole output first.
+
+        Args:
+            template: a template_parser.Template, or a template's text (compiled ones are cached)
+            send (str): sent first, e.g. "show ip route\r"
+            prompt (str): what ends the output (default: the text left of the cursor now)
+            timeout (float): seconds to wait for the prompt
+        """
+        import template_parser
+        return template_parser.read_records(self, template, send, prompt, timeout)
 
     def IgnoreCase(self, boolean):
         """Provides a global method to set case insensitivity. In addition, case insensitivity can be
@@ -87,7 +257,7 @@ class Screen:
     def Print(self):
         """Prints the screen. If no printer is defined on your machine, an error will be returned."""
         msg = "Print Screen."
-        print msg
+        print(msg)
         return msg
 
     def ReadString(self, string_array=(), timeout_seconds=0, case_insensitive=False):
@@ -98,13 +268,14 @@ class Screen:
             timeout_seconds (int): how long to wait
             case_insensitive (bool): Enable case-insensitive match
         """
-        msg = "\n".join([
-            "ReadString",
-            "strings: {}".format(string_array),
-            "timeout: {}".format(timeout_seconds),
-            "case_insensitive: {}".format(case_insensitive)])
-        print msg
-        return msg
+        string_array = _string_list(string_array)
+        if not string_array:
+            # no strings: just return whatever has arrived (waiting for something, if need be)
+            if not self._input:
+                self._read_more(timeout_seconds or None)
+            return self._drain()
+        index, captured = self._wait_for(string_array, timeout_seconds, case_insensitive, capture=True)
+        return self._captured_text(string_array, index, captured)
 
     def Send(self, string="Send String", send_to_screen_only=False):
         """Sends a string of characters. Attempting to send a string while no connection is open returns an error.
@@ -113,11 +284,17 @@ class Screen:
             string (str): Text to send
             send_to_screen_only (bool): If True, send only to local screen, and not to remote.
         """
+        if send_to_screen_only:
+            self._term.feed(string)
+            return string
+        if self._transport is not None:
+            self._transport.write(string.encode("utf-8") if not isinstance(string, bytes) else string)
+            return string
         msg = "\n".join([
             "Send",
             "string: {}".format(string),
             "send_to_screen_only: {}\n".format(send_to_screen_only)])
-        print msg
+        print(msg)
         return msg
 
     def SendKeys(self):
@@ -130,7 +307,7 @@ class Screen:
         Editor and clicking on the Map Selected Key... button).
         e.g. "MENU_PASTE", "TN_BREAK", "VT_PF1" """
         msg = "SendSpecial: {}".format(string)
-        print msg
+        print(msg)
         return msg
 
     def WaitForCursor(self, timeout=0):
@@ -161,9 +338,7 @@ class Screen:
             timeout (int): number of seconds to wait for a string
             case_insensitive (bool): Enable case-insensitive match
         """
-        if timeout > 0:
-            return True
-        return False
+        return self._wait_for([string], timeout, case_insensitive)[0] == 1
 
     def WaitForStrings(self, string_array=(), timeout=0, case_insensitive=False):
         """Wait for one of several strings to appear in the input. If any are seen, returns
@@ -175,54 +350,197 @@ class Screen:
             timeout (int): number of seconds to wait for a string
             case_insensitive (bool): Enable case-insensitive match
         """
-        if timeout > 0:
-            return 1
+        return self._wait_for(_string_list(string_array), timeout, case_insensitive)[0]
+
+    #####
+    # mock internals: incoming data, and the matching behind WaitForString(s)/ReadString
+
+    def _receive(self, data):
+        """Handles data received from the remote: it goes to the screen, and is queued
+        for the next WaitForString(s)/ReadString."""
+        if self._log is not None:
+            self._log.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        if data:
+            self._term.feed(data)
+            self._input.append(data)
+
+    def _read_more(self, timeout):
+        """Waits up to timeout seconds (None: forever) for more data from the remote, passing
+        it to _receive().  Returns False if nothing more can arrive."""
+        conn = self._transport
+        if conn is None:
+            return False
+        readable, _ = wait_ready([conn], (), timeout)
+        if readable:
+            data = conn.read()
+            if data is None:
+                self._hangup()
+                return False
+            self._receive(data)
+        return True
+
+    def _poll(self):
+        """Takes in whatever the remote has sent, without waiting."""
+        while self._transport is not None and wait_ready([self._transport], (), 0)[0]:
+            if not self._read_more(0):
+                break
+
+    def _attach(self, conn):
+        """Connects the screen to a transport (see transport.py)."""
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = conn
+
+    def _hangup(self):
+        """The remote went away (or we disconnected)."""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def _wait_for(self, strings, timeout, case_insensitive, capture=False):
+        """Consumes input until one of strings is seen, scanning each character once.
+        Returns (1-based index of the string seen or 0 on timeout, list of consumed chunks).
+
+        async_scrt.AsyncScreen has the asyncio twin of this loop."""
+        scanner = self._scanner(strings, case_insensitive)
+        deadline = time.time() + timeout if timeout else None
+        captured = [] if capture else None
+        while True:
+            index = self._consume(scanner, captured)
+            if index:
+                return index, captured
+            remaining = None if deadline is None else deadline - time.time()
+            if (remaining is not None and remaining <= 0) or not self._read_more(remaining):
+                self.MatchIndex = 0
+                return 0, captured
+
+    def _scanner(self, strings, case_insensitive):
+        return compile_strings(strings, self._ignorecase or case_insensitive).scanner()
+
+    def _consume(self, scanner, captured=None):
+        """Feeds queued input to scanner until it matches.  Returns the index matched (and sets
+        MatchIndex), or 0 once the queue is empty.  Consumed text is appended to captured."""
+        while self._input:
+            chunk = self._input.popleft()
+            hit = scanner.scan(chunk)
+            if hit:
+                index, end = hit
+                if end < len(chunk):
+                    self._input.appendleft(chunk[end:])
+                if captured is not None:
+                    captured.append(chunk[:end])
+                self.MatchIndex = index
+                return index
+            if captured is not None:
+                captured.append(chunk)
         return 0
 
+    def _drain(self):
+        """Consumes and returns all queued input."""
+        data = u"".join(self._input)
+        self._input.clear()
+        return data
+
+    @staticmethod
+    def _captured_text(strings, index, captured):
+        """What ReadString returns: the consumed text, minus the string that matched."""
+        data = u"".join(captured)
+        if index:
+            data = data[:len(data) - len(strings[index - 1])]
+        return data
+
 
-class Session:
+class Session(object):
     """The Session object provides access to the state and properties that exist for the current
     connection or session."""
     LocalAddress = "127.0.0.1"
-    LogFileName = "logfile"
+    # substitutions as in SecureCRT, e.g. %H host, %Y%M%D date (see session_log.py)
+    LogFileName = os.path.join(tempfile.gettempdir(), "scrt-%H-%Y%M%D-%h%m%s.log")
     Path = "."
 
-    def __init__(self):
+    def __init__(self, screen=None):
+        self._screen = screen if screen is not None else Screen()
         self._last_error = 1
         self._status_text = "Status text"
-        self.Connected = True
-        self.Logging = False
+        self._connected = True  # what the mock reports until a real connection is made
         self.RemoteAddress = "1.1.1.1"
         self.RemotePort = 22
+        self._username = None
+        self._session_name = None
+        self._arguments = None  # what Connect() was given, for Tab.Clone()
 
     Config = SessionConfig()
 
+    @property
+    def Connected(self):
+        """True if the session is connected."""
+        if self._screen._transport is not None:
+            self._screen._poll()  # notice if the remote has hung up
+            return self._screen._transport is not None
+        return self._connected
+
+    @property
+    def Logging(self):
+        """True if the session is being logged."""
+        return self._screen._log is not None
+
     def Connect(self, arguments="command line arguments", wait_for_auth=True, suppress_popups=False):
         """Connects to a session. e.g.
         Connect("/SSH2 /PASSWORD password username@hostname")
 
+        The mock connects to a local stand-in chosen by hostname (see transport.py).
+
         Args:
             arguments (str): arguments to pass to connect, as if running SecureCRT from the command line.
             wait_for_auth (bool): Whether to wait for authentication before proceeding.
             suppress_popups (bool): Whether to suppress popups.
         """
+        args = transport.parse_cmdline(arguments)
+        if args.session and not args.hostname and args.session in SecureCRT.sessions:  # /S path
+            self.Config = SessionConfig(args.session, SecureCRT.sessions)
+            args.hostname = self.Config.GetOption("Hostname")
+            args.username = args.username or self.Config.GetOption("Username") or None
+            args.port = self.Config.GetOption("[SSH2] Port") or args.port
+        self._screen._attach(transport.open_transport(args))
+        self.RemoteAddress = args.hostname
+        self.RemotePort = args.port
+        self._username = args.username
+        self._session_name = args.session or args.hostname
+        self._arguments = arguments
+        self._connected = True
         self._last_error = 0
-        return Tab()
 
-    ConnectInTab = Connect  # essentially same method
+    def ConnectInTab(self, arguments="command line arguments", wait_for_auth=True, suppress_popups=False):
+        """Connects to a session in a new tab, and returns the Tab. Arguments are as for Connect()."""
+        tab = Tab()
+        tab.Session.Connect(arguments, wait_for_auth, suppress_popups)
+        tab.Activate()
+        return tab
 
     def Disconnect(self):
         """Disconnects the current session."""
-        self.Connected = False
+        self._screen._hangup()
+        self._connected = False
 
-    def Log(self, log_boolean):
-        """Enables or disables logging.  True=enabled, False=disabled"""
-        self.Logging = log_boolean
+    def Log(self, log_boolean, append=False):
+        """Enables or disables logging to LogFileName.  True=enabled, False=disabled
+
+        Args:
+            log_boolean (bool): start or stop logging
+            append (bool): append to the log file, instead of overwriting it
+        """
+        self._stop_log()
+        if log_boolean:
+            self._start_log(self.LogFileName, append)
 
     def LogUsingSessionOptions(self):
         """Turns on logging using the logging options for the current session. If the session is an
         ad hoc session, the Default session's logging options will be used."""
-        return
+        self._stop_log()
+        self._start_log(self.Config.GetOption("Log Filename V2") or self.LogFileName,
+                        bool(self.Config.GetOption("Append File")))
 
     def Print(self, print_boolean):
         """Starts or stops autoprint. Starts or stops autoprint depending on the Boolean start parameter."""
@@ -234,37 +552,70 @@ class Session:
         return status_text
 
     def Send(self, text):
+        if self._screen._transport is not None:
+            return self._screen.Send(text)
         msg = "Sent to remote: {}".format(text)
-        print msg
+        print(msg)
         return msg
 
     def WaitForStrings(self, list_of_strings, timeout):
-        saw = random.choice(list_of_strings)
-        index = list_of_strings.index(saw)
-        if timeout < 1000:
-            print "Prompt seen: {}".format(saw)
-            return index + 1  # SecureCRT starts list index at 1
-        else:
-            print "Timed out waiting for prompt."
-            return 0  # SecureCRT returns 0 when it times out
+        """Wait for one of several strings on this session's screen. Returns the index of the
+        string seen (SecureCRT starts list index at 1), or 0 when it times out."""
+        return self._screen.WaitForStrings(list_of_strings, timeout)
+
+    def _start_log(self, filename, append):
+        """Logs what the remote sends from now on (in the background; see session_log.py).
+        Rotation and compression follow the session_log module defaults."""
+        index = [tab.Index for tab in _tabs if tab.Screen is self._screen]
+        fields = {"host": self.RemoteAddress, "port": self.RemotePort, "username": self._username,
+                  "session": self._session_name or self.RemoteAddress, "tab_index": index[0] if index else 0}
+        import session_log
+        self._screen._log = session_log.SessionLog(filename, fields, append)
+
+    def _stop_log(self):
+        log, self._screen._log = self._screen._log, None
+        if log is not None:
+            log.close()
 
 
 class Tab(Session):
     Caption = "Tab Caption"
-    Index = 1
-    Screen = Screen()
-    Session = Session()
+
+    def __init__(self, screen=None, session=None):
+        # each tab has its own screen (and so its own connection)
+        self.Screen = screen if screen is not None else Screen()
+        self.Session = session if session is not None else Session(self.Screen)
+        Session.__init__(self, self.Screen)
+        _tabs.append(self)
+
+    @property
+    def Index(self):
+        """Position of the tab in the tab bar (first tab is 1), or 0 once the tab is closed."""
+        return _tabs.index(self) + 1 if self in _tabs else 0
 
     def Activate(self):
         """Brings the tab or tiled session window referenced by object to the foreground."""
+        global _active_tab
+        _active_tab = self
         return True
 
     def Clone(self):
-        """Returns a reference to a tab object cloned from the specified object tab reference."""
-        return self
+        """Returns a reference to a tab object cloned from the specified object tab reference.
+
+        The mock connects the new tab with the arguments this one was connected with."""
+        if self.Session._arguments is None:
+            return self
+        return self.Session.ConnectInTab(self.Session._arguments)
 
     def Close(self):
         """Closes the tab or tiled session window referenced by object."""
+        global _active_tab
+        self.Session.Disconnect()
+        self.Session.Log(False)
+        if self in _tabs:
+            _tabs.remove(self)
+        if _active_tab is self:
+            _active_tab = None
         return True
 
     def ConnectSftp(self):
@@ -289,12 +640,12 @@ class SecureCRT(Container):
     def GetActiveTab():
         """Returns the Tab object associated with the tab or tiled session window
         that is currently selected in the GUI."""
-        return Session()
+        return _active_tab if _active_tab is not None else _script_tab
 
     @staticmethod
     def GetScriptTab():
         """Returns the tab or tiled session window from which the script was started."""
-        return Session()
+        return _script_tab
 
     @staticmethod
     def GetLastError():
@@ -313,22 +664,23 @@ class SecureCRT(Container):
         When sessions are tabbed, the index for each tab object matches its position in the tab bar.
         When sessions are tiled, the indexes of the tab objects may not match the indexes when tabbed,
         but will remain consistent while the sessions are tiled."""
-        return Session()
+        return _tabs[tab_index - 1]
 
     @staticmethod
     def GetTabCount():
         """Returns the number of tabs or tiled session windows (connected or not) that exist in
         the current SecureCRT window.  Return value will always be greater than 0 (zero)."""
-        return 1
+        return max(len(_tabs), 1)
 
     @staticmethod
-    def OpenSessionConfiguration(session_path):
+    def OpenSessionConfiguration(session_path=None):
         """Loads the configuration for the specified session.
         SessionPath is a string parameter that is the relative path of the session.
         Returns a Config object. If SessionPath is not specified, the Default session's configuration
         object is returned. To access the session configuration associated with an active connection,
-        use crt.Session.Config or objTab.Session.Config."""
-        return True
+        use crt.Session.Config or objTab.Session.Config.
+        (The mock opens a session that isn't saved yet as empty: Save() creates it.)"""
+        return SessionConfig(session_path or "Default", SecureCRT.sessions)
 
     @staticmethod
     def Quit():
@@ -345,13 +697,24 @@ class SecureCRT(Container):
     class Arguments(Container):
         """The Arguments object allows scripts to access arguments that are passed to the script
         by one or more SecureCRT /ARG command-line options.
+        The mock's arguments are the script's command line arguments (sys.argv[1:]), unless
+        _args is set.
         """
-        Count = 0  # number of arguments passed
+        _args = None
 
-        @staticmethod
-        def GetArg(arg_index):
+        @property
+        def Count(self):
+            """Number of arguments passed."""
+            return len(self._arguments())
+
+        def GetArg(self, arg_index):
             """Returns the argument data associated with each /ARG command-line option passed to SecureCRT."""
-            return str(arg_index)
+            return self._arguments()[arg_index]
+
+        def _arguments(self):
+            return sys.argv[1:] if self._args is None else self._args
+
+    Arguments = Arguments()
 
     class Clipboard(Container):
         """The Clipboard object provides access to the application's clipboard.
@@ -369,11 +732,33 @@ class SecureCRT(Container):
         Visible = True
 
         def Send(self):
-            """Sends the current text in the Command window to the remote machine."""
+            """Sends the current text in the Command window to the remote machine: the active tab,
+            or with SendToAllSessions, every connected tab.  The mock returns what broadcast()
+            returns in that case: each tab's output, status and timing (see broadcast.py)."""
+            if self.SendToAllSessions:
+                return self.broadcast(self.Text)
+            tab = SecureCRT.GetActiveTab()
+            if tab.Screen._transport is not None:
+                return tab.Screen.Send(self.Text if self.Text.endswith(("\r", "\n")) else self.Text + "\r")
             msg = "crt.CommandWindow.Send: {}".format(self.Text)
-            print msg
+            print(msg)
             return msg
 
+        @staticmethod
+        def broadcast(command, tabs=None, **kwargs):
+            """Mock extension: sends a command line to tabs (default: every connected tab) at
+            once, and waits for their prompts.  Keyword args are as for broadcast.broadcast()."""
+            if tabs is None:
+                tabs = [tab for tab in _tabs if tab.Screen._transport is not None]
+            from broadcast import broadcast
+            return broadcast(tabs, command.rstrip("\r\n"), **kwargs)
+
+    CommandWindow = CommandWindow()
+    # mock extension: the saved sessions, $SCRT_SESSIONS or SecureCRT's folder (see session_db.py)
+    sessions = _Lazy("sessions", "session_db", "SessionDatabase")
+    # mock extension: connected tabs kept for reuse, by host (see tab_pool.py)
+    pool = _Lazy("pool", "tab_pool", "TabPool")
+
     class Dialog(Container):
 
         @staticmethod
@@ -386,7 +771,7 @@ class SecureCRT(Container):
             <Name of Filter> (*.<extension>)|*.<extension>||
             e.g. 'Text Files (*.txt)|*.txt||' OR  'Text Files (*.txt)|*.txt|Log File (*.log)|*.log||' """
             msg = "crt.Dialog.FileOpenDialog: {}".format(" ".join(*args))
-            print msg
+            print(msg)
             return msg
 
         @staticmethod
@@ -415,10 +800,18 @@ class SecureCRT(Container):
     class FileTransferObject(Container):
         """The FileTransfer object provides methods for performing file transfers initiated by scripts.
         SecureCRT's FileTransfer object is accessed through the top-level object's FileTransfer property.
-        The FileTransfer object is not supported with with sessions that use TN3270 emulation."""
+        The FileTransfer object is not supported with with sessions that use TN3270 emulation.
+
+        The mock runs the transfers (see xyzmodem.py and kermit.py) on the active tab's connection,
+        and returns a TransferResult (rate, CPU per MB...); the remote must already be
+        receiving/sending (e.g. the script sent "rz").  Keyword args (window=, block_size=...) go
+        to the protocol."""
         DownloadFolder = "Downloads"
         ZmodemUploadAscii = False
-        _upload_list = []
+
+        def __init__(self):
+            Container.__init__(self)
+            self._upload_list = []
 
         def AddToUploadList(self, filename):
             """AddToUploadList places the specified file on a list of files that will be uploaded during the
@@ -433,49 +826,82 @@ class SecureCRT(Container):
             self._upload_list = []
             return self._upload_list
 
-        def ReceiveKermit(self):
+        def ReceiveKermit(self, **options):
             """Initiates file download via Kermit to download folder."""
-            msg = "crt.FileTransferObject.ReceiveKermit To: {}".format(self.DownloadFolder)
-            print msg
-            return msg
+            import kermit
+            return self._transfer("ReceiveKermit", kermit.receive_kermit, self.DownloadFolder, **options)
 
-        def ReceiveXmodem(self):
-            """Initiates file download via Xmodem to download folder."""
-            msg = "crt.FileTransferObject.ReceiveXmodem To: {}".format(self.DownloadFolder)
-            print msg
-            return msg
+        def ReceiveXmodem(self, filename="xmodem.bin", **options):
+            """Initiates file download via Xmodem to download folder.  (Xmodem doesn't send the
+            file's name: the mock saves it as filename.)"""
+            import xyzmodem
+            return self._transfer("ReceiveXmodem", xyzmodem.receive_xmodem,
+                                  os.path.join(self.DownloadFolder, filename), **options)
 
-        def ReceiveYmodem(self):
+        def ReceiveYmodem(self, **options):
             """Initiates file download via Ymodem to download folder."""
-            msg = "crt.FileTransferObject.ReceiveYmodem To: {}".format(self.DownloadFolder)
-            print msg
-            return msg
+            import xyzmodem
+            return self._transfer("ReceiveYmodem", xyzmodem.receive_ymodem, self.DownloadFolder, **options)
+
+        def ReceiveZmodem(self, **options):
+            """Mock extension (SecureCRT starts Zmodem downloads by itself): downloads via Zmodem
+            to download folder."""
+            import xyzmodem
+            return self._transfer("ReceiveZmodem", xyzmodem.receive_zmodem, self.DownloadFolder, **options)
 
-        def SendKermit(self):
+        def SendKermit(self, **options):
             """Initiates Kermit upload of files from upload list."""
-            for f in self._upload_list:
-                print "crt.FileTransferObject.SendKermit sending: {}".format(f)
+            import kermit
+            return self._upload("SendKermit", kermit.send_kermit, self._upload_list, **options)
 
-        def SendXmodem(self):
-            """Initiates Xmodem upload of files from upload list."""
-            for f in self._upload_list:
-                print "crt.FileTransferObject.SendXmodem sending: {}".format(f)
+        def SendXmodem(self, **options):
+            """Initiates Xmodem upload of files from upload list.  (Xmodem sends one file: the
+            first on the list.)"""
+            import xyzmodem
+            return self._upload("SendXmodem", xyzmodem.send_xmodem, self._upload_list[:1], **options)
 
-        def SendYmodem(self):
+        def SendYmodem(self, **options):
             """Initiates Ymodem upload of files from upload list."""
-            for f in self._upload_list:
-                print "crt.FileTransferObject.SendYmodem sending: {}".format(f)
+            import xyzmodem
+            return self._upload("SendYmodem", xyzmodem.send_ymodem, self._upload_list, **options)
+
+        def SendZmodem(self, **options):
+            """Mock extension (SecureCRT starts Zmodem uploads when the remote runs rz): uploads
+            the files on the upload list via Zmodem."""
+            import xyzmodem
+            return self._upload("SendZmodem", xyzmodem.send_zmodem, self._upload_list, **options)
+
+        def _upload(self, name, send, files, **options):
+            if not files:
+                raise ValueError("The upload list is empty: AddToUploadList() first.")
+            import xyzmodem
+            target = files[0] if send is xyzmodem.send_xmodem else list(files)
+            result = self._transfer(name, send, target, **options)
+            if isinstance(result, xyzmodem.TransferResult):
+                self._upload_list = [f for f in self._upload_list if f not in files]
+            return result
 
-    class GetScriptTab(Container):
         @staticmethod
-        def Activate():
-            msg = "crt.GetScriptTab"
-            print msg
-            return msg
-
-        Session = Session()
+        def _transfer(name, run, target, **options):
+            """Runs a transfer on the active tab's connection: input the screen hasn't consumed
+            goes to the transfer first, and what comes after it goes back to the screen."""
+            import xyzmodem
+            screen = SecureCRT.GetActiveTab().Screen
+            screen._poll()
+            if screen._transport is None:
+                msg = "crt.FileTransferObject.{}: {}".format(name, target)
+                print(msg)
+                return msg
+            channel = xyzmodem.Channel(screen._transport, screen._drain().encode("utf-8"))
+            try:
+                return run(channel, target, **options)
+            finally:
+                screen._receive(channel.leftover())
+
+    FileTransfer = FileTransferObject = FileTransferObject()
 
     Screen = Screen()
+    Session = Session(Screen)
 
     class Window(Container):
         Active = True
@@ -492,3 +918,12 @@ class SecureCRT(Container):
             assert state in self._states, "You tried: {}.\nValid numbers: {}".format(state, self._states)
             self.State = state
             return "State set ({}: {})".format(state, self._states[state])
+
+
+# the tab the script was started from: crt.Screen and crt.Session belong to it
+_script_tab = Tab(SecureCRT.Screen, SecureCRT.Session)
+
+# SCRT_TRACE=1: per-call timings of the crt API at exit; SCRT_TRACE=<file>: also a flame graph trace (see tracing.py)
+if os.environ.get("SCRT_TRACE"):
+    import tracing
+    tracing.enable(None if os.environ["SCRT_TRACE"] == "1" else os.environ["SCRT_TRACE"], module=sys.modules[__name__])
@@ -1,6 +1,32 @@
 #!/usr/bin/env python
-"""Find a random available local port"""
+"""Find a random available local port
+
+PortAllocator hands out local ports for SSH /LOCAL forwards from inside the calling script
+(no extra interpreter), without the race of get_random_lport(): each port stays bound by us
+until just before SecureCRT binds it, and every port handed out is recorded in a lease file
+shared by all scripts on this workstation, so two scripts (or two tabs) never get the same
+port.
+
+    ports = PortAllocator()
+    lport = ports.reserve()[0]
+    ports.handoff(lport)          # stop holding it, right before connecting
+    tab = crt.Session.ConnectInTab("/SSH2 /LOCAL {}:127.0.0.1:80 myhost".format(lport))
+    ports.confirm(lport, "myhost")  # wait for the forward to bind it; lease is now "active"
+"""
+import contextlib
+import json
+import os
 import socket
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LEASE_FILE = os.path.join(tempfile.gettempdir(), "scrt_port_leases.json")
 
 
 def get_random_lport():
@@ -12,4 +38,142 @@ def get_random_lport():
     sock.close()
     return localport
 
-print(get_random_lport())
+
+def is_listening(port, host="127.0.0.1", timeout=0.2):
+    """True if something accepts TCP connections on host:port."""
+    try:
+        sock = socket.create_connection((host, port), timeout)
+    except socket.error:
+        return False
+    sock.close()
+    return True
+
+
+def is_bound(port, host="127.0.0.1"):
+    """True if something has host:port bound.  Unlike is_listening() it doesn't connect, so
+    checking an SSH forward doesn't open a channel on the device."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind((host, port))
+    except socket.error:
+        return True
+    finally:
+        sock.close()
+    return False
+
+
+class PortAllocator(object):
+    """Reserves local ports and keeps a lease for each one.
+
+    Lease states: "reserved" (we hold the port bound, or just handed it off) and "active"
+    (the forward has the port bound).  Reserved leases expire after reserve_seconds; active leases
+    last until free()d, or until nothing has the port bound any more.  Stale leases are
+    dropped when ports are reserved (or leases() is called).
+
+    Args:
+        lease_file (str): where leases are kept; default LEASE_FILE, shared by every script
+        host (str): local address the forwards listen on
+        reserve_seconds (int): how long a reserved port may wait for its forward to come up
+    """
+    def __init__(self, lease_file=None, host="127.0.0.1", reserve_seconds=120):
+        self.lease_file = lease_file or LEASE_FILE
+        self.host = host
+        self.reserve_seconds = reserve_seconds
+        self._held = dict()  # port -> bound socket
+
+    def reserve(self, count=1):
+        """Reserves count free ports in one go, and returns them."""
+        with self._leases(prune=True) as leases:
+            ports = []
+            while len(ports) < count:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.bind((self.host, 0))
+                port = sock.getsockname()[1]
+                if str(port) in leases:
+                    sock.close()  # leased to a forward that isn't up yet; try another
+                    continue
+                self._held[port] = sock
+                leases[str(port)] = {"state": "reserved", "pid": os.getpid(), "time": time.time()}
+                ports.append(port)
+        return ports
+
+    def handoff(self, port):
+        """Stops holding a reserved port, so SecureCRT can bind it.  Its lease stays."""
+        sock = self._held.pop(port, None)
+        if sock is not None:
+            sock.close()
+
+    def confirm(self, port, host=None, timeout=10.0):
+        """Waits up to timeout seconds for the forward to bind port (checked with is_bound(),
+        so waiting doesn't open SSH channels through it).  If it does, the lease becomes
+        "active" (noting host, if given) and True is returned; if not, the lease is dropped
+        and False is returned."""
+        self.handoff(port)
+        deadline = time.time() + timeout
+        while not is_bound(port, self.host):
+            if time.time() >= deadline:
+                self.free(port)
+                return False
+            time.sleep(0.05)
+        with self._leases() as leases:
+            leases[str(port)] = {"state": "active", "pid": os.getpid(), "time": time.time(), "host": host}
+        return True
+
+    def free(self, port):
+        """Gives a port back."""
+        self.handoff(port)
+        with self._leases() as leases:
+            leases.pop(str(port), None)
+
+    def leases(self):
+        """Returns the current leases: {port: {"state": ..., "pid": ..., "time": ..., "host": ...}}."""
+        with self._leases(prune=True) as leases:
+            return dict((int(port), lease) for port, lease in leases.items())
+
+    @contextlib.contextmanager
+    def _leases(self, prune=False):
+        """Yields the lease dict under an exclusive lock (pruned of stale leases, if prune), and
+        saves it."""
+        with open(self.lease_file + ".lock", "a+") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                try:
+                    with open(self.lease_file) as f:
+                        leases = json.load(f)
+                except (IOError, OSError, ValueError):
+                    leases = dict()
+                if prune:
+                    self._prune(leases)
+                yield leases
+                tmp = self.lease_file + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(leases, f)
+                if os.name == "nt" and os.path.exists(self.lease_file):
+                    os.remove(self.lease_file)
+                os.rename(tmp, self.lease_file)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _prune(self, leases):
+        now = time.time()
+        for port, lease in list(leases.items()):
+            if int(port) in self._held:
+                continue
+            if lease["state"] == "reserved":
+                stale = now - lease["time"] > self.reserve_seconds
+            else:
+                stale = not is_bound(int(port), self.host)
+            if stale:
+                del leases[port]
+
+
+if __name__ == "__main__":
+    print(get_random_lport())
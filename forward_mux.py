@@ -0,0 +1,695 @@
+"""
+One local port in front of every SSH /LOCAL forward: an asyncio service that routes each
+connection to the forward (or other target) it asks for, so a browser or tool only needs
+to know one port instead of one per tab and service.
+
+    python forward_mux.py [port] [name=host:port ...]
+
+Then http://rtr1.localhost:8880/ reaches the web UI behind rtr1's forward (browsers send
+*.localhost to 127.0.0.1), and a SOCKS5 client pointed at 127.0.0.1:8880 reaches rtr1:443
+through the forward connect.py set up for it.
+
+How a connection is routed, from its first bytes:
+- SOCKS5 (first byte 5): by the CONNECT request's host and port.
+- HTTP CONNECT: by its host:port.  Other HTTP: by the Host header, less its port and any
+  ".localhost" suffix.
+Targets come from routes= first ("name:port", or "name" for any port -> (host, port)), then
+from the forward registry: the forward through the session to that host (to that remote
+port, for SOCKS5/CONNECT; preferably to port 80 otherwise).  Anything else is refused, so
+this isn't an open proxy.  Host "mux" gets stats() as JSON.
+
+An SSH /LOCAL forward only ever reaches the one remote host:port it was set up for, so the
+mux can't make one forward serve several remote services; it fronts the forwards instead.
+
+Opening a connection through a forward costs an SSH channel open (a round trip to the
+device, and its connect to the service), so the mux keeps `spares` connections ready per
+upstream it has used and hands one to each new stream, topping up in the background.  Only
+unused connections are pooled: the relay doesn't parse what goes through it, so it can't
+tell when a used one is idle again.  Spares left unused for SPARE_MAX_AGE are closed by a
+periodic sweep, so an upstream nobody uses any more doesn't keep channels open.
+
+Relays use os.splice() through a pipe (Linux, Python 3.10+), so the bytes never come up
+into Python; elsewhere (or if the kernel won't splice those sockets) plain recv/send.
+sendfile() only reads from files, so it's no use between two sockets.  Every stream counts
+bytes each way and its connect and first-byte latency; see stats() and Stream.
+
+Needs Python 3 (asyncio) and a selector-based event loop.
+"""
+import asyncio
+import collections
+import errno
+import itertools
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MUX_PORT = 8880
+SPARES = 2  # ready connections kept per upstream
+SPARE_MAX_AGE = 30  # seconds before an unused spare is closed (servers drop idle connections)
+CONNECT_TIMEOUT = 10  # seconds
+HANDSHAKE_TIMEOUT = 10  # seconds for a client to say where it's going
+MAX_HEAD = 65536  # bytes of HTTP request head
+ROUTE_TTL = 5  # seconds a registry lookup is reused
+HISTORY = 1000  # closed streams kept for stats()
+STATUS_HOST = "mux"
+HTTP_PORTS = (80, 8080)  # preferred remote ports for plain HTTP routed by Host
+
+_CHUNK = 65536
+_PIPE_SIZE = 1 << 20  # splice()s move up to this much at a time
+_SPLICE_FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+_HAS_SPLICE = hasattr(os, "splice") and sys.platform.startswith("linux")
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+# SOCKS5 replies
+_SOCKS_OK = 0
+_SOCKS_NOT_ALLOWED = 2
+_SOCKS_UNREACHABLE = 4
+_SOCKS_REFUSED = 5
+_SOCKS_BAD_COMMAND = 7
+_SOCKS_BAD_ADDRESS = 8
+
+
+class MuxError(Exception):
+    pass
+
+
+class Stream(object):
+    """One relayed connection.  Latencies are in milliseconds.
+
+    connect_ms is how long getting an upstream connection took (next to nothing with a
+    spare), first_byte_ms how long after that the first byte came back.
+    """
+    def __init__(self, stream_id, client):
+        self.id = stream_id
+        self.client = client  # (address, port)
+        self.protocol = None  # "http", "connect" or "socks5"
+        self.name = None  # what the client asked for
+        self.target = None  # (host, port) it was routed to
+        self.opened = time.time()
+        self.closed = None
+        self.bytes_up = 0  # client -> target
+        self.bytes_down = 0  # target -> client
+        self.connect_ms = None
+        self.first_byte_ms = None
+        self.pooled = False  # got a spare
+        self.zero_copy = False
+        self.error = None
+        self._ready_at = None
+
+    @property
+    def duration(self):
+        return (self.closed or time.time()) - self.opened
+
+    def _up(self, count):
+        self.bytes_up += count
+
+    def _down(self, count):
+        if self.first_byte_ms is None:
+            self.first_byte_ms = (time.time() - self._ready_at) * 1000
+        self.bytes_down += count
+
+    def as_dict(self):
+        return {"id": self.id, "client": "{}:{}".format(*self.client[:2]), "protocol": self.protocol,
+                "name": self.name, "target": "{}:{}".format(*self.target) if self.target else None,
+                "open": self.closed is None, "duration": round(self.duration, 3), "bytes_up": self.bytes_up,
+                "bytes_down": self.bytes_down, "connect_ms": self.connect_ms, "first_byte_ms": self.first_byte_ms,
+                "pooled": self.pooled, "zero_copy": self.zero_copy, "error": self.error}
+
+    def __repr__(self):
+        return "<Stream {} {} {} -> {} up {} down {}{}>".format(
+            self.id, self.protocol, self.name, self.target, self.bytes_up, self.bytes_down,
+            " " + self.error if self.error else "")
+
+
+class ForwardMux(object):
+    """The multiplexer (see module docstring).  start() it on a running event loop, or use
+    start_background().
+
+    Args:
+        port (int): local port to listen on (0 for any free one; see .port once started)
+        routes (dict): "name:port" or "name" -> (host, port), looked at before the registry
+        registry: a ForwardRegistry; None opens the shared one, False means routes only
+        spares (int): ready connections kept per upstream (0 to connect on demand)
+        bind (str): address to listen on
+        zero_copy (bool): relay with os.splice() where it's available
+    """
+    def __init__(self, port=MUX_PORT, routes=None, registry=None, spares=SPARES, bind="127.0.0.1",
+                 zero_copy=True):
+        self.port = port
+        self.bind = bind
+        self.routes = dict((name.lower(), tuple(target)) for name, target in (routes or {}).items())
+        self.spares = spares
+        self.zero_copy = zero_copy and _HAS_SPLICE
+        self._registry = registry
+        self._route_cache = {}  # (name, port) -> (target, expires)
+        self._pool = collections.defaultdict(collections.deque)  # target -> deque of (socket, connected at)
+        self._filling = set()
+        self._sock = None
+        self._loop = None
+        self._thread = None
+        self._tasks = set()
+        self._ids = itertools.count(1)
+        self.active = {}  # id -> Stream
+        self.history = collections.deque(maxlen=HISTORY)
+        self.streams = 0
+        self.refused = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    async def start(self):
+        """Starts listening and accepting.  Returns once the port is bound."""
+        self._loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.bind, self.port))
+        sock.listen(128)
+        sock.setblocking(False)
+        self._sock = sock
+        self.port = sock.getsockname()[1]
+        self._spawn(self._accept_loop())
+        if self.spares:
+            self._spawn(self._sweep_loop())
+
+    async def serve_forever(self):
+        """start()s (if it isn't started yet), and serves until cancelled."""
+        if self._sock is None:
+            await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops listening, drops every stream and spare connection."""
+        thread = self._thread
+        if thread is not None and threading.current_thread() is not thread:
+            self._loop.call_soon_threadsafe(self._stop_thread)
+            thread.join(5)
+            return
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        for task in list(self._tasks):
+            task.cancel()
+        for spares in self._pool.values():
+            for sock, _ in spares:
+                sock.close()
+        self._pool.clear()
+
+    def _stop_thread(self):
+        self._thread = None
+        self.close()
+        self._loop.stop()
+
+    def resolve(self, name, port=None):
+        """The (host, port) a request for name (and port) goes to, or None."""
+        name = name.lower()
+        if port is not None and "{}:{}".format(name, port) in self.routes:
+            return self.routes["{}:{}".format(name, port)]
+        if name in self.routes:
+            return self.routes[name]
+        if self._registry is False:
+            return None
+        now = time.time()
+        cached = self._route_cache.get((name, port))
+        if cached and cached[1] > now:
+            return cached[0]
+        if self._registry is None:
+            from forward_registry import ForwardRegistry
+            self._registry = ForwardRegistry(check_live=False)  # the mux finds dead ones by connecting
+        forwards = self._registry.by_host(name)
+        if port is None:
+            forwards.sort(key=lambda f: f.remote_port not in HTTP_PORTS)
+        else:
+            forwards = [f for f in forwards if f.remote_port == port]
+        target = ("127.0.0.1", forwards[0].local_port) if forwards else None
+        self._route_cache[(name, port)] = (target, now + ROUTE_TTL)
+        return target
+
+    def stats(self, recent=20):
+        """Totals, plus the open streams and the last `recent` closed ones (as dicts)."""
+        return {"port": self.port, "streams": self.streams, "open": len(self.active), "refused": self.refused,
+                "bytes_up": self.bytes_up, "bytes_down": self.bytes_down, "pool_hits": self.pool_hits,
+                "pool_misses": self.pool_misses, "spares": sum(len(s) for s in self._pool.values()),
+                "zero_copy": self.zero_copy,
+                "active": [s.as_dict() for s in self.active.values()],
+                "recent": [s.as_dict() for s in list(self.history)[-recent:]] if recent else []}
+
+    def __repr__(self):
+        return "<ForwardMux 127.0.0.1:{} {} open, {} streams, {} refused>".format(
+            self.port, len(self.active), self.streams, self.refused)
+
+    #####
+    # accepting and routing
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _accept_loop(self):
+        while True:
+            try:
+                client, address = await self._loop.sock_accept(self._sock)
+            except OSError:  # closed
+                return
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._spawn(self._handle(client, address))
+
+    async def _handle(self, client, address):
+        stream = Stream(next(self._ids), address)
+        upstream = None
+        try:
+            conn = _Buffered(client)
+            try:
+                head, reply = await asyncio.wait_for(self._handshake(stream, conn), HANDSHAKE_TIMEOUT)
+            except (asyncio.TimeoutError, EOFError, ValueError, IndexError, UnicodeError) as e:
+                raise MuxError("bad handshake: {}".format(e.__class__.__name__))
+            if stream.target is None:
+                return
+            self.streams += 1
+            self.active[stream.id] = stream
+            started = time.time()
+            try:
+                upstream = await self._upstream(stream)
+            except (OSError, asyncio.TimeoutError) as e:
+                for key, (target, _) in list(self._route_cache.items()):
+                    if target == stream.target:  # look it up again next time: the tab may have moved on
+                        del self._route_cache[key]
+                await _send_quietly(self._loop, client, reply(False, e))
+                raise MuxError("{}:{} {}".format(stream.target[0], stream.target[1], _describe(e)))
+            stream.connect_ms = (time.time() - started) * 1000
+            stream._ready_at = time.time()
+            await self._loop.sock_sendall(client, reply(True, None))
+            if head:
+                await self._loop.sock_sendall(upstream, head)
+                stream._up(len(head))
+            await self._relay(stream, client, upstream)
+        except MuxError as e:
+            stream.error = str(e)
+        except OSError as e:
+            stream.error = _describe(e)
+        finally:
+            client.close()
+            if upstream is not None:
+                upstream.close()
+            if self.active.pop(stream.id, None) is not None:
+                stream.closed = time.time()
+                self.bytes_up += stream.bytes_up
+                self.bytes_down += stream.bytes_down
+                self.history.append(stream)
+
+    async def _handshake(self, stream, conn):
+        """Reads where the client wants to go and routes it (stream.name/target; no target:
+        refused, and already answered).  Returns (bytes to pass on, reply(ok, error) -> bytes
+        to answer the client with once the upstream is connected)."""
+        first = await conn.read(1)
+        if first == b"\x05":
+            return await self._socks5(stream, conn)
+        head = first + await conn.read_until(b"\r\n\r\n", MAX_HEAD)
+        lines = head.decode("latin-1").split("\r\n")
+        method, where = lines[0].split(" ")[:2]
+        if method.upper() == "CONNECT":
+            stream.protocol = "connect"
+            name, port = where.rsplit(":", 1)
+            port = int(port)
+            head = conn.rest()
+            reply = _connect_reply
+        else:
+            stream.protocol = "http"
+            host = [line.split(":", 1)[1].strip() for line in lines[1:] if line[:5].lower() == "host:"]
+            name, port = _host_name(host[0] if host else ""), None
+            head += conn.rest()
+            reply = _http_reply
+        stream.name = name.strip("[]").lower()
+        if stream.protocol == "http" and stream.name == STATUS_HOST:
+            body = json.dumps(self.stats(recent=100), indent=1).encode("utf-8")
+            await self._loop.sock_sendall(conn.sock, _http_response(200, "OK", body, "application/json"))
+            return None, None
+        stream.target = self.resolve(stream.name, port)
+        if stream.target is None:
+            self.refused += 1
+            stream.error = "no route"
+            if stream.protocol == "http":
+                body = "No forward for {!r}\n".format(stream.name).encode("utf-8")
+                await self._loop.sock_sendall(conn.sock, _http_response(404, "Not Found", body))
+            else:
+                await self._loop.sock_sendall(conn.sock, b"HTTP/1.1 403 No Route\r\n\r\n")
+        return head, reply
+
+    async def _socks5(self, stream, conn):
+        stream.protocol = "socks5"
+        methods = await conn.read(ord(await conn.read(1)))
+        if b"\x00" not in methods:  # only "no authentication"; we're on 127.0.0.1
+            await self._loop.sock_sendall(conn.sock, b"\x05\xff")
+            raise MuxError("no SOCKS5 auth method we take")
+        await self._loop.sock_sendall(conn.sock, b"\x05\x00")
+        _, command, _, address_type = bytearray(await conn.read(4))
+        if address_type == 1:
+            name = socket.inet_ntoa(await conn.read(4))
+        elif address_type == 3:
+            name = (await conn.read(ord(await conn.read(1)))).decode("idna")
+        elif address_type == 4:
+            name = socket.inet_ntop(socket.AF_INET6, await conn.read(16))
+        else:
+            await self._loop.sock_sendall(conn.sock, _socks_reply(_SOCKS_BAD_ADDRESS))
+            raise MuxError("bad SOCKS5 address type {}".format(address_type))
+        port = struct.unpack("!H", await conn.read(2))[0]
+        stream.name = name.lower()
+        if command != 1:  # CONNECT; no BIND or UDP
+            await self._loop.sock_sendall(conn.sock, _socks_reply(_SOCKS_BAD_COMMAND))
+            raise MuxError("SOCKS5 command {} not supported".format(command))
+        stream.target = self.resolve(stream.name, port)
+        if stream.target is None:
+            self.refused += 1
+            stream.error = "no route"
+            await self._loop.sock_sendall(conn.sock, _socks_reply(_SOCKS_NOT_ALLOWED))
+        return conn.rest(), _socks_connected
+
+    #####
+    # upstream connections
+
+    async def _upstream(self, stream):
+        """A connection to stream.target: a spare if there's a good one, else a new one."""
+        target = stream.target
+        spares = self._pool[target]
+        oldest = time.time() - SPARE_MAX_AGE
+        while spares:
+            sock, connected = spares.popleft()
+            if connected > oldest and _alive(sock):
+                self.pool_hits += 1
+                stream.pooled = True
+                self._refill(target)
+                return sock
+            sock.close()
+        self.pool_misses += 1
+        sock = await _connect(target)
+        self._refill(target)
+        return sock
+
+    def _refill(self, target):
+        if self.spares and target not in self._filling:
+            self._filling.add(target)
+            self._spawn(self._fill(target))
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SPARE_MAX_AGE / 2.0)
+            self._sweep()
+
+    def _sweep(self):
+        """Closes the spares that are too old, or that their server has dropped."""
+        oldest = time.time() - SPARE_MAX_AGE
+        for target, spares in list(self._pool.items()):
+            for spare in list(spares):
+                sock, connected = spare
+                if connected <= oldest or not _alive(sock):
+                    spares.remove(spare)
+                    sock.close()
+            if not spares and target not in self._filling:
+                del self._pool[target]
+
+    async def _fill(self, target):
+        spares = self._pool[target]
+        try:
+            while len(spares) < self.spares:
+                spares.append((await _connect(target), time.time()))
+        except (OSError, asyncio.TimeoutError):
+            pass  # the next stream finds out for itself
+        finally:
+            self._filling.discard(target)
+
+    #####
+    # relaying
+
+    async def _relay(self, stream, client, upstream):
+        zero_copy = self.zero_copy
+        stream.zero_copy = zero_copy
+        pipe = self._splice if zero_copy else self._copy
+        up = self._spawn(self._pipe(pipe, client, upstream, stream._up))
+        down = self._spawn(self._pipe(pipe, upstream, client, stream._down))
+        try:
+            await asyncio.gather(up, down)
+        finally:
+            up.cancel()
+            down.cancel()
+
+    async def _pipe(self, pipe, src, dst, count):
+        """Relays src to dst until src's end; then passes the end on (a half close)."""
+        try:
+            await pipe(src, dst, count)
+        except OSError:  # reset: stop the other direction too
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            return
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    async def _copy(self, src, dst, count):
+        loop = self._loop
+        while True:
+            data = await loop.sock_recv(src, _CHUNK)
+            if not data:
+                return
+            await loop.sock_sendall(dst, data)
+            count(len(data))
+
+    async def _splice(self, src, dst, count):
+        loop = self._loop
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        r, w = os.pipe()
+        try:
+            fcntl.fcntl(w, _F_SETPIPE_SZ, _PIPE_SIZE)
+        except (AttributeError, OSError):  # no fcntl, or over /proc/sys/fs/pipe-max-size: 64 KB then
+            pass
+        try:
+            while True:
+                try:
+                    pending = os.splice(src_fd, w, _PIPE_SIZE, flags=_SPLICE_FLAGS)
+                except BlockingIOError:
+                    await _ready(loop, src_fd)
+                    continue
+                except OSError as e:
+                    if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                        raise
+                    return await self._copy(src, dst, count)  # these sockets can't be spliced
+                if not pending:
+                    return
+                while pending:
+                    try:
+                        sent = os.splice(r, dst_fd, pending, flags=_SPLICE_FLAGS)
+                    except BlockingIOError:
+                        await _ready(loop, dst_fd, writer=True)
+                        continue
+                    pending -= sent
+                    count(sent)
+        finally:
+            os.close(r)
+            os.close(w)
+
+
+class _Buffered(object):
+    """A client socket during the handshake: reads what's asked for, keeps the rest."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self._loop = asyncio.get_running_loop()
+
+    async def _fill(self):
+        data = await self._loop.sock_recv(self.sock, 4096)
+        if not data:
+            raise EOFError()
+        self.buffer += data
+
+    async def read(self, count):
+        while len(self.buffer) < count:
+            await self._fill()
+        data = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        return data
+
+    async def read_until(self, separator, limit):
+        start = 0
+        while True:
+            end = self.buffer.find(separator, start)
+            if end >= 0:
+                return await self.read(end + len(separator))
+            if len(self.buffer) > limit:
+                raise ValueError("request head too long")
+            start = max(len(self.buffer) - len(separator) + 1, 0)
+            await self._fill()
+
+    def rest(self):
+        data = bytes(self.buffer)
+        del self.buffer[:]
+        return data
+
+
+def _host_name(host):
+    """A Host header's host name: less the port, and any ".localhost" (rtr1.localhost:8880 -> rtr1)."""
+    if host.startswith("["):
+        host = host[:host.find("]") + 1]
+    elif host.count(":") == 1:
+        host = host.split(":")[0]
+    host = host.rstrip(".")
+    if host.lower().endswith(".localhost"):
+        host = host[:-len(".localhost")]
+    return host
+
+
+def _http_response(status, reason, body, content_type="text/plain; charset=utf-8"):
+    return "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+        status, reason, content_type, len(body)).encode("ascii") + body
+
+
+def _http_reply(ok, error):
+    if ok:
+        return b""  # the request head goes upstream, the server answers
+    return _http_response(502, "Bad Gateway", "Forward not answering: {}\n".format(_describe(error)).encode("utf-8"))
+
+
+def _connect_reply(ok, error):
+    return b"HTTP/1.1 200 Connection Established\r\n\r\n" if ok else b"HTTP/1.1 502 Bad Gateway\r\n\r\n"
+
+
+def _socks_reply(code):
+    return b"\x05" + bytearray([code]) + b"\x00\x01\x00\x00\x00\x00\x00\x00"
+
+
+def _socks_connected(ok, error):
+    if ok:
+        return _socks_reply(_SOCKS_OK)
+    return _socks_reply(_SOCKS_REFUSED if isinstance(error, ConnectionRefusedError) else _SOCKS_UNREACHABLE)
+
+
+def _describe(error):
+    return str(error) or error.__class__.__name__
+
+
+async def _send_quietly(loop, sock, data):
+    try:
+        await loop.sock_sendall(sock, data)
+    except OSError:
+        pass
+
+
+async def _connect(target, timeout=CONNECT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    family, kind, proto, _, address = (await loop.getaddrinfo(target[0], target[1], type=socket.SOCK_STREAM))[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, address), timeout)
+    except BaseException:
+        sock.close()
+        raise
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def _alive(sock):
+    """Whether a spare is still connected (its server may have given up on it)."""
+    try:
+        return sock.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(True)
+
+
+async def _ready(loop, fd, writer=False):
+    """Waits until fd is readable (or writable)."""
+    future = loop.create_future()
+    if writer:
+        loop.add_writer(fd, _set_done, future)
+    else:
+        loop.add_reader(fd, _set_done, future)
+    try:
+        await future
+    finally:
+        if writer:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+
+def start_background(port=MUX_PORT, **kwargs):
+    """Runs a ForwardMux on its own event loop in a daemon thread, e.g. from a plain script.
+    Returns it once it's listening; its close() stops the thread.  Keyword args are as for
+    ForwardMux."""
+    mux = ForwardMux(port, **kwargs)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    failed = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(mux.start())
+        except Exception as e:
+            failed.append(e)
+            return
+        finally:
+            started.set()
+        loop.run_forever()
+        loop.run_until_complete(asyncio.gather(*mux._tasks, return_exceptions=True))  # the cancelled ones
+        loop.close()
+
+    mux._thread = threading.Thread(target=run, name="forward-mux-{}".format(port))
+    mux._thread.daemon = True
+    mux._thread.start()
+    started.wait()
+    if failed:
+        raise failed[0]
+    return mux
+
+
+def main(argv):
+    port = int(argv[0]) if argv and argv[0].isdigit() else MUX_PORT
+    routes = {}
+    for arg in argv[1 if argv and argv[0].isdigit() else 0:]:
+        name, target = arg.split("=", 1)
+        host, target_port = target.rsplit(":", 1)
+        routes[name] = (host, int(target_port))
+    mux = ForwardMux(port, routes)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(mux.start())
+        print("forward mux on 127.0.0.1:{} (http://<host>.localhost:{}/, or SOCKS5){}".format(
+            mux.port, mux.port, "" if mux.zero_copy else ", without splice()"))
+        loop.run_until_complete(mux.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mux.close()
+        loop.run_until_complete(asyncio.gather(*mux._tasks, return_exceptions=True))  # the cancelled ones
+        loop.close()
+    print("{streams} streams, {refused} refused, {bytes_up} bytes up, {bytes_down} down, "
+          "{pool_hits} spares used".format(**mux.stats()))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Registry of the SSH /LOCAL forwards our scripts have set up: which tab, to which host, on
+which local port, to which remote target.  connect.py adds to it; openThruProxy.py looks
+ports up in it, instead of parsing them back out of the tab's Caption.  A tab's forwards are
+found by its index and caption together, by its caption if it has moved, or by its index if
+it has been renamed (both sides can see those; the session's RemoteAddress is an IP address
+in SecureCRT, not the name connect.py was given, and tab indexes shift as tabs are closed).
+
+It's a small SQLite database shared by every script on this workstation, indexed by each
+key, so "which port forwards to host X" doesn't mean walking every tab.  Lookups skip (and
+delete) entries whose local port is no longer bound, checked without connecting, so a
+lookup doesn't open an SSH channel through each forward.
+
+    python forward_registry.py [host]    # list the live forwards (to host)
+"""
+import collections
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from find_localport import is_bound
+
+REGISTRY_FILE = os.path.join(tempfile.gettempdir(), "scrt_forwards.sqlite3")
+
+Forward = collections.namedtuple("Forward",
+                                 "local_port tab_index host remote_host remote_port created caption")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forwards (
+    local_port INTEGER PRIMARY KEY,
+    tab_index INTEGER,
+    host TEXT COLLATE NOCASE,
+    remote_host TEXT,
+    remote_port INTEGER,
+    created REAL,
+    caption TEXT
+);
+CREATE INDEX IF NOT EXISTS forwards_tab ON forwards (tab_index);
+CREATE INDEX IF NOT EXISTS forwards_host ON forwards (host);
+CREATE INDEX IF NOT EXISTS forwards_target ON forwards (remote_host, remote_port);
+CREATE INDEX IF NOT EXISTS forwards_caption ON forwards (caption);
+"""
+_COLUMNS = "local_port, tab_index, host, remote_host, remote_port, created, caption"
+
+
+class ForwardRegistry(object):
+    """The forward registry (see module docstring).
+
+    Args:
+        path (str): SQLite file; default REGISTRY_FILE, shared by every script on this workstation
+        check_live (bool): drop entries whose local port isn't bound when they're looked up
+    """
+    def __init__(self, path=None, check_live=True):
+        self.check_live = check_live
+        # one thread at a time, but not always the one that opened it (e.g. forward_mux's loop)
+        self._db = sqlite3.connect(path or REGISTRY_FILE, timeout=10, check_same_thread=False)
+        try:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass  # e.g. on a network drive
+        with self._db:
+            self._db.executescript(_SCHEMA)
+
+    def add(self, local_port, host, remote_host="127.0.0.1", remote_port=80, tab_index=None, caption=None):
+        """Records a forward.  A new forward on the same local port replaces the old one."""
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO forwards ({}) VALUES (?, ?, ?, ?, ?, ?, ?)".format(_COLUMNS),
+                             (local_port, tab_index, host, remote_host, remote_port, time.time(), caption))
+
+    def remove(self, local_port):
+        with self._db:
+            self._db.execute("DELETE FROM forwards WHERE local_port = ?", (local_port,))
+
+    def by_port(self, local_port):
+        """The Forward on a local port, or None."""
+        found = self._select("local_port = ?", local_port)
+        return found[0] if found else None
+
+    def by_tab(self, tab_index):
+        """Forwards set up for the tab at tab_index."""
+        return self._select("tab_index = ?", tab_index)
+
+    def for_tab(self, tab):
+        """Forwards set up for a tab (fake_scrt/SecureCRT Tab): those registered with its
+        index and caption; if the tab has moved, those with its caption; if it has been
+        renamed, those with its index.  Either way the entries are updated to the tab's index
+        and caption, so the next lookup finds them directly (and a tab that opens at the
+        moved tab's old index doesn't)."""
+        by_index = self.by_tab(tab.Index)
+        forwards = [f for f in by_index if f.caption == tab.Caption]
+        if forwards:
+            return forwards
+        forwards = self._select("caption = ?", tab.Caption) or by_index
+        if forwards:
+            with self._db:
+                self._db.executemany("UPDATE forwards SET tab_index = ?, caption = ? WHERE local_port = ?",
+                                     [(tab.Index, tab.Caption, f.local_port) for f in forwards])
+        return [f._replace(tab_index=tab.Index, caption=tab.Caption) for f in forwards]
+
+    def by_host(self, host):
+        """Forwards through SSH sessions to host (case-insensitive)."""
+        return self._select("host = ?", host)
+
+    def by_target(self, remote_host, remote_port):
+        """Forwards to remote_host:remote_port."""
+        return self._select("remote_host = ? AND remote_port = ?", remote_host, remote_port)
+
+    def all(self):
+        return self._select("1")
+
+    def prune(self):
+        """Deletes every entry whose local port isn't bound.  Returns the ports deleted."""
+        stale = [f.local_port for f in self._select("1", live_only=False) if not is_bound(f.local_port)]
+        self._delete(stale)
+        return stale
+
+    def _select(self, where, *params, **kwargs):
+        rows = self._db.execute("SELECT {} FROM forwards WHERE {} ORDER BY created".format(_COLUMNS, where),
+                                params).fetchall()
+        forwards = [Forward(*row) for row in rows]
+        if not (kwargs.get("live_only", True) and self.check_live):
+            return forwards
+        live = [f for f in forwards if is_bound(f.local_port)]
+        if len(live) < len(forwards):
+            self._delete([f.local_port for f in forwards if f not in live])
+        return live
+
+    def _delete(self, ports):
+        if ports:
+            with self._db:
+                self._db.executemany("DELETE FROM forwards WHERE local_port = ?", [(p,) for p in ports])
+
+    def close(self):
+        self._db.close()
+
+
+if __name__ == "__main__":
+    registry = ForwardRegistry()
+    found = registry.by_host(sys.argv[1]) if len(sys.argv) > 1 else registry.all()
+    for f in found:
+        print("127.0.0.1:{} -> {} -> {}:{}  (tab {} {!r})".format(f.local_port, f.host, f.remote_host,
+                                                                 f.remote_port, f.tab_index, f.caption))
@@ -0,0 +1,96 @@
+"""
+Host inventories for connect.py's batch mode.
+
+The format is picked by file extension:
+- .csv: a header row with "host" (or "hostname"), and optionally "forwards" (space
+  separated forward specs), "timeout" (seconds), "username" and "caption" columns.
+- .yaml/.yml: a list of host names, or of mappings with the same keys (needs PyYAML).
+- anything else: one host per line, "hostname [forward ...]"; "#" starts a comment.
+
+A forward spec is the remote end of a /LOCAL forward: "443" (meaning 127.0.0.1:443) or
+"10.1.1.1:8080".  The local end is allocated when the host is connected.
+"""
+import csv
+import os
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class Host(object):
+    """One inventory entry."""
+    def __init__(self, name, forwards=(), timeout=None, username=None, caption=None):
+        self.name = name
+        self.forwards = [parse_forward(f) for f in forwards]  # [(remote host, remote port)]
+        self.timeout = float(timeout) if timeout else None
+        self.username = username or None
+        self.caption = caption or None
+
+    def __repr__(self):
+        return "<Host {} {}>".format(self.name, self.forwards)
+
+
+def parse_forward(spec):
+    """'443' -> ('127.0.0.1', 443); '10.1.1.1:8080' -> ('10.1.1.1', 8080)"""
+    if isinstance(spec, (tuple, list)):
+        return spec[0], int(spec[1])
+    spec = str(spec).strip()
+    host, _, port = spec.rpartition(":")
+    if not port.isdigit():
+        raise ValueError("Bad forward spec (want [<host>:]<port>): {!r}".format(spec))
+    return host or "127.0.0.1", int(port)
+
+
+def load(path):
+    """Reads an inventory file, and returns a list of Hosts."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return _load_csv(path)
+    if ext in (".yaml", ".yml"):
+        return _load_yaml(path)
+    return _load_list(path)
+
+
+def _load_csv(path):
+    hosts = []
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            row = dict((k.strip().lower(), (v or "").strip()) for k, v in row.items() if k)
+            name = row.get("host") or row.get("hostname")
+            if not name or name.startswith("#"):
+                continue
+            hosts.append(Host(name, row.get("forwards", "").split(), row.get("timeout"),
+                              row.get("username"), row.get("caption")))
+    return hosts
+
+
+def _load_yaml(path):
+    if yaml is None:
+        raise ImportError("Reading {} needs PyYAML (pip install pyyaml).".format(path))
+    with open(path) as f:
+        entries = yaml.safe_load(f) or []
+    if isinstance(entries, dict):
+        entries = entries.get("hosts", [])
+    hosts = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            hosts.append(Host(str(entry)))
+            continue
+        forwards = entry.get("forwards") or []
+        if not isinstance(forwards, list):
+            forwards = str(forwards).split()
+        hosts.append(Host(entry.get("host") or entry["hostname"], forwards, entry.get("timeout"),
+                          entry.get("username"), entry.get("caption")))
+    return hosts
+
+
+def _load_list(path):
+    hosts = []
+    with open(path) as f:
+        for line in f:
+            words = line.split("#", 1)[0].split()
+            if words:
+                hosts.append(Host(words[0], words[1:]))
+    return hosts
@@ -0,0 +1,728 @@
+"""
+Kermit file transfer over a transport (see transport.py): what crt.FileTransfer's
+SendKermit/ReceiveKermit run on the session.
+
+    result = send_kermit(tab.Screen._transport, ["firmware.bin"])   # the remote ran "kermit -r"
+
+What's negotiated in the Send-Init exchange, and used if both ends can:
+- long packets (up to 9024 bytes; PACKET_LENGTH by default)
+- sliding windows: up to WINDOW (at most 31) packets in flight, each ACKed on its own, and
+  only the lost ones sent again, so throughput doesn't collapse on high-latency links
+- attribute packets: file size, date and type go along with the file
+- CRC block checks (type 3), repeat-count compression, 8th-bit quoting if the other end
+  needs it (7-bit links)
+
+Resume: a sender with resume=True (C-Kermit's RESEND), or a receiver with resume=True,
+carries on from the end of a partial file that the receiver already has.
+
+Encoding and decoding work on whole packets with re.split, translate and dict lookups (in
+C), not byte by byte in Python; the block check is CRC-16/KERMIT computed with
+binascii.crc_hqx over bit-reversed data.  Files are read as views of a memory mapping
+(see xyzmodem.py) and written to disk as the packets come in.
+
+    python kermit.py bench [megabytes] [delay ms]   # loopback throughput, stop-and-wait vs windows
+"""
+import binascii
+import collections
+import os
+import random
+import re
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+import transport
+from xyzmodem import (Channel, MappedFile, TransferCancelled, TransferError, TransferResult, TransferTimeout,
+                      loopback, make_folder)
+
+TIMEOUT = 10  # seconds to wait for a packet, before sending again
+RETRIES = 10
+PACKET_LENGTH = 4096  # longest packet we send/accept (up to 9024)
+WINDOW = 31  # packets in flight (1: stop-and-wait)
+
+MARK, EOL = 0x01, 0x0d
+_QCTL, _QBIN, _REPT = b"#", b"&", b"~"
+_LONG_PACKETS, _WINDOWS, _ATTRIBUTES = 2, 4, 8  # CAPAS bits
+
+_REVERSE = bytes(bytearray(int("{:08b}".format(i)[::-1], 2) for i in range(256)))
+_REVERSED = bytearray(_REVERSE)
+
+
+def _tochar(n):
+    return struct.pack("B", n + 32)
+
+
+def _unchar(c):
+    return c - 32
+
+
+def _crc(data):
+    """CRC-16/KERMIT: the bit-reversed XMODEM CRC (crc_hqx) of the bit-reversed data."""
+    crc = binascii.crc_hqx(data.translate(_REVERSE), 0)
+    return (_REVERSED[crc & 0xff] << 8) | _REVERSED[crc >> 8]
+
+
+def _check(data, kind):
+    """The block check characters for a packet (LEN through DATA)."""
+    if kind == 3:
+        crc = _crc(data)
+        return _tochar((crc >> 12) & 0x0f) + _tochar((crc >> 6) & 0x3f) + _tochar(crc & 0x3f)
+    total = sum(bytearray(data))
+    if kind == 2:
+        total &= 0xfff
+        return _tochar(total >> 6) + _tochar(total & 0x3f)
+    return _tochar((total + ((total & 0xc0) >> 6)) & 0x3f)
+
+
+class _Units(dict):
+    """Encoded (or decoded) forms, computed when first asked for."""
+    def __init__(self, make):
+        dict.__init__(self)
+        self.make = make
+
+    def __missing__(self, key):
+        value = self[key] = self.make(key)
+        return value
+
+
+class _Codec(object):
+    """Kermit's data encoding: control (and prefix) characters quoted with "#", runs of 4 or
+    more as "~" + count, and with 8th-bit quoting, bytes over 127 as "&" + the low 7 bits."""
+    def __init__(self, qbin=None, rept=None):
+        self.qbin = qbin
+        self.rept = rept
+        prefixes = set(bytearray(_QCTL + (qbin or b"") + (rept or b"")))
+        self._encoded = {}
+        self._cost1 = bytearray()  # bytes that take 2 characters
+        self._cost2 = bytearray()  # and 3
+        for c in range(256):
+            unit = self._encode_byte(c, prefixes)
+            self._encoded[struct.pack("B", c)] = unit
+            if len(unit) == 2:
+                self._cost1.append(c)
+            elif len(unit) == 3:
+                self._cost2.append(c)
+        self._cost1 = bytes(self._cost1)
+        self._cost2 = bytes(self._cost2)
+        special = self._cost1 + self._cost2
+        self._split_re = re.compile(b"([" + b"".join(re.escape(special[i:i + 1]) for i in range(len(special)))
+                                    + b"])")
+        self._run_re = re.compile(b"(.)\\1\\1\\1+", re.DOTALL) if rept else None
+        q = re.escape(_QCTL)
+        units = [q + b"."]
+        if qbin:
+            units = [re.escape(qbin) + q + b".", re.escape(qbin) + b"."] + units
+        if rept:
+            r = re.escape(rept) + b"."
+            units = [r + u for u in units] + [r + b"."] + units
+        self._unit_re = re.compile(b"(" + b"|".join(units) + b")", re.DOTALL)
+        self._decoded = _Units(self._decode_unit)
+
+    def _encode_byte(self, c, prefixes):
+        prefix = b""
+        if self.qbin and c & 0x80:
+            prefix = self.qbin
+            c &= 0x7f
+        low = c & 0x7f
+        if low < 32 or low == 127:
+            return prefix + _QCTL + struct.pack("B", c ^ 0x40)
+        if (c if not prefix else low) in prefixes:
+            return prefix + _QCTL + struct.pack("B", c)
+        return prefix + struct.pack("B", c)
+
+    def fit(self, data, room):
+        """How many bytes from the start of data encode into room characters or less (not
+        counting repeat compression, which only makes it shorter)."""
+        n = min(len(data), room)
+        while True:
+            chunk = data[:n]
+            size = n + (n - len(chunk.translate(None, self._cost1)))
+            if self._cost2:
+                size += 2 * (n - len(chunk.translate(None, self._cost2)))
+            if size <= room:
+                return n
+            n -= (size - room + 2) // 3  # a byte is at most 3 characters
+
+    def encode(self, data):
+        data = bytes(data)
+        if self._run_re is None or not self._run_re.search(data):
+            return self._encode_plain(data)
+        out = []
+        pos = 0
+        for m in self._run_re.finditer(data):
+            out.append(self._encode_plain(data[pos:m.start()]))
+            unit = self._encoded[m.group(1)]
+            count = m.end() - m.start()
+            while count > 3:
+                n = min(count, 94)
+                out.append(self.rept + _tochar(n) + unit)
+                count -= n
+            out.append(unit * count)
+            pos = m.end()
+        out.append(self._encode_plain(data[pos:]))
+        return b"".join(out)
+
+    def _encode_plain(self, data):
+        parts = self._split_re.split(data)
+        if len(parts) == 1:
+            return data
+        parts[1::2] = map(self._encoded.__getitem__, parts[1::2])
+        return b"".join(parts)
+
+    def decode(self, data):
+        parts = self._unit_re.split(data)
+        if len(parts) == 1:
+            return data
+        parts[1::2] = map(self._decoded.__getitem__, parts[1::2])
+        return b"".join(parts)
+
+    def _decode_unit(self, unit):
+        unit = bytearray(unit)
+        count = 1
+        if self.rept and unit[:1] == self.rept:
+            count = _unchar(unit[1])
+            unit = unit[2:]
+        high = 0
+        if self.qbin and unit and unit[:1] == self.qbin:
+            high = 0x80
+            unit = unit[1:]
+        c = unit[-1]
+        if len(unit) == 2 and 0x3f <= c & 0x7f <= 0x5f:  # a quoted control character
+            c ^= 0x40
+        return struct.pack("B", c | high) * count
+
+
+_PLAIN = _Codec()  # before the Send-Init exchange
+
+
+class _Link(object):
+    """Kermit packets over a Channel, with the parameters agreed in the Send-Init exchange,
+    and the sender's window of packets not acknowledged yet."""
+    def __init__(self, ch, result, timeout, retries):
+        self.ch = ch
+        self.result = result
+        self.timeout = timeout
+        self.retries = retries
+        self.check = 1  # block check type; 3 (CRC) once agreed
+        self.codec = _PLAIN
+        self.max_data = 90 - 3  # data characters per packet
+        self.window = 1
+        self.attributes = False
+        self.seq = 0  # next packet to send
+        self.unacked = collections.OrderedDict()  # seq -> packet, or None once ACKed
+        self.answers = {}  # seq -> the data in its ACK
+        self.sent_acks = {}  # receiver: seq -> the ACK sent for it, for duplicates
+
+    #####
+    # packets
+
+    def packet(self, seq, kind, data):
+        check_length = self.check if self.check != 3 else 3
+        if len(data) + 2 + check_length <= 94:
+            body = _tochar(len(data) + 2 + check_length) + _tochar(seq) + kind
+        else:
+            length = len(data) + check_length
+            head = _tochar(0) + _tochar(seq) + kind + _tochar(length // 95) + _tochar(length % 95)
+            body = head + _check(head, 1)
+        body += data
+        return b"\x01" + body + _check(body, self.check) + b"\r"
+
+    def read_packet(self, timeout):
+        """The next packet: (seq, type, data), or None if it was garbled."""
+        ch = self.ch
+        while ch.getc(timeout) != MARK:
+            pass
+        try:
+            ch.need(3, timeout)
+            length = _unchar(ch.buf[ch.pos])
+            header = 3
+            if length == 0:  # long packet
+                ch.need(6, timeout)
+                head = bytes(ch.buf[ch.pos:ch.pos + 5])
+                if _check(head, 1) != bytes(ch.buf[ch.pos + 5:ch.pos + 6]):
+                    return None
+                header = 6
+                length = _unchar(ch.buf[ch.pos + 3]) * 95 + _unchar(ch.buf[ch.pos + 4])
+            elif length < 3:
+                return None
+            else:
+                length -= 2
+            ch.need(header + length, timeout)  # (can move buf about)
+        except TransferTimeout:  # a garbled length: more than is coming
+            length = None
+        start = ch.pos
+        end = len(ch.buf) if length is None else start + header + length
+        mark = ch.buf.find(b"\x01", start, end)
+        if length is None or mark >= 0:  # cut short, and the next packet started
+            ch.pos = end if mark < 0 else mark
+            return None
+        check_length = self.check if self.check != 3 else 3
+        body = bytes(ch.buf[start:end - check_length])
+        ch.pos = end
+        if _check(body, self.check) != bytes(ch.buf[end - check_length:end]):
+            if self.check != 1 and body[2:3] == b"S":  # the Send-Init again (our ACK got lost): always type 1
+                body = bytes(ch.buf[start:end - 1])
+                if _check(body, 1) == bytes(ch.buf[end - 1:end]):
+                    return _unchar(ch.buf[start + 1]) % 64, b"S", body[header:]
+            return None
+        return _unchar(ch.buf[start + 1]) % 64, body[2:3], body[header:]
+
+    def poll_packet(self):
+        """A packet that has (started to) arrive, or None."""
+        ch = self.ch
+        if not ch.available():
+            return None
+        mark = ch.buf.find(b"\x01", ch.pos)
+        if mark < 0:
+            ch.pos = len(ch.buf)
+            return None
+        ch.pos = mark
+        return self.read_packet(self.timeout)
+
+    #####
+    # sending
+
+    def send(self, kind, data=b""):
+        """Sends a packet (waiting for room in the window).  Returns its seq."""
+        while len(self.unacked) >= self.window:
+            self._wait_for_acks()
+        seq = self.seq
+        packet = self.packet(seq, kind, data)
+        self.unacked[seq] = packet
+        self.answers.pop(seq, None)
+        self.seq = (seq + 1) % 64
+        self.ch.write(packet)
+        while self._take_ack(self.poll_packet()):
+            pass
+        return seq
+
+    def exchange(self, kind, data=b""):
+        """Sends a packet once everything before it is acknowledged, and waits for its ACK.
+        Returns the ACK's data."""
+        self.flush()
+        seq = self.send(kind, data)
+        while seq in self.unacked:
+            self._wait_for_acks()
+        return self.answers.get(seq)
+
+    def flush(self):
+        """Waits until every packet sent has been acknowledged."""
+        while self.unacked:
+            self._wait_for_acks()
+
+    def _wait_for_acks(self):
+        attempts = 0
+        while attempts < self.retries:
+            try:
+                packet = self.read_packet(self.timeout)
+            except TransferTimeout:
+                packet = None
+            if packet is not None:
+                if self._take_ack(packet):
+                    return
+                continue  # a NAK (answered already), or a stale ACK
+            attempts += 1
+            seq = next(iter(self.unacked))  # the oldest unacknowledged packet goes again
+            self.result.errors += 1
+            self.ch.write(self.unacked[seq])
+        raise TransferTimeout("no acknowledgement after {} tries".format(self.retries))
+
+    def _take_ack(self, packet):
+        """Handles a packet from the receiver.  Returns True if it acknowledged something."""
+        if packet is None:
+            return False
+        seq, kind, data = packet
+        if kind == b"Y" and self.unacked.get(seq) is not None:
+            self.answers[seq] = data
+            self.unacked[seq] = None
+            while self.unacked and next(iter(self.unacked.values())) is None:
+                self.unacked.popitem(last=False)
+            return True
+        if kind == b"N":
+            if self.unacked.get(seq) is not None:
+                self.result.errors += 1
+                self.ch.write(self.unacked[seq])
+            elif seq == self.seq:  # NAK for the packet after the window: all received
+                self.unacked.clear()
+                return True
+            return False
+        if kind == b"E":
+            raise TransferCancelled("the receiver gave up: {}".format(self.codec.decode(data).decode("utf-8", "replace")))
+        return False
+
+    #####
+    # receiving
+
+    def ack(self, seq, data=b""):
+        packet = self.packet(seq, b"Y", data)
+        self.sent_acks[seq] = packet
+        self.ch.write(packet)
+
+    def nak(self, seq):
+        self.ch.write(self.packet(seq, b"N", b""))
+
+    def error(self, message):
+        try:
+            self.ch.write(self.packet(self.seq, b"E", self.codec.encode(message.encode("utf-8"))))
+        except (IOError, OSError):
+            pass
+
+    #####
+    # Send-Init
+
+    def init_data(self, window, packet_length):
+        capas = _LONG_PACKETS | _WINDOWS | _ATTRIBUTES
+        return b"".join([
+            _tochar(94), _tochar(min(int(self.timeout), 94)), _tochar(0), b"@", _tochar(EOL), _QCTL,
+            b"Y",  # 8th-bit quoting: if you need it
+            b"3", _REPT, _tochar(capas), _tochar(window),
+            _tochar(packet_length // 95), _tochar(packet_length % 95)])
+
+    def agree(self, ours, theirs):
+        """Sets the parameters from both ends' Send-Init data."""
+        ours = bytearray(ours)
+        theirs = bytearray(theirs) + bytearray(b" " * 14)
+        if theirs[7] == ours[7]:
+            self.check = ours[7] - 0x30
+        qbin = None
+        if (chr(ours[6]), chr(theirs[6])) in (("Y", "&"), ("&", "Y"), ("&", "&")):
+            qbin = _QBIN
+        rept = _REPT if theirs[8] == ours[8] and theirs[8] != 32 else None
+        self.codec = _Codec(qbin, rept)
+        capas = _unchar(theirs[9])
+        i = 9
+        while _unchar(theirs[i]) & 1:  # more CAPAS bytes follow
+            i += 1
+        window = min(_unchar(theirs[i + 1]), _unchar(ours[10])) if capas & _WINDOWS else 1
+        self.window = max(1, min(window, 31))
+        self.attributes = bool(capas & _ATTRIBUTES)
+        if capas & _LONG_PACKETS:
+            length = min(_unchar(theirs[i + 2]) * 95 + _unchar(theirs[i + 3]) or 500,
+                         _unchar(ours[11]) * 95 + _unchar(ours[12]))
+            self.max_data = length - 9 - 3
+        else:
+            self.max_data = min(_unchar(theirs[0]), 94) - 5 - 3
+
+
+def _attributes(f):
+    """An attribute packet's data: type binary, size in bytes and K, date."""
+    size = str(f.size).encode("ascii")
+    kilobytes = str((f.size + 1023) // 1024).encode("ascii")
+    date = time.strftime("%Y%m%d %H:%M:%S", time.localtime(f.mtime)).encode("ascii")
+    return b"".join([b'"', _tochar(2), b"B8", b"1", _tochar(len(size)), size,
+                     b"!", _tochar(len(kilobytes)), kilobytes, b"#", _tochar(len(date)), date])
+
+
+def _parse_attributes(data):
+    """{tag: value} from an attribute packet's data."""
+    data = bytearray(data)
+    values = {}
+    i = 0
+    while i + 1 < len(data):
+        tag = chr(data[i])
+        length = _unchar(data[i + 1])
+        values[tag] = bytes(data[i + 2:i + 2 + length]).decode("ascii", "replace")
+        i += 2 + length
+    return values
+
+
+def send_kermit(conn, paths, window=WINDOW, packet_length=PACKET_LENGTH, resume=False, timeout=TIMEOUT,
+                retries=RETRIES):
+    """Sends files with Kermit.  The remote must be receiving (e.g. "kermit -r").
+
+    Args:
+        conn: transport or xyzmodem.Channel
+        paths (list): files to send
+        window (int): packets in flight, 1 to 31 (if the receiver can do windows)
+        packet_length (int): longest packet, up to 9024 (if the receiver can do long packets)
+        resume (bool): ask the receiver to carry on from the end of partial files
+    """
+    ch = conn if isinstance(conn, Channel) else Channel(conn)
+    result = TransferResult("kermit")
+    link = _Link(ch, result, timeout, retries)
+    ours = link.init_data(window, min(packet_length, 9024))
+    try:
+        theirs = link.exchange(b"S", ours)
+        if theirs is None:
+            raise TransferError("the receiver didn't answer the Send-Init packet")
+        link.agree(ours, theirs)
+        for path in paths:
+            f = MappedFile(path)
+            try:
+                sent = _send_file(link, f, resume)
+            finally:
+                f.close()
+            if sent is not None:
+                result._add(path, sent)
+        try:
+            link.exchange(b"B")
+        except TransferTimeout:
+            pass  # every file was acknowledged; only the receiver's last ACK got lost
+    except TransferError as e:
+        link.error(str(e))
+        raise
+    return result._done()
+
+
+def _send_file(link, f, resume):
+    """Sends one file.  Returns the bytes sent, or None if the receiver refused it."""
+    codec = link.codec
+    link.exchange(b"F", codec.encode(os.path.basename(f.path).encode("utf-8")))
+    pos = 0
+    if link.attributes:
+        attributes = _attributes(f) + (b"+" + _tochar(1) + b"R" if resume else b"")
+        answer = codec.decode(link.exchange(b"A", codec.encode(attributes)) or b"")
+        if answer[:1] == b"N":
+            link.exchange(b"Z", b"D")
+            return None
+        have = _parse_attributes(answer[1:]).get("1")
+        if have:  # resuming: the receiver has this much
+            pos = min(int(have), f.size)
+    start = pos
+    while pos < f.size:
+        block = bytes(f.view(pos, min(pos + link.max_data, f.size)))
+        n = codec.fit(block, link.max_data)
+        link.send(b"D", codec.encode(block[:n]))
+        pos += n
+    link.exchange(b"Z")
+    return pos - start
+
+
+def receive_kermit(conn, folder, window=WINDOW, packet_length=PACKET_LENGTH, resume=False, timeout=TIMEOUT,
+                   retries=RETRIES):
+    """Receives files with Kermit into folder.  The remote must be sending (e.g. "kermit -s").
+
+    Args:
+        conn: transport or xyzmodem.Channel
+        folder (str): where the files go (the sender's folder names are dropped)
+        window (int): packets we take in flight, 1 to 31
+        packet_length (int): longest packet we take, up to 9024
+        resume (bool): carry on from the end of files already there (as if the sender had
+            asked to)
+    """
+    ch = conn if isinstance(conn, Channel) else Channel(conn)
+    result = TransferResult("kermit")
+    link = _Link(ch, result, timeout, retries)
+    make_folder(folder)
+    receiver = _Receiver(link, folder, resume)
+    try:
+        receiver.run(window, min(packet_length, 9024))
+    except TransferError as e:
+        link.error(str(e))
+        raise
+    finally:
+        receiver.close()
+    return result._done()
+
+
+class _Receiver(object):
+    """The receiving end: takes packets in any order within the window, acknowledges each,
+    NAKs the ones missing, and handles them in order."""
+    def __init__(self, link, folder, resume):
+        self.link = link
+        self.folder = folder
+        self.resume = resume
+        self.expected = 0
+        self.early = {}  # seq -> packet that arrived before the ones before it
+        self.missing = set()  # seqs NAKed already
+        self.out = None
+        self.path = None
+        self.written = 0
+        self.attributes = {}
+        self.done = False
+
+    def run(self, window, packet_length):
+        link = self.link
+        self.ours = link.init_data(window, packet_length)
+        waits = 0
+        while not self.done:
+            try:
+                packet = link.read_packet(link.timeout)
+            except TransferTimeout:
+                waits += 1
+                if waits >= link.retries:
+                    raise
+                link.nak(self.expected)
+                continue
+            waits = 0
+            if packet is None:  # garbled: ask for the one we're waiting for
+                link.result.errors += 1
+                link.nak(self.expected)
+                continue
+            seq = packet[0]
+            ahead = (seq - self.expected) % 64
+            if ahead == 0:
+                self.handle(packet)
+                while self.expected in self.early and not self.done:
+                    self.handle(self.early.pop(self.expected), acked=True)
+            elif ahead < link.window:
+                if packet[1] == b"D" and seq not in self.early:
+                    self.early[seq] = packet
+                    link.ack(seq)
+                    for missing in range(self.expected, self.expected + ahead):
+                        missing %= 64
+                        if missing not in self.early and missing not in self.missing:
+                            self.missing.add(missing)
+                            link.nak(missing)
+            elif (self.expected - seq) % 64 <= link.window and seq in link.sent_acks:
+                link.ch.write(link.sent_acks[seq])  # we've had it: our ACK got lost
+
+    def handle(self, packet, acked=False):
+        link = self.link
+        seq, kind, data = packet
+        self.expected = (seq + 1) % 64
+        self.missing.discard(seq)
+        if kind == b"S":
+            link.ack(seq, self.ours)
+            link.agree(self.ours, data)
+        elif kind == b"F":
+            name = link.codec.decode(data).decode("utf-8", "replace").replace("\\", "/")
+            self.path = os.path.join(self.folder, os.path.basename(name) or "kermit.bin")
+            self.attributes = {}
+            self.out = None
+            link.ack(seq, link.codec.encode(os.path.basename(self.path).encode("utf-8")))
+        elif kind == b"A":
+            self.attributes = _parse_attributes(link.codec.decode(data))
+            answer = b"Y"
+            if self.resume or self.attributes.get("+") == "R":
+                have = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                size = str(have).encode("ascii")
+                answer += b"1" + _tochar(len(size)) + size
+                self._open(have)
+            link.ack(seq, link.codec.encode(answer))
+        elif kind == b"D":
+            if self.out is None:
+                self._open(0)
+            chunk = link.codec.decode(data)
+            self.out.write(chunk)
+            self.written += len(chunk)
+            if not acked:
+                link.ack(seq)
+        elif kind == b"Z":
+            if self.out is None and data != b"D":
+                self._open(0)  # an empty file
+            self._close_file(discard=data == b"D")
+            link.ack(seq)
+        elif kind == b"B":
+            link.ack(seq)
+            self.done = True
+        elif kind == b"E":
+            raise TransferCancelled("the sender gave up: {}".format(link.codec.decode(data).decode("utf-8", "replace")))
+        else:
+            link.ack(seq)
+        if kind != b"D":
+            self.early.clear()
+
+    def _open(self, have):
+        self.out = open(self.path, "ab" if have else "wb")
+        self.written = 0
+
+    def _close_file(self, discard):
+        if self.out is None:
+            return
+        self.out.close()
+        self.out = None
+        if discard:
+            return
+        size = self.attributes.get("1")
+        if size and size.isdigit() and os.path.getsize(self.path) != int(size):
+            raise TransferError("{} is {} bytes, the sender said {}".format(
+                self.path, os.path.getsize(self.path), size))
+        date = self.attributes.get("#")
+        if date:
+            try:
+                mtime = time.mktime(time.strptime(date, "%Y%m%d %H:%M:%S"))
+                os.utime(self.path, (mtime, mtime))
+            except ValueError:
+                pass
+        self.link.result._add(self.path, self.written)
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+
+
+#####
+# loopback benchmark
+
+def delay_line(delay, loss=0.0, seed=1):
+    """A connected pair of transports with delay seconds of latency each way (a relay thread
+    in between, like a slow WAN link): where windows pay off.  With loss, that share of the
+    chunks relayed lose a run of bytes, like overruns on a noisy line (seed makes it the same
+    every time)."""
+    ours, near = socket.socketpair()
+    theirs, far = socket.socketpair()
+    thread = threading.Thread(target=_relay, args=(near, far, delay, loss, random.Random(seed)))
+    thread.daemon = True
+    thread.start()
+    return transport.SocketTransport(ours), transport.SocketTransport(theirs)
+
+
+def _relay(a, b, delay, loss, rng):
+    peer = {a: b, b: a}
+    queued = collections.deque()  # (when due, socket, data)
+    try:
+        while True:
+            wait = max(queued[0][0] - time.time(), 0) if queued else None
+            for s in select.select([a, b], [], [], wait)[0]:
+                data = s.recv(65536)
+                if not data:
+                    return
+                if loss and rng.random() < loss:
+                    cut = rng.randrange(len(data))
+                    data = data[:cut] + data[rng.randrange(cut, len(data)) + 1:]
+                    if not data:
+                        continue
+                queued.append((time.time() + delay, peer[s], data))
+            while queued and queued[0][0] <= time.time():
+                _, s, data = queued.popleft()
+                s.sendall(data)
+    except (IOError, OSError):
+        pass
+    finally:
+        a.close()
+        b.close()
+
+
+def bench(megabytes=4, delay=0.02, windows=(1, WINDOW), folder=None):
+    """Sends a file of random data over a delay_line() with each window size.  Returns
+    {window: TransferResult}, for the sending side."""
+    import tempfile
+    folder = folder or tempfile.mkdtemp(prefix="kermit-")
+    source = os.path.join(folder, "image.bin")
+    with open(source, "wb") as f:
+        for _ in range(megabytes):
+            f.write(os.urandom(1024 * 1024))
+    received = os.path.join(folder, "received")
+    results = {}
+    for window in windows:
+        ours, theirs = delay_line(delay) if delay else loopback()
+        thread = threading.Thread(target=receive_kermit, args=(theirs, received))
+        thread.start()
+        try:
+            results[window] = send_kermit(ours, [source], window=window)
+        finally:
+            thread.join()
+            ours.close()
+            theirs.close()
+        if os.path.getsize(os.path.join(received, "image.bin")) != os.path.getsize(source):
+            raise TransferError("window {}: the received file is the wrong size".format(window))
+    return results
+
+
+def main(argv):
+    if len(argv) not in (2, 3, 4) or argv[1] != "bench":
+        print(__doc__.split("\n\n")[-1])
+        return 2
+    megabytes = int(argv[2]) if len(argv) > 2 else 4
+    delay = float(argv[3]) / 1000 if len(argv) > 3 else 0.02
+    for window, result in sorted(bench(megabytes, delay).items()):
+        print("window {:2} {:8.2f} MB/s {:8.3f} CPU s/MB".format(window, result.rate, result.cpu_per_mb))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -4,8 +4,29 @@
 SecureCRT script to open a webbrowser to a local port which is proxied to a
 remote host through this SSH session.
 """
+import os
+import sys
 import webbrowser
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # SecureCRT doesn't put the script's directory on the path
+
+from find_localport import is_listening
+from forward_registry import ForwardRegistry
+
+wait_ready = None  # Python 2 (no asyncio), or no probe.py: open the browser without probing
+if sys.version_info >= (3, 7):
+    try:
+        from probe import wait_ready
+    except ImportError:
+        pass
+
+MUX_PORT = None  # forward_mux.py needs Python 3.7+
+if sys.version_info >= (3, 7):
+    try:
+        from forward_mux import MUX_PORT
+    except ImportError:
+        pass
+
 # Detect if this script is being run by SecureCRT Python.  If not, then try to load my
 # hacky mock SecureCRT "API", so that my PyCharm/iPython/IDE can help me w/ docstrings
 # and auto-complete (because VanDyke's API doc kinda sucks).
@@ -17,9 +38,37 @@ except (AssertionError, ImportError):
     pass
 
 
+def find_forward(tab):
+    """This tab's forward (registered by connect.py, under the tab's index and caption), or None."""
+    forwards = ForwardRegistry().for_tab(tab)
+    return forwards[0] if forwards else None
+
+
+def caption_lport(tab):
+    """The local proxy port at the end of the tab's caption (tabs opened by an older
+    connect.py only have it there), or None.  Only for tabs with no forward in the registry:
+    a renamed tab's caption may end in some other number."""
+    try:
+        return int(tab.Caption.split()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
 tab = crt.GetActiveTab()
-# get SSH local proxy port from tab caption
-# (should have been set there by connect.py)
-l_lport = tab.Caption.split()[-1]
+forward = find_forward(tab)
+l_lport = forward.local_port if forward else caption_lport(tab)
 
-webbrowser.open("http://127.0.0.1:{}".format(l_lport))
+if l_lport is None:
+    crt.Dialog.MessageBox("No local proxy port found for this tab: connect it with connect.py.", "openThruProxy.py")
+else:
+    # don't open the browser before the forward is really up (that just gives a blank tab)
+    ready = wait_ready(l_lport, timeout=15) if wait_ready else None
+    if ready is None or ready.ok:
+        if forward and MUX_PORT and is_listening(MUX_PORT):
+            # forward_mux.py is running: go through it, so each host keeps one origin (and its
+            # cookies); it routes by the host name connect.py registered
+            webbrowser.open("http://{}.localhost:{}".format(forward.host, MUX_PORT))
+        else:
+            webbrowser.open("http://127.0.0.1:{}".format(l_lport))
+    else:
+        crt.Dialog.MessageBox(ready.report(), "openThruProxy.py")
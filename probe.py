@@ -0,0 +1,129 @@
+"""
+Readiness probe for local port forwards: is anything really there yet?
+
+An SSH /LOCAL forward accepts connections locally as soon as SecureCRT has bound the port,
+even if the remote end isn't reachable (the SSH server then just closes the channel).  So
+besides a TCP connect, the probe can send an HTTP HEAD and wait for the first byte of a
+reply.  It retries with bounded exponential backoff, measures connect and first-byte
+latency, and can probe many forwards at once:
+
+    result = wait_ready(53879)
+    if not result.ok:
+        print(result.report())
+
+    results = probe_many([53879, 53880, 53881], http=False)
+
+Needs Python 3 (asyncio).
+"""
+import asyncio
+import time
+
+
+class ProbeResult(object):
+    """Outcome of probing one forward.  Latencies are in milliseconds, from the last attempt."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.ok = False
+        self.attempts = 0
+        self.connect_ms = None
+        self.first_byte_ms = None
+        self.status = None  # HTTP status line, when probing with HEAD
+        self.error = None  # last error seen
+        self.elapsed = 0.0  # seconds spent probing
+
+    def report(self):
+        """One-line human readable summary."""
+        where = "{}:{}".format(self.host, self.port)
+        if self.ok:
+            latency = "connect {:.1f}ms".format(self.connect_ms)
+            if self.first_byte_ms is not None:
+                latency += ", first byte {:.1f}ms ({})".format(self.first_byte_ms, self.status)
+            return "{} ready after {:.2f}s, {} attempt(s): {}".format(where, self.elapsed, self.attempts, latency)
+        return "{} NOT ready after {:.2f}s, {} attempt(s); last error: {}".format(
+            where, self.elapsed, self.attempts, self.error)
+
+    def __repr__(self):
+        return "<ProbeResult {}>".format(self.report())
+
+
+async def _attempt(result, http, attempt_timeout):
+    """One connect (+ HEAD).  Fills in latencies and returns True if the forward answered."""
+    started = time.time()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(result.host, result.port), attempt_timeout)
+    try:
+        result.connect_ms = (time.time() - started) * 1000
+        if not http:
+            return True
+        writer.write("HEAD / HTTP/1.0\r\nHost: {}:{}\r\n\r\n".format(result.host, result.port).encode("ascii"))
+        sent = time.time()
+        line = await asyncio.wait_for(reader.readline(), attempt_timeout)
+        if not line:
+            # typical of an SSH forward whose far end isn't reachable
+            raise ConnectionError("connection closed without a reply")
+        result.first_byte_ms = (time.time() - sent) * 1000
+        result.status = line.decode("latin-1").strip()
+        return True
+    finally:
+        writer.close()
+
+
+async def probe(port, host="127.0.0.1", http=True, timeout=15.0, attempt_timeout=2.0,
+                backoff=0.05, max_backoff=1.0):
+    """Probes host:port until it answers or timeout seconds have passed.
+
+    Args:
+        port (int): local port of the forward
+        host (str): address it listens on
+        http (bool): also send an HTTP HEAD, and wait for the first byte of the reply
+        timeout (float): give up after this many seconds
+        attempt_timeout (float): limit for each connect, and for each wait for a reply
+        backoff (float): delay after the first failed attempt; doubles each time...
+        max_backoff (float): ...up to this
+    Returns:
+        ProbeResult
+    """
+    result = ProbeResult(host, port)
+    started = time.time()
+    deadline = started + timeout
+    delay = backoff
+    while True:
+        result.attempts += 1
+        result.connect_ms = result.first_byte_ms = None
+        try:
+            left = max(deadline - time.time(), 0.001)
+            result.ok = await _attempt(result, http, min(attempt_timeout, left))
+        except asyncio.TimeoutError:
+            result.error = "timed out"
+        except OSError as e:
+            result.error = str(e) or e.__class__.__name__
+        if result.ok or time.time() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_backoff)
+    result.elapsed = time.time() - started
+    return result
+
+
+async def probe_all(ports, host="127.0.0.1", **kwargs):
+    """Probes many forwards concurrently.  ports can hold ints, or (host, port) pairs."""
+    targets = [p if isinstance(p, tuple) else (host, p) for p in ports]
+    return await asyncio.gather(*[probe(p, h, **kwargs) for h, p in targets])
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def wait_ready(port, host="127.0.0.1", **kwargs):
+    """Synchronous probe() for plain scripts.  Returns a ProbeResult."""
+    return _run(probe(port, host, **kwargs))
+
+
+def probe_many(ports, host="127.0.0.1", **kwargs):
+    """Synchronous probe_all().  Returns a list of ProbeResults, in the same order as ports."""
+    return _run(probe_all(ports, host, **kwargs))
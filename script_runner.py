@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+"""
+A warm script runner: one long-lived Python process, with fake_scrt (and the modules our
+scripts use) already imported, runs script files on request over a local socket.  A run
+then costs the script's own work, not an interpreter start and a few hundred imports.
+
+    python script_runner.py serve &                       # once (or run --start)
+    python script_runner.py run connect.py myhost         # as often as you like
+    python script_runner.py run --timings connect.py myhost
+    python script_runner.py stats / stop
+
+Each run gets a fresh globals namespace (__name__ "__main__", __file__, and crt), its own
+sys.argv (which crt.Arguments reads) and working directory; its output is streamed back
+to the client, and the client exits with the script's exit status.  Runs are timed:
+startup (request to the script's first line), exec and teardown.
+
+What stays warm between runs: imported modules, compiled scripts (until the file
+changes), and the mock's state (tabs stay open, as in SecureCRT).  When a module that
+was imported from a script's folder changes on disk, that folder's modules are imported
+afresh on the next run.  Runs are one at a time (stdout, argv and the working directory
+are process-wide); other clients wait their turn.
+
+The runner listens on a Unix socket (only the user can connect) or, where there are none,
+on a localhost port with a random token; either way its address is in STATE_FILE.  The
+client side imports as little as it can (no argparse on the "run" path): its own start-up
+is what's left of a script's.  A program that runs many scripts can call run() instead.
+
+Needs Python 3.
+"""
+import json
+import os
+import socket
+import sys
+import time
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+
+STATE_FILE = os.path.expanduser("~/.scrt_runner.json")
+PRELOAD = ("fake_scrt", "inventory", "find_localport", "forward_registry", "probe", "csv", "webbrowser")
+CRT = "fake_scrt:SecureCRT"  # what scripts get as crt: module:callable, called for every run
+START_TIMEOUT = 10  # seconds, for run --start to bring up a runner
+clock = time.perf_counter
+
+
+class RunResult(object):
+    """How a run went.  Timings are in seconds."""
+    def __init__(self, path):
+        self.path = path
+        self.status = "ok"  # or "error" (an exception), "exit" (sys.exit() with a non-zero status)
+        self.exit_code = 0
+        self.error = None  # the traceback
+        self.startup = None  # from the request to the script's first line
+        self.exec = None
+        self.teardown = None
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return "<RunResult {} {} startup {:.1f}ms exec {:.1f}ms teardown {:.1f}ms>".format(
+            self.path, self.status, self.startup * 1000, self.exec * 1000, self.teardown * 1000)
+
+
+class _Stream(object):
+    """A script's stdout/stderr: writes go to the client as they're made."""
+    def __init__(self, send, name):
+        self.send = send
+        self.name = name
+        self.encoding = "utf-8"
+
+    def write(self, text):
+        if text:
+            self.send({"stream": self.name, "data": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class Runner(object):
+    """Runs scripts in this process, with preloaded modules.
+
+    Args:
+        preload (list): modules to import up front
+        crt (str): "module:callable" giving each run's crt; None: scripts make their own
+    """
+    def __init__(self, preload=PRELOAD, crt=CRT):
+        import importlib
+        if this_dir not in sys.path:
+            sys.path.insert(0, this_dir)
+        started = clock()
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except Exception:  # e.g. not on this platform: the script can import it itself
+                pass
+        self.crt = crt
+        self.preload_seconds = clock() - started
+        self.runs = 0
+        self.totals = {"startup": 0.0, "exec": 0.0, "teardown": 0.0}
+        self._code = {}  # path -> (mtime, size, code object)
+        self._folders = set([this_dir])  # where scripts (and their own modules) live
+        self._watched = {}  # module name -> (file, mtime when imported)
+        self._watch_new_modules()
+
+    def run(self, path, args=(), cwd=None, stdout=None, stderr=None):
+        """Runs a script file as __main__.  Returns a RunResult."""
+        import builtins
+        import importlib
+        import traceback
+        started = clock()
+        cwd = cwd or os.getcwd()
+        path = os.path.abspath(os.path.join(cwd, path))
+        result = RunResult(path)
+        saved = (list(sys.argv), list(sys.path), os.getcwd(), sys.stdout, sys.stderr)
+        namespace = None
+        try:
+            try:
+                folder = os.path.dirname(path)
+                if folder not in self._folders:
+                    self._folders.add(folder)
+                self._forget_changed_modules()
+                code = self._compile(path)
+                namespace = {"__name__": "__main__", "__file__": path, "__builtins__": builtins,
+                             "__doc__": None, "__package__": None}
+                if self.crt:
+                    module, _, name = self.crt.partition(":")
+                    namespace["crt"] = getattr(importlib.import_module(module), name)()
+                sys.argv[:] = [path] + list(args)
+                sys.path.insert(0, folder)
+                os.chdir(cwd)
+                sys.stdout = stdout or sys.stdout
+                sys.stderr = stderr or sys.stderr
+            except Exception:
+                result.status, result.exit_code, result.error = "error", 1, traceback.format_exc()
+                code = None
+            ran = clock()
+            result.startup = ran - started
+            if code is not None:
+                try:
+                    exec(code, namespace)
+                except SystemExit as e:
+                    if e.code is None or e.code == 0:
+                        pass
+                    elif isinstance(e.code, int):
+                        result.status, result.exit_code = "exit", e.code
+                    else:
+                        result.status, result.exit_code = "exit", 1
+                        _write_quietly(sys.stderr, "{}\n".format(e.code))
+                except BaseException:
+                    result.status, result.exit_code, result.error = "error", 1, traceback.format_exc()
+                    _write_quietly(sys.stderr, result.error)
+            done = clock()
+        finally:
+            # whatever the script (or its client) did, the next run gets a clean process
+            sys.argv[:], sys.path[:] = saved[0], saved[1]
+            try:
+                os.chdir(saved[2])
+            except OSError:
+                pass
+            sys.stdout, sys.stderr = saved[3], saved[4]
+            if namespace is not None:
+                namespace.clear()  # the script's objects go now, not at some later gc
+        result.exec = done - ran
+        self._watch_new_modules()
+        result.teardown = clock() - done
+        self.runs += 1
+        for name in self.totals:
+            self.totals[name] += getattr(result, name)
+        return result
+
+    def stats(self):
+        """Runs so far, and mean timings (ms)."""
+        means = dict((name + "_ms", total / self.runs * 1000 if self.runs else None)
+                     for name, total in self.totals.items())
+        return dict(runs=self.runs, preload_ms=self.preload_seconds * 1000, pid=os.getpid(),
+                    modules=len(sys.modules), **means)
+
+    def _compile(self, path):
+        st = os.stat(path)
+        cached = self._code.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+        with open(path, "rb") as f:
+            code = compile(f.read(), path, "exec")
+        self._code[path] = (st.st_mtime, st.st_size, code)
+        return code
+
+    def _watch_new_modules(self):
+        """Notes the modules imported from the scripts' folders, and their files' mtimes."""
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, "__file__", None)
+            if name in self._watched or not filename or os.path.dirname(filename) not in self._folders:
+                continue
+            try:
+                self._watched[name] = (filename, os.stat(filename).st_mtime)
+            except OSError:
+                pass
+
+    def _forget_changed_modules(self):
+        """If a watched module's file has changed, drops every module from its folder, so
+        they're all imported afresh (a module keeps references to the others' objects)."""
+        stale = set()
+        for name, (filename, mtime) in self._watched.items():
+            try:
+                if os.stat(filename).st_mtime != mtime:
+                    stale.add(os.path.dirname(filename))
+            except OSError:
+                stale.add(os.path.dirname(filename))
+        if not stale:
+            return
+        for name, (filename, mtime) in list(self._watched.items()):
+            if os.path.dirname(filename) in stale:
+                sys.modules.pop(name, None)
+                del self._watched[name]
+
+
+#####
+# the server
+
+def serve(runner=None, state_file=STATE_FILE):
+    """Serves run requests until told to stop."""
+    runner = runner or Runner()
+    token = os.urandom(16).hex()
+    if hasattr(socket, "AF_UNIX"):
+        address = os.path.splitext(state_file)[0] + ".sock"
+        if os.path.exists(address):
+            os.remove(address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # only the user can connect
+        try:
+            server.bind(address)
+        finally:
+            os.umask(umask)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        address = server.getsockname()
+    server.listen(64)
+    _write_state(state_file, {"address": address, "token": token, "pid": os.getpid()})
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                if _handle(runner, conn, token) == "stop":
+                    return
+            except (IOError, OSError, ValueError):  # the client went away, or sent junk
+                pass
+            finally:
+                conn.close()
+    finally:
+        server.close()
+        for name in (state_file, address):
+            if isinstance(name, str) and os.path.exists(name):
+                os.remove(name)
+
+
+def _handle(runner, conn, token):
+    reader = conn.makefile("rb")
+    request = json.loads(reader.readline().decode("utf-8"))
+
+    def send(message):
+        conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+    if request.get("token") != token:
+        send({"done": True, "status": "error", "exit_code": 1, "error": "bad token"})
+        return None
+    op = request.get("op")
+    if op == "run":
+        result = runner.run(request["path"], request.get("args", []), request.get("cwd"),
+                            _Stream(send, "stdout"), _Stream(send, "stderr"))
+        send(dict(result.to_dict(), done=True))
+    elif op == "stats":
+        send(dict(runner.stats(), done=True))
+    elif op == "stop":
+        send({"done": True})
+        return "stop"
+    return None
+
+
+def _write_quietly(stream, text):
+    """Writes a script's error to its stderr, unless that's gone (e.g. the client hung up)."""
+    try:
+        stream.write(text)
+    except Exception:
+        pass
+
+
+def _write_state(state_file, state):
+    temporary = "{}.{}.tmp".format(state_file, os.getpid())
+    with os.fdopen(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump(state, f)
+    os.replace(temporary, state_file)
+
+
+#####
+# the client
+
+def request(message, state_file=STATE_FILE, stdout=None, stderr=None):
+    """Sends a request to the runner, copying streamed output to stdout/stderr.  Returns the
+    final message (for "run": RunResult's fields, plus "round_trip")."""
+    started = clock()
+    with open(state_file) as f:
+        state = json.load(f)
+    address = state["address"]
+    if isinstance(address, str):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = tuple(address)
+    try:
+        conn.connect(address)
+        conn.sendall(json.dumps(dict(message, token=state["token"])).encode("utf-8") + b"\n")
+        streams = {"stdout": stdout or sys.stdout, "stderr": stderr or sys.stderr}
+        for line in conn.makefile("rb"):
+            reply = json.loads(line.decode("utf-8"))
+            if reply.get("done"):
+                reply["round_trip"] = clock() - started
+                return reply
+            streams[reply["stream"]].write(reply["data"])
+            streams[reply["stream"]].flush()
+    finally:
+        conn.close()
+    raise IOError("the runner hung up")
+
+
+def run(path, args=(), cwd=None, state_file=STATE_FILE, stdout=None, stderr=None):
+    """Runs a script in the runner.  Returns RunResult's fields (a dict), plus "round_trip"."""
+    return request({"op": "run", "path": os.path.abspath(path), "args": list(args), "cwd": cwd or os.getcwd()},
+                   state_file, stdout, stderr)
+
+
+def running(state_file=STATE_FILE):
+    """True if a runner answers."""
+    try:
+        request({"op": "stats"}, state_file)
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+    return True
+
+
+def start(state_file=STATE_FILE, timeout=START_TIMEOUT):
+    """Starts a runner in the background (if one isn't running), and waits until it answers."""
+    import subprocess
+    if running(state_file):
+        return
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "--state-file", state_file, "serve"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     close_fds=True, start_new_session=True)
+    deadline = time.time() + timeout
+    while not running(state_file):
+        if time.time() > deadline:
+            raise IOError("the runner didn't start within {}s".format(timeout))
+        time.sleep(0.05)
+
+
+def _run_command(script, args, state_file, timings=False, start_first=False):
+    if start_first:
+        start(state_file)
+    result = run(script, args, state_file=state_file)
+    if timings:
+        sys.stderr.write("startup {:.2f}ms, exec {:.2f}ms, teardown {:.2f}ms, round trip {:.2f}ms\n".format(
+            result["startup"] * 1000, result["exec"] * 1000, result["teardown"] * 1000,
+            result["round_trip"] * 1000))
+    return result["exit_code"]
+
+
+def _quick_run(argv):
+    """[--state-file F] run [--timings] [--start] script args..., parsed without argparse.
+    Returns _run_command's args, or None for anything else."""
+    state_file = STATE_FILE
+    if argv[:1] == ["--state-file"] and len(argv) > 1:
+        state_file, argv = argv[1], argv[2:]
+    if argv[:1] != ["run"]:
+        return None
+    flags = {"--timings": False, "--start": False}
+    argv = argv[1:]
+    while argv and argv[0] in flags:
+        flags[argv.pop(0)] = True
+    if not argv or argv[0].startswith("-"):
+        return None
+    return argv[0], argv[1:], state_file, flags["--timings"], flags["--start"]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    quick = _quick_run(argv)
+    if quick:
+        return _run_command(*quick)
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--state-file", default=STATE_FILE)
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="run the runner (in the foreground)")
+    serve_parser.add_argument("--preload", nargs="*", default=PRELOAD, help="modules to import up front")
+    serve_parser.add_argument("--crt", default=CRT, help="module:callable making each run's crt ('' for none)")
+    run_parser = commands.add_parser("run", help="run a script in the runner")
+    run_parser.add_argument("--timings", action="store_true", help="print the run's timings to stderr")
+    run_parser.add_argument("--start", action="store_true", help="start a runner first, if none is running")
+    run_parser.add_argument("script")
+    run_parser.add_argument("args", nargs=argparse.REMAINDER)
+    commands.add_parser("stats", help="show the runner's run count and mean timings")
+    commands.add_parser("stop", help="stop the runner")
+    cfg = parser.parse_args(argv)
+
+    if cfg.command == "serve":
+        serve(Runner(cfg.preload, cfg.crt or None), cfg.state_file)
+        return 0
+    if cfg.command == "run":
+        return _run_command(cfg.script, cfg.args, cfg.state_file, cfg.timings, cfg.start)
+    if cfg.command in ("stats", "stop"):
+        reply = request({"op": cfg.command}, cfg.state_file)
+        if cfg.command == "stats":
+            print(json.dumps(dict((k, v) for k, v in reply.items() if k not in ("done", "round_trip")),
+                             indent=2, sort_keys=True))
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Scrollback for fake_scrt.Screen: the lines that have scrolled off the top of the screen.
+
+Lines are kept as latin-1 bytes (like vt100.Terminal's rows).  add() just keeps the row it
+is given; every BLOCK_LINES lines, they are packed newline-separated (trailing blanks
+stripped) into a block with an array of line offsets, and the blocks form a ring: once more
+than max_lines are held, the oldest block goes.  Each block is indexed by the words in it
+(sorted forwards and backwards, for prefix and suffix lookups), so a search skips every
+block that can't contain the words of the text (or of the literal parts of a regular
+expression), and scans the rest with one regex pass over the block (in C), not line by
+line.  A word at the edge of the text may be only part of a word in the line, e.g. "%Error"
+finds "%Errors", so it's looked up as a prefix (or suffix).  A block's index (and its line
+offsets) is built the first time a search gets to it, and kept, so repeated searches only
+pay for blocks added since the last one, and output nobody searches costs next to nothing.
+
+Lines are numbered from 1, counting every line ever added, so a line keeps its number as
+the oldest lines are dropped:
+
+    mark = screen.scrollback.total
+    ...  # send a command, wait for the prompt
+    errors = screen.scrollback.find("%Error", since=mark + 1)   # [(line number, text)]
+"""
+import array
+import bisect
+import collections
+import re
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+MAX_LINES = 200000
+BLOCK_LINES = 1024
+
+_WORD_RE = re.compile(br"\w+")
+# bytes.translate() table turning everything but word characters (as in _WORD_RE) into spaces
+_WORD_BYTES = bytearray(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+_NON_WORD_TO_SPACE = bytes(bytearray(c if c in _WORD_BYTES else 32 for c in range(256)))
+
+_LINE_START = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING, sre_parse.AT_BOUNDARY)
+_LINE_END = (sre_parse.AT_END, sre_parse.AT_END_STRING, sre_parse.AT_BOUNDARY)
+
+
+class _Terms(object):
+    """What a block must have for a search to match in it: whole words, word prefixes and
+    word suffixes (lowercased bytes)."""
+    __slots__ = ("words", "prefixes", "suffixes")
+
+    def __init__(self):
+        self.words = set()
+        self.prefixes = set()
+        self.suffixes = set()
+
+    def __bool__(self):
+        return bool(self.words or self.prefixes or self.suffixes)
+    __nonzero__ = __bool__
+
+    def add(self, literal, bounded_start=False, bounded_end=False):
+        """Adds the words of literal, text that matching lines contain.  bounded_start/_end:
+        literal starts/ends at a line start/end or word boundary, so a word there isn't part
+        of a longer one."""
+        literal = literal.lower()
+        for m in _WORD_RE.finditer(literal):
+            starts = m.start() > 0 or bounded_start
+            ends = m.end() < len(literal) or bounded_end
+            if starts and ends:
+                self.words.add(m.group())
+            elif starts:
+                self.prefixes.add(m.group())
+            elif ends:
+                self.suffixes.add(m.group())
+            # a word with neither end known could be anywhere in a word: no lookup for it
+
+    @classmethod
+    def of_pattern(cls, pattern, flags):
+        """The terms of the runs of literal characters at the top level of a regular
+        expression (bytes): they have to be in any line it matches."""
+        terms = cls()
+        try:
+            parsed = list(sre_parse.parse(pattern, flags))
+        except Exception:
+            return terms  # re.compile() will say what's wrong with it
+        run = bytearray()
+        bounded_start = False  # whether the current run follows a line start or word boundary
+        for op, value in parsed + [(None, None)]:
+            if op == sre_parse.LITERAL and value < 256:
+                run.append(value)
+                continue
+            bounded_end = op == sre_parse.AT and value in _LINE_END
+            if run:
+                terms.add(bytes(run), bounded_start, bounded_end)
+                run = bytearray()
+            bounded_start = op == sre_parse.AT and value in _LINE_START
+        return terms
+
+
+def _matching_lines(pattern, data, offsets, index):
+    """Yields (index, end offset) of the lines of a block, from index on, that pattern matches.
+    The block is scanned in one regex pass until a match runs on past the end of its line
+    (e.g. with \\s+ or [^x]*); from there, it goes a line at a time."""
+    count = len(offsets)
+    pos = offsets[index]
+    while True:
+        m = pattern.search(data, pos)
+        if m is None or m.start() == len(data):  # (past the last line's newline: "^$" matches there)
+            return
+        index = bisect.bisect_right(offsets, m.start()) - 1
+        line_end = offsets[index + 1] if index + 1 < count else len(data)
+        if m.end() < line_end:
+            yield index, line_end
+            pos = line_end
+            continue
+        while index < count:
+            line_end = offsets[index + 1] if index + 1 < count else len(data)
+            if pattern.search(data, offsets[index], line_end - 1):  # the line on its own
+                yield index, line_end
+            index += 1
+        return
+
+
+class _Block(object):
+    """Packed lines: their text, where each starts, and the words in them."""
+    __slots__ = ("first", "count", "data", "_words", "_offsets", "_sorted", "_reversed")
+
+    def __init__(self, first, lines):
+        self.first = first  # line number of the first line
+        self.count = len(lines)
+        self.data = bytes(bytearray(b"\n").join([line.rstrip(b" ") for line in lines]) + b"\n")
+        self._words = None
+        self._offsets = None
+        self._sorted = None  # the words, sorted
+        self._reversed = None  # the words spelt backwards, sorted
+
+    @property
+    def words(self):
+        """The (lowercased) words in the block."""
+        if self._words is None:
+            self._words = frozenset(self.data.lower().translate(_NON_WORD_TO_SPACE).split())
+        return self._words
+
+    def has(self, terms):
+        """False if the block can't hold a line with all of terms (a _Terms)."""
+        if terms.words and not terms.words <= self.words:
+            return False
+        if terms.prefixes:
+            if self._sorted is None:
+                self._sorted = sorted(self.words)
+            if not all(_has_prefix(self._sorted, prefix) for prefix in terms.prefixes):
+                return False
+        if terms.suffixes:
+            if self._reversed is None:
+                self._reversed = sorted(word[::-1] for word in self.words)
+            if not all(_has_prefix(self._reversed, suffix[::-1]) for suffix in terms.suffixes):
+                return False
+        return True
+
+    @property
+    def offsets(self):
+        """Where each line starts in data."""
+        if self._offsets is None:
+            self._offsets = offsets = array.array("I")
+            pos = 0
+            for line in self.data.split(b"\n")[:-1]:
+                offsets.append(pos)
+                pos += len(line) + 1
+        return self._offsets
+
+
+def _has_prefix(sorted_words, prefix):
+    i = bisect.bisect_left(sorted_words, prefix)
+    return i < len(sorted_words) and sorted_words[i].startswith(prefix)
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode("latin-1", "replace")
+
+
+class Scrollback(object):
+    """Ring buffer of lines, with search (see module docstring).
+
+    Args:
+        max_lines (int): how many lines to keep
+    """
+    def __init__(self, max_lines=MAX_LINES):
+        self.max_lines = max_lines
+        self._blocks = collections.deque()  # full blocks, oldest first
+        self._pending = []  # lines not packed into a block yet
+        self._first = 1  # line number of the first pending line
+
+    @property
+    def total(self):
+        """Lines ever added: the newest line's number."""
+        return self._first + len(self._pending) - 1
+
+    def add(self, line):
+        """Adds a line (bytes/bytearray, latin-1), e.g. from vt100.Terminal.on_scroll.  The
+        line is kept as it is, so don't change it afterwards."""
+        pending = self._pending
+        pending.append(line)
+        if len(pending) >= BLOCK_LINES:
+            self._seal()
+
+    def _seal(self):
+        self._blocks.append(_Block(self._first, self._pending))
+        self._first += len(self._pending)
+        self._pending = []
+        # drop whole blocks that are past max_lines
+        while self._blocks and self.total - (self._blocks[0].first + BLOCK_LINES - 1) >= self.max_lines:
+            self._blocks.popleft()
+
+    def clear(self):
+        self._blocks.clear()
+        self._first = self.total + 1
+        self._pending = []
+
+    @property
+    def first(self):
+        """Number of the oldest line still held."""
+        held = self._blocks[0].first if self._blocks else self._first
+        return max(held, self.total - self.max_lines + 1, 1)
+
+    def __len__(self):
+        return self.total - self.first + 1
+
+    def lines(self, start=None, end=None):
+        """Text of lines start..end (line numbers, inclusive; default: everything held)."""
+        start = max(self.first if start is None else start, self.first)
+        end = min(self.total if end is None else end, self.total)
+        out = []
+        for first, data, offsets in self._parts(start):
+            lo = max(start - first, 0)
+            hi = min(end - first + 1, len(offsets))
+            if lo >= hi:
+                continue
+            stop = offsets[hi] if hi < len(offsets) else len(data)
+            out.extend(data[offsets[lo]:stop].decode("latin-1").split(u"\n")[:-1])
+        return out
+
+    def find(self, text, last=None, since=None, ignore_case=False, limit=None):
+        """Lines containing text: [(line number, text)], oldest first.
+
+        Args:
+            text (str): what to look for
+            last (int): only look in the last this many lines
+            since (int): only look in lines from this line number on
+            ignore_case (bool): case-insensitive
+            limit (int): stop after this many lines (the oldest ones are returned)
+        """
+        needle = _to_bytes(text)
+        terms = _Terms()
+        terms.add(needle)
+        pattern = re.compile(re.escape(needle), re.IGNORECASE if ignore_case else 0)
+        return self._search(pattern, terms, last, since, limit)
+
+    def search(self, pattern, last=None, since=None, ignore_case=False, limit=None):
+        """Lines matching a regular expression (str, searched per line: "^" and "$" match at
+        line start/end, and a match never runs on into the next line, even with \\s or [^x]).
+        Args and return value as for find()."""
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        pattern = _to_bytes(pattern)
+        return self._search(re.compile(pattern, flags), _Terms.of_pattern(pattern, flags), last, since, limit)
+
+    def _search(self, pattern, terms, last, since, limit):
+        start = self.first
+        if last is not None:
+            start = max(start, self.total - last + 1)
+        if since is not None:
+            start = max(start, since)
+        found = []
+        if start > self.total:
+            return found
+        for first, data, offsets in self._parts(start, terms):
+            for index, line_end in _matching_lines(pattern, data, offsets, start - first if start > first else 0):
+                found.append((first + index, data[offsets[index]:line_end - 1].decode("latin-1")))
+                if limit and len(found) >= limit:
+                    return found
+        return found
+
+    def _parts(self, start, terms=None):
+        """Yields (first line number, data, offsets) of each block holding lines from start
+        on, skipping full blocks that don't have all of terms (a _Terms)."""
+        for block in self._blocks:
+            if block.first + block.count <= start:
+                continue
+            if terms and not block.has(terms):
+                continue
+            yield block.first, block.data, block.offsets
+        if self._pending:
+            block = _Block(self._first, self._pending)
+            yield block.first, block.data, block.offsets
@@ -0,0 +1,424 @@
+"""
+SecureCRT's saved sessions (the .ini files under Config/Sessions) for the mock API:
+what crt.OpenSessionConfiguration() and SessionConfig read and write.
+
+    db = SessionDatabase("/home/me/.vandyke/SecureCRT/Config/Sessions")
+    db.find_host("10.1.1.1")           # ["lab/rtr1"]
+    options = db.load("lab/rtr1")      # {name: (type, value)}, e.g. "Hostname": ("S", "10.1.1.1")
+    db.save("lab/rtr2", options)       # queued; written by flush(), when the batch fills, or at exit
+
+It's meant for big trees (tens of thousands of sessions), so a lookup doesn't read them all:
+- the index (session path -> mtime, size and Hostname) is built on first use, by reading each
+  file once and picking the Hostname line out with a regex (no parsing), and kept on disk
+  (INDEX_FOLDER), with the mtime of each folder
+- at most every REFRESH_SECONDS, the folders are stat()ed: only when one has changed (a
+  session was added, removed or renamed) are all the files stat()ed, and the changed ones
+  re-read
+- the sessions a lookup finds are stat()ed, in case they were edited in place; a lookup that
+  finds nothing stats all the files (at most every REFRESH_SECONDS), in case one was edited
+  to match
+- a session's options are parsed when it's loaded, and kept until its file changes
+- saves are queued, and written BATCH_SIZE at a time (with one write of the index)
+
+Session paths are relative to the folder, with "/" and without ".ini", e.g. "lab/rtr1";
+"Default" is the Default session.  Option types are as in the files: "S" string, "D" number,
+"Z" list of strings, "B" bytes (a bytearray).
+"""
+import atexit
+import collections
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+REFRESH_SECONDS = 2.0
+BATCH_SIZE = 64
+INDEX_FOLDER = tempfile.gettempdir()
+
+_FOLDER_DATA = "__FolderData__.ini"  # a folder's own settings, not a session
+_OPTION_RE = re.compile(u'^([SDZB]):"([^"]*)"=(.*)$')
+_HOSTNAME_RE = re.compile(b'(?:^|\\A\xef\xbb\xbf)S:"Hostname"=([^\r\n]*)', re.MULTILINE)  # maybe after the BOM
+_BOM = b"\xef\xbb\xbf"
+
+_replace = getattr(os, "replace", os.rename)  # Python 2: rename (replaces, except on Windows)
+
+
+def default_folder():
+    """$SCRT_SESSIONS, or where SecureCRT keeps sessions on this platform."""
+    if os.environ.get("SCRT_SESSIONS"):
+        return os.environ["SCRT_SESSIONS"]
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("APPDATA", ""), "VanDyke", "Config", "Sessions")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Application Support/VanDyke/SecureCRT/Config/Sessions")
+    return os.path.expanduser("~/.vandyke/SecureCRT/Config/Sessions")
+
+
+def parse(data):
+    """A session file's options: {name: (type, value)}, in file order.
+
+    Args:
+        data (bytes): the file's contents
+    """
+    if data.startswith(_BOM):
+        data = data[len(_BOM):]
+    lines = data.decode("utf-8", "replace").splitlines()
+    options = collections.OrderedDict()
+    i = 0
+    while i < len(lines):
+        m = _OPTION_RE.match(lines[i])
+        i += 1
+        if not m:
+            continue
+        kind, name, value = m.groups()
+        if kind == "S":
+            options[name] = (kind, value)
+        elif kind == "D":
+            options[name] = (kind, int(value, 16))
+        elif kind == "Z":  # the number of lines (in hex), then the lines, each indented a space
+            count = int(value, 16)
+            options[name] = (kind, [line[1:] for line in lines[i:i + count]])
+            i += count
+        else:  # "B": the number of bytes (in hex), then lines of hex bytes
+            size = int(value, 16)
+            data = bytearray()
+            while len(data) < size and i < len(lines):
+                data += bytearray(int(h, 16) for h in lines[i].split())
+                i += 1
+            options[name] = (kind, data[:size])
+    return options
+
+
+def serialize(options, newline="\r\n"):
+    """A session file's contents (bytes, with a BOM, as SecureCRT writes them)."""
+    lines = []
+    for name, (kind, value) in options.items():
+        if kind == "S":
+            lines.append(u'S:"{}"={}'.format(name, value))
+        elif kind == "D":
+            lines.append(u'D:"{}"={:08x}'.format(name, value & 0xffffffff))
+        elif kind == "Z":
+            lines.append(u'Z:"{}"={:08x}'.format(name, len(value)))
+            lines.extend(u" " + line for line in value)
+        else:
+            value = bytearray(value)
+            lines.append(u'B:"{}"={:08x}'.format(name, len(value)))
+            for i in range(0, len(value), 16):
+                lines.append(u" " + u" ".join("{:02x}".format(b) for b in value[i:i + 16]))
+    return _BOM + (newline.join(lines) + newline).encode("utf-8")
+
+
+def option_type(value):
+    """The option type for a new option's value."""
+    if isinstance(value, (bool, int)) or type(value).__name__ == "long":
+        return "D"
+    if isinstance(value, (list, tuple)):
+        return "Z"
+    if isinstance(value, bytearray):
+        return "B"
+    return "S"
+
+
+def convert(kind, value):
+    """value as an option of type kind."""
+    if kind == "D":
+        return int(value)
+    if kind == "Z":
+        return [u"{}".format(line) for line in value]
+    if kind == "B":
+        return bytearray(value)
+    return value if isinstance(value, type(u"")) else u"{}".format(value)
+
+
+class SessionDatabase(object):
+    """The sessions in a folder tree of SecureCRT session files.
+
+    Args:
+        folder (str): SecureCRT's Config/Sessions folder; default: default_folder()
+        index_file (str): where the index is kept between runs; default: one in INDEX_FOLDER
+            for the folder (None)
+        batch_size (int): queued saves are written once there are this many
+    """
+    def __init__(self, folder=None, index_file=None, batch_size=BATCH_SIZE):
+        self.folder = os.path.abspath(folder or default_folder())
+        if index_file is None:
+            digest = hashlib.md5(self.folder.encode("utf-8")).hexdigest()[:12]
+            index_file = os.path.join(INDEX_FOLDER, "scrt-sessions-{}.json".format(digest))
+        self.index_file = index_file
+        self.batch_size = batch_size
+        self._index = None  # path -> [mtime, size, Hostname]
+        self._folders = None  # folder path ("" for the top) -> mtime, when the index was built
+        self._hosts = None  # lowercase Hostname -> set of paths
+        self._checked = 0  # when the index was last checked against the folders
+        self._rescanned = 0  # when every file was last checked (after a lookup found nothing)
+        self._loaded = {}  # path -> (mtime, size, options), parsed sessions
+        self._pending = collections.OrderedDict()  # path -> options, queued saves
+        self._exit_hook = False
+
+    def __len__(self):
+        return len(self.paths())
+
+    def __contains__(self, path):
+        return self._normalize(path) in self._pending or self._normalize(path) in self._fresh_index()
+
+    def paths(self, folder=None):
+        """Every session's path (sorted), or the ones under folder (e.g. "lab")."""
+        paths = set(self._fresh_index()) | set(self._pending)
+        if folder:
+            prefix = self._normalize(folder) + "/"
+            paths = [path for path in paths if path.startswith(prefix)]
+        return sorted(paths)
+
+    def find_host(self, hostname):
+        """The paths (sorted) of the sessions for hostname (not case sensitive)."""
+        self._fresh_index()
+        key = hostname.lower()
+        self._check_files(list(self._hosts.get(key, ())))
+        if not self._hosts.get(key) and time.time() - self._rescanned > REFRESH_SECONDS:
+            self._refresh()  # maybe a session was edited to have this Hostname
+            self._rescanned = time.time()
+        paths = set(self._hosts.get(key, ()))
+        paths.update(path for path, options in self._pending.items()
+                     if options.get("Hostname", (None, u""))[1].lower() == hostname.lower())
+        return sorted(paths)
+
+    def hostname(self, path):
+        """A session's Hostname (from the index: the file isn't parsed), or None."""
+        path = self._normalize(path)
+        if path in self._pending:
+            return self._pending[path].get("Hostname", (None, None))[1]
+        if path in self._fresh_index():
+            self._check_files([path])
+        entry = self._index.get(path)
+        return entry[2] if entry else None
+
+    def load(self, path):
+        """A copy of a session's options: {name: (type, value)}, in file order.  Empty for a
+        session that doesn't exist (yet)."""
+        path = self._normalize(path)
+        options = self._pending.get(path)
+        if options is None:
+            options = self._parsed(path)
+        return collections.OrderedDict((name, (kind, list(value) if kind == "Z" else value))
+                                       for name, (kind, value) in options.items())
+
+    def save(self, path, options):
+        """Queues a session's options to be written to its file (see flush())."""
+        self._pending[self._normalize(path)] = options
+        if not self._exit_hook:
+            atexit.register(self.flush)
+            self._exit_hook = True
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the queued saves, and the index."""
+        if not self._pending:
+            return
+        index = self._fresh_index()
+        pending, self._pending = self._pending, collections.OrderedDict()
+        for path, options in pending.items():
+            filename = self._filename(path)
+            newline = self._newline(filename)
+            folder = os.path.dirname(filename)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            temporary = filename + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(serialize(options, newline))
+            _replace(temporary, filename)
+            st = os.stat(filename)
+            self._loaded[path] = (st.st_mtime, st.st_size, options)
+            self._set_entry(path, [st.st_mtime, st.st_size, options.get("Hostname", (None, None))[1]])
+            if self._folders is not None:  # these changes are in the index already
+                self._folders[path.rpartition("/")[0]] = os.stat(folder).st_mtime
+        self._write_index(index)
+
+    #####
+    # the index
+
+    def _fresh_index(self):
+        """The index, checked against the folders if that's more than REFRESH_SECONDS ago
+        (and against every file, if a folder has changed)."""
+        if self._index is None:
+            self._index, self._folders = self._read_index()
+            self._hosts = collections.defaultdict(set)
+            for path, entry in self._index.items():
+                if entry[2]:
+                    self._hosts[entry[2].lower()].add(path)
+            self._checked = 0
+        if time.time() - self._checked > REFRESH_SECONDS:
+            if self._folders_changed():
+                self._refresh()
+            self._checked = time.time()
+        return self._index
+
+    def _folders_changed(self):
+        """True if a session may have been added, removed or renamed since the index was
+        built: a folder's mtime has changed (or it's gone)."""
+        if not self._folders:
+            return True
+        for folder, mtime in self._folders.items():
+            try:
+                if os.stat(os.path.join(self.folder, *folder.split("/"))).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _refresh(self):
+        """Checks the index against the files: re-reads the Hostname of the new and changed
+        ones, and drops the gone ones."""
+        index = self._index
+        changed = False
+        seen = set()
+        folders = {}
+        for path, filename, st in self._walk(folders):
+            seen.add(path)
+            entry = index.get(path)
+            if entry is not None and entry[0] == st.st_mtime and entry[1] == st.st_size:
+                continue
+            changed = self._reread(path, filename, st) or changed
+        for path in set(index) - seen:
+            self._set_entry(path, None)
+            changed = True
+        if folders != self._folders:
+            self._folders = folders
+            changed = True
+        if changed:
+            self._write_index(index)
+
+    def _check_files(self, paths):
+        """Checks the index entries of paths against their files."""
+        changed = False
+        for path in paths:
+            filename = self._filename(path)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                self._set_entry(path, None)
+                changed = True
+                continue
+            entry = self._index.get(path)
+            if entry is None or entry[0] != st.st_mtime or entry[1] != st.st_size:
+                changed = self._reread(path, filename, st) or changed
+        if changed:
+            self._write_index(self._index)
+
+    def _reread(self, path, filename, st):
+        """Updates a session's index entry from its file.  Returns False if it can't be read."""
+        try:
+            with open(filename, "rb") as f:
+                m = _HOSTNAME_RE.search(f.read())
+        except (IOError, OSError):
+            return False
+        host = m.group(1).decode("utf-8", "replace") if m else None
+        self._set_entry(path, [st.st_mtime, st.st_size, host])
+        return True
+
+    def _set_entry(self, path, entry):
+        old = self._index.pop(path, None)
+        if old and old[2]:
+            self._hosts[old[2].lower()].discard(path)
+        if entry is not None:
+            self._index[path] = entry
+            if entry[2]:
+                self._hosts[entry[2].lower()].add(path)
+
+    def _walk(self, folders, folder=None, prefix=""):
+        """(path, filename, stat) for every session file.  Each folder's mtime goes in folders
+        (by its path: "" for the top, then e.g. "lab")."""
+        if not hasattr(os, "scandir"):  # Python 2
+            for path, filename in self._listing(folders):
+                try:
+                    yield path, filename, os.stat(filename)
+                except OSError:  # gone since the listing
+                    pass
+            return
+        folder = folder or self.folder
+        try:
+            folders[prefix[:-1]] = os.stat(folder).st_mtime  # before the listing: a change after it shows next time
+            entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+        except OSError:
+            return
+        for entry in entries:
+            name = entry.name
+            try:
+                if entry.is_dir():
+                    for found in self._walk(folders, entry.path, prefix + name + "/"):
+                        yield found
+                elif name.endswith(".ini") and name != _FOLDER_DATA:
+                    yield prefix + name[:-4], entry.path, entry.stat()
+            except OSError:  # gone since the listing
+                pass
+
+    def _listing(self, folders):
+        for folder, dirs, files in os.walk(self.folder):
+            dirs.sort()
+            relative = os.path.relpath(folder, self.folder).replace(os.sep, "/")
+            prefix = "" if relative == "." else relative + "/"
+            try:
+                folders[prefix[:-1]] = os.stat(folder).st_mtime
+            except OSError:
+                continue
+            for name in files:
+                if name.endswith(".ini") and name != _FOLDER_DATA:
+                    yield prefix + name[:-4], os.path.join(folder, name)
+
+    def _read_index(self):
+        try:
+            with open(self.index_file) as f:
+                saved = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}, None
+        if not isinstance(saved, dict) or saved.get("folder") != self.folder:
+            return {}, None
+        return saved.get("sessions", {}), saved.get("folders")
+
+    def _write_index(self, index):
+        temporary = "{}.{}.tmp".format(self.index_file, os.getpid())
+        try:
+            with open(temporary, "w") as f:
+                json.dump({"folder": self.folder, "folders": self._folders, "sessions": index}, f)
+            _replace(temporary, self.index_file)
+        except (IOError, OSError):  # the index is only a cache
+            pass
+
+    #####
+    # sessions
+
+    def _parsed(self, path):
+        """A session's options, parsed (again, if the file has changed)."""
+        filename = self._filename(path)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            self._loaded.pop(path, None)
+            return collections.OrderedDict()
+        cached = self._loaded.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+        with open(filename, "rb") as f:
+            options = parse(f.read())
+        self._loaded[path] = (st.st_mtime, st.st_size, options)
+        return options
+
+    def _filename(self, path):
+        return os.path.join(self.folder, *(path + ".ini").split("/"))
+
+    @staticmethod
+    def _normalize(path):
+        path = path.replace("\\", "/").strip("/")
+        return path[:-4] if path.lower().endswith(".ini") else path
+
+    @staticmethod
+    def _newline(filename):
+        """The line ending an existing file uses (SecureCRT's: CRLF on Windows)."""
+        try:
+            with open(filename, "rb") as f:
+                return "\r\n" if b"\r\n" in f.read(4096) else "\n"
+        except (IOError, OSError):
+            return os.linesep
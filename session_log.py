@@ -0,0 +1,317 @@
+"""
+Session logging for the mock SecureCRT API: what Session.Log(True) and
+Session.LogUsingSessionOptions() write.
+
+Logging must never hold up Send/WaitFor*, so SessionLog.write() only appends the data to
+the log's bounded in-memory queue.  One background thread, shared by every log, takes it
+from there and writes everything queued for a file in one large buffered write.  If the
+writer ever falls PENDING_BYTES behind on a log, data is dropped (and counted in
+SessionLog.dropped) rather than blocking the session.
+
+Logs rotate when they reach max_bytes, or are rotate_seconds old.  A rotated file is
+compressed (gzip, or zstd with the zstandard package) in the background.
+
+The log file name may contain SecureCRT's substitutions:
+    %H host      %S session name    %P port    %U username
+    %Y year      %M month           %D day
+    %h hour      %m minute          %s second  %t milliseconds
+    %I tab index (a mock extension)  %% a percent sign
+e.g. "/var/log/scrt/%H-%Y%M%D-%h%m%s.log".  If a rotated log's name doesn't change (no time
+in it), the old file is renamed with a timestamp suffix.
+"""
+import atexit
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# defaults for new logs
+MAX_BYTES = 64 * 1024 * 1024  # rotate at this size (None: never)
+ROTATE_SECONDS = None  # rotate logs this old (None: never)
+COMPRESS = "gzip"  # rotated logs: "gzip", "zstd" or None
+
+PENDING_BYTES = 16 * 1024 * 1024  # per log, waiting to be written
+BUFFER_SIZE = 64 * 1024  # per open log file; the writer thread already batches queued chunks
+FLUSH_SECONDS = 1.0  # buffered data reaches the file at least this often
+
+_TOKEN_RE = re.compile("%([HSPUYMDhmstI%])")
+
+
+def expand_filename(template, fields=None, now=None):
+    """Substitutes %H, %Y etc. (see module docstring) in a log file name.
+
+    Args:
+        template (str): file name, e.g. Session.LogFileName
+        fields (dict): "host", "session", "port", "username", "tab_index"
+        now (float): time to use for the date/time substitutions; default is now
+    """
+    fields = fields or dict()
+    now = time.time() if now is None else now
+    t = time.localtime(now)
+    values = {
+        "H": fields.get("host"), "S": fields.get("session"), "P": fields.get("port"),
+        "U": fields.get("username"), "I": fields.get("tab_index"),
+        "Y": "{:04d}".format(t.tm_year), "M": "{:02d}".format(t.tm_mon), "D": "{:02d}".format(t.tm_mday),
+        "h": "{:02d}".format(t.tm_hour), "m": "{:02d}".format(t.tm_min), "s": "{:02d}".format(t.tm_sec),
+        "t": "{:03d}".format(int(now * 1000) % 1000), "%": "%",
+    }
+    return _TOKEN_RE.sub(lambda m: "" if values[m.group(1)] is None else str(values[m.group(1)]), template)
+
+
+class SessionLog(object):
+    """One session's log.  write() is safe to call from anywhere, and never blocks.
+
+    Args:
+        template (str): log file name, with substitutions (see module docstring)
+        fields (dict): values for the substitutions; see expand_filename()
+        append (bool): append to the file if it exists, instead of overwriting it
+        max_bytes (int): rotate at this size
+        rotate_seconds (float): rotate when the file is this old
+        compress (str): "gzip", "zstd" or None, for rotated files
+    """
+    def __init__(self, template, fields=None, append=False, max_bytes=-1, rotate_seconds=-1, compress=-1):
+        # -1: the module default at the time
+        max_bytes = MAX_BYTES if max_bytes == -1 else max_bytes
+        rotate_seconds = ROTATE_SECONDS if rotate_seconds == -1 else rotate_seconds
+        compress = COMPRESS if compress == -1 else compress
+        if compress not in (None, "gzip", "zstd"):
+            raise ValueError("Unknown log compression: {!r}".format(compress))
+        if compress == "zstd" and zstandard is None:
+            raise ImportError("zstd log compression needs the zstandard package (pip install zstandard)")
+        self.template = template
+        self.fields = dict(fields or ())
+        self.append = append
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.path = expand_filename(template, self.fields)  # current file (the writer thread may change it)
+        self.dropped = 0  # bytes dropped because the writer was too far behind
+        self.error = None  # last error writing the file
+        self.rotated = []  # files rotated out (as compressed, if compressing)
+        self._lock = threading.Lock()
+        self._pending = []  # chunks not yet handed to the writer thread
+        self._pending_bytes = 0
+        self._queued = False  # the writer thread has been told about _pending
+        # the writer thread's own state
+        self._file = None
+        self._size = 0
+        self._opened = 0
+        self._closed = False
+
+    def write(self, data):
+        """Queues bytes for the log file."""
+        if not data:
+            return
+        with self._lock:
+            if self._pending_bytes + len(data) > PENDING_BYTES:
+                self.dropped += len(data)
+                return
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            wake, self._queued = not self._queued, True
+        if wake:
+            _writer().put(self)
+
+    def flush(self, timeout=10.0):
+        """Waits (up to timeout seconds) until everything written so far is in the file."""
+        return _writer().request(self, "flush", timeout)
+
+    def close(self, timeout=10.0):
+        """Writes out what's queued, and closes the file.  Further writes are ignored."""
+        return _writer().request(self, "close", timeout)
+
+    def __repr__(self):
+        return "<SessionLog {}>".format(self.path)
+
+    #####
+    # called by the writer thread only
+
+    def _take(self):
+        with self._lock:
+            chunks, self._pending = self._pending, []
+            self._pending_bytes = 0
+            self._queued = False
+        return chunks
+
+    def _write(self):
+        chunks = self._take()
+        if not chunks or self._closed:
+            return
+        data = b"".join(chunks)
+        try:
+            if self._file is None:
+                self._open(self.append)
+            elif self._due(len(data)):
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+        except (IOError, OSError) as e:
+            self.error = str(e)
+            self.dropped += len(data)
+
+    def _due(self, incoming):
+        if self.max_bytes and self._size and self._size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened >= self.rotate_seconds
+
+    def _open(self, append):
+        self.path = expand_filename(self.template, self.fields)
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._file = open(self.path, "ab" if append else "wb", BUFFER_SIZE)
+        self._size = self._file.tell() if append else 0
+        self._opened = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        old = self.path
+        if expand_filename(self.template, self.fields) == old:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._opened))
+            rotated = "{}.{}".format(old, stamp)
+            n = 1
+            while os.path.exists(rotated) or os.path.exists(rotated + ".gz") or os.path.exists(rotated + ".zst"):
+                n += 1
+                rotated = "{}.{}-{}".format(old, stamp, n)
+            os.rename(old, rotated)
+            old = rotated
+        self._open(True)
+        if self.compress:
+            thread = threading.Thread(target=_compress, args=(old, self.compress))
+            thread.daemon = True
+            thread.start()
+            _compressing.append(thread)
+            old += ".gz" if self.compress == "gzip" else ".zst"
+        self.rotated.append(old)
+
+    def _flush(self):
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except (IOError, OSError) as e:
+                self.error = str(e)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _compress(path, method):
+    """Compresses a rotated log to path.gz / path.zst, and removes the original."""
+    if method == "gzip":
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst, BUFFER_SIZE)
+    else:
+        with open(path, "rb") as src, open(path + ".zst", "wb") as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+    os.remove(path)
+
+
+class _Writer(object):
+    """The background thread that does the file I/O for every SessionLog.  Its queue holds
+    logs with data to write (each log at most once), and flush/close requests."""
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._open = set()  # logs with an open file
+        self._flushed = time.time()
+        self._thread = threading.Thread(target=self._run, name="session_log")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, log):
+        self._queue.put(log)
+
+    def request(self, log, action, timeout):
+        """Asks for a "flush", "close" (or for log None, "flush" every log, or "stop"), and
+        waits up to timeout seconds for it to be done."""
+        done = threading.Event()
+        self._queue.put((log, action, done))
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_SECONDS)
+            except queue.Empty:
+                self._flush_all()
+                continue
+            if isinstance(item, SessionLog):
+                self._write(item)
+            elif not self._handle(*item):
+                return
+            if time.time() - self._flushed >= FLUSH_SECONDS:
+                self._flush_all()
+
+    def _handle(self, log, action, done):
+        """Carries out a request.  Returns False for "stop"."""
+        try:
+            if log is None:
+                if action == "stop":
+                    return False
+                for each in list(self._open):
+                    self._write(each)
+                self._flush_all()
+            else:
+                self._write(log)
+                log._flush()
+                if action == "close":
+                    log._close()
+                    log._closed = True
+                    self._open.discard(log)
+        finally:
+            done.set()
+        return True
+
+    def _write(self, log):
+        log._write()
+        if log._file is not None:
+            self._open.add(log)
+
+    def _flush_all(self):
+        for log in list(self._open):
+            log._flush()
+        self._flushed = time.time()
+
+
+_compressing = []  # threads compressing rotated logs
+_writer_lock = threading.Lock()
+_the_writer = []
+
+
+def _writer():
+    if not _the_writer:
+        with _writer_lock:
+            if not _the_writer:
+                _the_writer.append(_Writer())
+    return _the_writer[0]
+
+
+def flush_all(timeout=10.0):
+    """Waits until everything logged so far (by every log) is in the files, and rotated logs
+    are compressed."""
+    deadline = time.time() + timeout
+    if _the_writer:
+        _the_writer[0].request(None, "flush", timeout)
+    while _compressing:
+        _compressing.pop().join(max(deadline - time.time(), 0))
+
+
+@atexit.register
+def _shutdown():
+    flush_all()
+    if _the_writer:
+        _the_writer[0].request(None, "stop", 1.0)
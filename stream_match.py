@@ -0,0 +1,125 @@
+"""
+Streaming multi-string matcher (Aho-Corasick), used by fake_scrt.Screen's WaitForString(s)
+and ReadString to find the first of many prompts in the incoming data in a single pass.
+
+Compiled automatons are cached by (strings, ignore_case), so a script that waits on the same
+prompt list over and over only builds it once.  Each wait gets its own cheap Scanner, which
+keeps its position in the automaton between chunks, so a match split across two reads of
+the remote is still found.
+"""
+import re
+
+_CACHE_SIZE = 256
+_cache = dict()
+
+
+def compile_strings(strings, ignore_case=False):
+    """Returns the (cached) Automaton matching any of strings."""
+    key = (tuple(strings), bool(ignore_case))
+    automaton = _cache.get(key)
+    if automaton is None:
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        automaton = _cache[key] = Automaton(strings, ignore_case)
+    return automaton
+
+
+def fold_case(text):
+    """Lower-cases text without changing its length, so match offsets stay valid."""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # a few characters (e.g. U+0130) lower-case to more than one character
+        folded = u"".join([c if len(c.lower()) != 1 else c.lower() for c in text])
+    return folded
+
+
+class Automaton(object):
+    """Aho-Corasick automaton for a list of strings, flattened into a DFA.
+
+    Matching reports the string that ends earliest in the input; when several end at the same
+    character, the one that comes first in the list wins.  Indexes are 1-based, like the
+    values SecureCRT's WaitForStrings returns.
+    """
+    def __init__(self, strings, ignore_case=False):
+        self.strings = list(strings)
+        self.ignore_case = ignore_case
+        patterns = [fold_case(s) if ignore_case else s for s in self.strings]
+        self.lengths = [len(p) for p in patterns]
+        # index of an empty string, which matches before any input at all
+        self.empty_index = self.lengths.index(0) + 1 if 0 in self.lengths else 0
+
+        goto = [dict()]
+        out = [0]
+        for index, pattern in enumerate(patterns, 1):
+            state = 0
+            for char in pattern:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = goto[state][char] = len(goto)
+                    goto.append(dict())
+                    out.append(0)
+                state = nxt
+            if not out[state]:
+                out[state] = index
+
+        # breadth-first: failure links, inherited outputs and the full transition table
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        queue = list(goto[0].values())
+        i = 0
+        while i < len(queue):
+            state = queue[i]
+            i += 1
+            table = delta[state] = dict(delta[fail[state]])
+            table.update(goto[state])
+            inherited = out[fail[state]]
+            if inherited and (not out[state] or inherited < out[state]):
+                out[state] = inherited
+            for char, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(char, 0)
+                queue.append(nxt)
+        self._delta = delta
+        self._out = out
+        first = set(p[0] for p in patterns if p)
+        self._skip = re.compile(u"[{}]".format(u"".join(re.escape(c) for c in sorted(first)))).search \
+            if first else None
+
+    def scanner(self):
+        """Returns a new Scanner positioned at the start of the automaton."""
+        return Scanner(self)
+
+
+class Scanner(object):
+    """Incremental matching state for one wait: feed it chunks with scan()."""
+    def __init__(self, automaton):
+        self.automaton = automaton
+        self.state = 0
+
+    def scan(self, text, pos=0):
+        """Scans text from pos.  Returns (index, end) for the first match, where end is the
+        offset in text just past the matched string, or None if nothing matched (yet)."""
+        automaton = self.automaton
+        if automaton.empty_index:
+            return automaton.empty_index, pos
+        if automaton.ignore_case:
+            text = fold_case(text)
+        delta, out, skip = automaton._delta, automaton._out, automaton._skip
+        if skip is None:
+            return None  # no strings to look for
+        state = self.state
+        end = len(text)
+        while pos < end:
+            if not state:
+                # at the root, jump straight to the next character that can start a string
+                m = skip(text, pos)
+                if m is None:
+                    break
+                pos = m.start()
+            state = delta[state].get(text[pos], 0)
+            pos += 1
+            if out[state]:
+                self.state = 0
+                return out[state], pos
+        self.state = state
+        return None
@@ -0,0 +1,246 @@
+"""
+A pool of connected, logged-in tabs, keyed by host, so scripts that keep going back to the
+same devices log in once instead of every time.
+
+    pool = crt.pool  # or tab_pool.TabPool(crt, max_size=32, login=my_login)
+    with pool.tab("rtr1") as tab:
+        tab.Screen.Send("show clock\\r")
+        tab.Screen.WaitForString("rtr1#", 5)
+    print(pool.stats())
+
+get() hands out an idle tab for the host if there is one (most recently used first), after
+a health check: the session must still be connected, and a return at the prompt the tab was
+left at must bring the prompt back within check_timeout seconds.  Otherwise it opens one:
+a Clone() of a tab already connected to the host if there is one (with SSH2 that skips the
+handshake), else crt.Session.ConnectInTab(), then login(tab) if the pool has a login.
+
+release() puts a tab back, discard() closes it.  Idle tabs are closed once idle for
+idle_timeout seconds or found dead, and the least recently used one goes when a new tab
+would take the pool over max_size.  Tabs the script opened itself can be taken in with
+adopt().
+"""
+import collections
+import contextlib
+import threading
+import time
+
+MAX_SIZE = 16  # tabs, idle and in use
+IDLE_TIMEOUT = 300  # seconds
+CHECK_TIMEOUT = 5  # seconds, for the prompt to come back in a health check
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolFull(PoolError):
+    """Every tab in the pool is in use."""
+
+
+class _Entry(object):
+    __slots__ = ("tab", "host", "prompt", "last_used")
+
+    def __init__(self, tab, host):
+        self.tab = tab
+        self.host = host
+        self.prompt = None  # what the screen showed left of the cursor when the tab was released
+        self.last_used = time.time()
+
+
+class TabPool(object):
+    """Connected tabs, by host.
+
+    Args:
+        crt: the SecureCRT object (default: fake_scrt's)
+        max_size (int): most tabs open at once, idle and in use
+        idle_timeout (float): seconds a tab may sit idle before it's closed
+        arguments (str): Connect() arguments for a host ("{host}" is filled in)
+        login: callable(tab) run on every new tab; a falsy result (or one whose ok is False)
+            means it failed
+        check_timeout (float): seconds for the prompt to come back in a health check
+    """
+    def __init__(self, crt=None, max_size=MAX_SIZE, idle_timeout=IDLE_TIMEOUT, arguments="/SSH2 {host}",
+                 login=None, check_timeout=CHECK_TIMEOUT):
+        self._crt = crt
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.arguments = arguments
+        self.login = login
+        self.check_timeout = check_timeout
+        self._idle = collections.OrderedDict()  # tab -> _Entry, least recently used first
+        self._busy = dict()  # tab -> _Entry
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.clones = 0
+        self.evictions = 0  # idle tabs closed: timed out, dead, or to make room
+        self.failed_checks = 0
+
+    @property
+    def crt(self):
+        if self._crt is None:
+            from fake_scrt import SecureCRT
+            self._crt = SecureCRT
+        return self._crt
+
+    def get(self, host, arguments=None):
+        """Returns a connected (and logged in) tab for host, from the pool if possible.
+
+        Args:
+            host (str): hostname (not case-sensitive)
+            arguments (str): Connect() arguments, if a tab has to be opened (default: the pool's)
+        """
+        host = host.lower()
+        with self._lock:
+            self._sweep()
+            for tab in reversed(list(self._idle)):
+                entry = self._idle[tab]
+                if entry.host != host:
+                    continue
+                del self._idle[tab]
+                if self._healthy(entry):
+                    self.hits += 1
+                    entry.last_used = time.time()
+                    self._busy[tab] = entry
+                    return tab
+                self.failed_checks += 1
+                self._close(entry)
+            self._make_room()  # (PoolFull: not a miss, nothing was opened)
+            self.misses += 1
+            entry = self._open(host, arguments)
+            self._busy[entry.tab] = entry
+            return entry.tab
+
+    def release(self, tab):
+        """Gives a tab back to the pool, for the next get() for its host."""
+        with self._lock:
+            entry = self._busy.pop(tab, None)
+            if entry is None:
+                return
+            entry.prompt = _prompt(tab)
+            entry.last_used = time.time()
+            self._idle[tab] = entry
+            self._sweep()
+
+    def discard(self, tab):
+        """Closes a tab the pool gave out (e.g. after it went wrong) instead of releasing it."""
+        with self._lock:
+            entry = self._busy.pop(tab, None) or self._idle.pop(tab, None)
+            if entry is not None:
+                self._close(entry)
+
+    @contextlib.contextmanager
+    def tab(self, host, arguments=None):
+        """get() as a context manager: the tab is released at the end of the with block, or
+        discarded if it raised."""
+        tab = self.get(host, arguments)
+        try:
+            yield tab
+        except BaseException:
+            self.discard(tab)
+            raise
+        self.release(tab)
+
+    def adopt(self):
+        """Takes the connected tabs open in crt that aren't in the pool yet into it as idle
+        tabs, by their RemoteAddress.  Returns how many."""
+        crt = self.crt
+        adopted = 0
+        with self._lock:
+            for index in range(1, crt.GetTabCount() + 1):
+                tab = crt.GetTab(index)
+                if tab in self._idle or tab in self._busy:
+                    continue
+                if tab.Screen._transport is None or not tab.Session.Connected:  # never connected, or gone
+                    continue
+                if len(self) >= self.max_size:
+                    break
+                entry = _Entry(tab, tab.Session.RemoteAddress.lower())
+                entry.prompt = _prompt(tab)
+                self._idle[tab] = entry
+                adopted += 1
+        return adopted
+
+    def close(self):
+        """Closes every tab in the pool, in use or not."""
+        with self._lock:
+            for entry in list(self._idle.values()) + list(self._busy.values()):
+                self._close(entry)
+            self._idle.clear()
+            self._busy.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "clones": self.clones, "evictions": self.evictions,
+                "failed_checks": self.failed_checks, "idle": len(self._idle), "in_use": len(self._busy)}
+
+    def __len__(self):
+        return len(self._idle) + len(self._busy)
+
+    def __repr__(self):
+        return "<TabPool {} idle, {} in use, {} hits, {} misses>".format(len(self._idle), len(self._busy),
+                                                                          self.hits, self.misses)
+
+    #####
+
+    def _open(self, host, arguments):
+        """A new tab for host: a clone of one connected to it, or a new connection."""
+        tab = None
+        for entry in self._busy.values():
+            if entry.host == host and entry.tab.Session.Connected:
+                tab = entry.tab.Clone()
+                if tab is entry.tab:  # (nothing to clone from)
+                    tab = None
+                else:
+                    self.clones += 1
+                break
+        if tab is None:
+            tab = self.crt.Session.ConnectInTab((arguments or self.arguments).format(host=host))
+        if self.login is not None:
+            result = self.login(tab)
+            if not result or getattr(result, "ok", True) is False:
+                tab.Close()
+                raise PoolError("login to {} failed: {}".format(host, getattr(result, "error", None) or result))
+        return _Entry(tab, host)
+
+    def _healthy(self, entry):
+        tab = entry.tab
+        if not tab.Session.Connected:
+            return False
+        if not entry.prompt:
+            return True
+        screen = tab.Screen
+        screen._poll()
+        screen._drain()  # whatever the last user left unread
+        screen.Send("\r")
+        return bool(screen.WaitForString(entry.prompt, self.check_timeout))
+
+    def _sweep(self):
+        """Closes idle tabs that timed out or died."""
+        oldest = time.time() - self.idle_timeout
+        for tab, entry in list(self._idle.items()):
+            if entry.last_used < oldest or not tab.Session.Connected:
+                del self._idle[tab]
+                self.evictions += 1
+                self._close(entry)
+
+    def _make_room(self):
+        """Closes the least recently used idle tab if the pool is full."""
+        if len(self) < self.max_size:
+            return
+        if not self._idle:
+            raise PoolFull("all {} tabs in use".format(self.max_size))
+        _, entry = self._idle.popitem(last=False)
+        self.evictions += 1
+        self._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        entry.tab.Close()
+
+
+def _prompt(tab):
+    """The text left of the cursor: the prompt, if the tab is sitting at one."""
+    screen = tab.Screen
+    screen._poll()
+    term = screen._term
+    return term.line(term.cursor_row)[:term.cursor_col].strip()
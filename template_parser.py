@@ -0,0 +1,393 @@
+"""
+TextFSM-style templates for parsing command output into records, line by line as it
+arrives, so a 500k-line routing table never has to be held in memory as text.
+
+    ARP = template_parser.compile_template(r'''
+    Value ADDRESS (\\d+\\.\\d+\\.\\d+\\.\\d+)
+    Value AGE (\\S+)
+    Value MAC ([0-9a-f.]+)
+    Value INTERFACE (\\S+)
+
+    Start
+      ^Internet\\s+${ADDRESS}\\s+${AGE}\\s+${MAC}\\s+ARPA\\s+${INTERFACE} -> Record
+    ''')
+
+    for address, age, mac, interface in crt.Screen.read_records(ARP, send="show ip arp\\r"):
+        ...
+    table = ARP.table(crt.Screen.read_records(ARP, send="show ip arp\\r"))  # columns, not dicts
+    table.column("MAC")
+
+The template language is TextFSM's: Value lines (options Required, Filldown, List, Key),
+then states, each a list of rules "^regex -> LineAction.RecordAction NewState" (Next or
+Continue; Record, NoRecord, Clear or Clearall; Error), starting in Start, and with an
+implicit Record at the end of the input unless there's an EOF state.  Fillup isn't
+supported: it would rewrite records already handed out.
+
+compile_template() and load() cache compiled templates process-wide, by text and by file
+(path and mtime), so every tab and every call shares one compiled copy.
+"""
+import os
+import re
+import time
+
+_CACHE_SIZE = 256
+_cache = dict()
+
+_VALUE_OPTIONS = ("Required", "Filldown", "List", "Key")
+_ACTION_RE = re.compile(r"(?:(Next|Continue)(?:\.(NoRecord|Record|Clear|Clearall))?|(NoRecord|Record|Clear|Clearall))"
+                        r"(?:\s+(\w+))?$")
+_VARIABLE_RE = re.compile(r"\$\{(\w+)\}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class ParseError(Exception):
+    """An Error action in the template fired."""
+
+
+class _Value(object):
+    __slots__ = ("name", "regex", "required", "filldown", "list", "key")
+
+    def __init__(self, line):
+        parts = line.split(None, 2)
+        if len(parts) < 3:
+            raise TemplateError("bad Value line: {!r}".format(line))
+        options = []
+        if len(parts[1].split(",")) > 1 or parts[1] in _VALUE_OPTIONS or parts[1] == "Fillup":
+            options = parts[1].split(",")
+            parts = [parts[0]] + parts[2].split(None, 1)
+        if len(parts) < 3:
+            raise TemplateError("bad Value line: {!r}".format(line))
+        for option in options:
+            if option == "Fillup":
+                raise TemplateError("Fillup isn't supported: records are handed out as they're parsed")
+            if option not in _VALUE_OPTIONS:
+                raise TemplateError("unknown Value option {!r}".format(option))
+        self.name = parts[1]
+        self.regex = parts[2]
+        if not (self.regex.startswith("(") and self.regex.endswith(")")):
+            raise TemplateError("Value {} regex must be in parentheses: {!r}".format(self.name, self.regex))
+        self.required = "Required" in options
+        self.filldown = "Filldown" in options
+        self.list = "List" in options
+        self.key = "Key" in options
+
+
+class _Rule(object):
+    __slots__ = ("match", "targets", "groups", "line_action", "record_action", "new_state", "error", "source")
+
+    def __init__(self, line, values, header):
+        self.source = line
+        regex, arrow, action = line.rpartition(" ->")
+        if not arrow:
+            regex, action = line, ""
+        regex, action = regex.strip(), action.strip()
+
+        def substitute(m):
+            value = values.get(m.group(1))
+            if value is None:
+                raise TemplateError("unknown value ${{{}}} in {!r}".format(m.group(1), line))
+            return "(?P<{}>{}".format(value.name, value.regex[1:])
+        try:
+            compiled = re.compile(_VARIABLE_RE.sub(substitute, regex.replace("$$", "$")))
+        except re.error as e:
+            raise TemplateError("bad regex in {!r}: {}".format(line, e))
+        self.match = compiled.match
+        # the values the rule sets: their positions in the record, and their groups for m.group(*groups)
+        # (with group 0 added to a single one, so that m.group() still returns a tuple)
+        assign = sorted((header.index(name), group) for name, group in compiled.groupindex.items() if name in values)
+        self.targets = tuple(i for i, _ in assign)
+        self.groups = tuple(group for _, group in assign) + ((0,) if len(assign) == 1 else ())
+        self.line_action, self.record_action, self.new_state, self.error = "Next", "NoRecord", None, None
+        if action.startswith("Error"):
+            self.error = action[5:].strip().strip('"') or "Error rule: {}".format(regex)
+        elif action:
+            m = _ACTION_RE.match(action)
+            if m:
+                self.line_action = m.group(1) or "Next"
+                self.record_action = m.group(2) or m.group(3) or "NoRecord"
+                self.new_state = m.group(4)
+            elif re.match(r"\w+$", action):
+                self.new_state = action
+            else:
+                raise TemplateError("bad action in {!r}".format(line))
+            if self.line_action == "Continue" and self.new_state:
+                raise TemplateError("Continue can't change state: {!r}".format(line))
+
+
+class Template(object):
+    """A compiled template (see compile_template()).
+
+    Args:
+        text (str): the template
+    """
+    def __init__(self, text):
+        self.values = []
+        self.states = dict()
+        lines = iter(text.splitlines())
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                if self.values and not stripped:
+                    break
+                continue
+            if not stripped.startswith("Value "):
+                raise TemplateError("expected a Value line, got {!r}".format(line))
+            self.values.append(_Value(stripped))
+        by_name = dict((value.name, value) for value in self.values)
+        if not self.values or len(by_name) != len(self.values):
+            raise TemplateError("no Value lines, or two with the same name")
+        self.header = tuple(value.name for value in self.values)
+        state = None
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+            if stripped.startswith("^"):
+                if state is None:
+                    raise TemplateError("rule outside a state: {!r}".format(line))
+                self.states[state].append(_Rule(stripped, by_name, self.header))
+            elif re.match(r"\w+$", stripped):
+                state = stripped
+                if state in self.states:
+                    raise TemplateError("state {} defined twice".format(state))
+                self.states[state] = []
+            else:
+                raise TemplateError("expected a state name or a rule, got {!r}".format(line))
+        if "Start" not in self.states:
+            raise TemplateError("no Start state")
+        for name, rules in self.states.items():
+            for rule in rules:
+                if rule.new_state and rule.new_state not in self.states and rule.new_state != "End":
+                    raise TemplateError("state {} goes to unknown state {}".format(name, rule.new_state))
+        # an EOF state (normally empty) turns off the implicit Record at the end
+        self.record_at_eof = "EOF" not in self.states
+
+    def parser(self):
+        """Returns a new Parser: feed it text, get records back."""
+        return Parser(self)
+
+    def stream(self, chunks):
+        """Parses text as it comes (an iterable of str chunks, e.g. a file, or blocks read from a
+        socket), yielding each record (a tuple, in header order) as soon as it's complete."""
+        parser = Parser(self)
+        for chunk in chunks:
+            for record in parser.feed(chunk):
+                yield record
+        for record in parser.close():
+            yield record
+
+    def parse(self, text):
+        """Parses all of text into a Table."""
+        return self.table(self.stream([text]))
+
+    def table(self, records):
+        """Collects records (e.g. from stream() or Screen.read_records()) into a Table."""
+        table = Table(self.header)
+        table.extend(records)
+        return table
+
+
+class Parser(object):
+    """Incremental parsing state: feed() it text in chunks of any size."""
+    def __init__(self, template):
+        self.template = template
+        self.state = template.states["Start"]
+        self.partial = u""  # text after the last line end
+        values = template.values
+        self._record = [[] if v.list else u"" for v in values]
+        self._lists = set(i for i, v in enumerate(values) if v.list)
+        self._cleared = [i for i, v in enumerate(values) if not v.filldown]  # by Record and Clear
+        self._required = [i for i, v in enumerate(values) if v.required]
+        self._done = False
+
+    def feed(self, text):
+        """Takes text.  Returns the records completed by it."""
+        records = []
+        if self._done:
+            return records
+        lines = (self.partial + text).split(u"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            if self._line(line.rstrip(u"\r"), records):
+                break
+        return records
+
+    def close(self):
+        """Ends the input: parses the last line, if it wasn't ended.  Returns the last records."""
+        records = []
+        if not self._done:
+            if self.partial:
+                self._line(self.partial.rstrip(u"\r"), records)
+                self.partial = u""
+            if self.template.record_at_eof and not self._done:
+                self._emit(records)
+        self._done = True
+        return records
+
+    def _line(self, line, records):
+        """Runs a line through the current state's rules.  Returns True once in state End."""
+        record = self._record
+        lists = self._lists
+        for rule in self.state:
+            m = rule.match(line)
+            if m is None:
+                continue
+            for i, value in zip(rule.targets, m.group(*rule.groups)) if rule.groups else ():
+                if value is not None:
+                    if i in lists:
+                        record[i].append(value)
+                    else:
+                        record[i] = value
+            if rule.error:
+                raise ParseError("{} (line: {!r})".format(rule.error, line))
+            action = rule.record_action
+            if action == "Record":
+                self._emit(records)
+            elif action == "Clear":
+                self._clear(False)
+            elif action == "Clearall":
+                self._clear(True)
+            if rule.line_action == "Continue":
+                continue
+            if rule.new_state == "End":
+                self._done = True
+                return True
+            if rule.new_state:
+                self.state = self.template.states[rule.new_state]
+            break
+        return False
+
+    def _emit(self, records):
+        record = self._record
+        if any(record) and all(record[i] for i in self._required):
+            if self._lists:
+                records.append(tuple(tuple(value) if i in self._lists else value for i, value in enumerate(record)))
+            else:
+                records.append(tuple(record))
+        self._clear(False)
+
+    def _clear(self, everything):
+        record = self._record
+        for i in range(len(record)) if everything else self._cleared:
+            record[i] = [] if i in self._lists else u""
+
+
+class Table(object):
+    """Records stored by column, each column a list of values.  In columns with lots of
+    repeats (interfaces, next hops, ages...) the repeats share one string object; columns of
+    mostly distinct values (addresses, MACs) stop being deduplicated after INTERN_CHECK rows.
+
+    Args:
+        header (tuple): column names
+    """
+    INTERN_CHECK = 4096
+
+    def __init__(self, header):
+        self.header = tuple(header)
+        self.columns = [[] for _ in self.header]
+        self._interned = [dict() for _ in self.header]
+        self._index = dict((name, i) for i, name in enumerate(self.header))
+
+    def append(self, record):
+        for column, interned, value in zip(self.columns, self._interned, record):
+            column.append(value if interned is None else interned.setdefault(value, value))
+        if len(self.columns[0]) == self.INTERN_CHECK:
+            self._check_interning()
+
+    def extend(self, records):
+        append = self.append
+        for record in records:
+            append(record)
+
+    def _check_interning(self):
+        for i, interned in enumerate(self._interned):
+            if interned is not None and len(interned) > len(self.columns[i]) // 2:
+                self._interned[i] = None
+
+    def column(self, name):
+        return self.columns[self._index[name]]
+
+    def row(self, i):
+        return tuple(column[i] for column in self.columns)
+
+    def dicts(self):
+        """The records as dicts, one at a time."""
+        for row in self:
+            yield dict(zip(self.header, row))
+
+    def __iter__(self):
+        return iter(zip(*self.columns))
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __repr__(self):
+        return "<Table {} x {}>".format(len(self), ", ".join(self.header))
+
+
+def compile_template(text):
+    """Returns the (cached) Template for text."""
+    template = _cache.get(text)
+    if template is None:
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        template = _cache[text] = Template(text)
+    return template
+
+
+def load(path):
+    """Returns the (cached) Template in a file; it's read again if the file has changed."""
+    path = os.path.abspath(path)
+    key = (path, os.path.getmtime(path))
+    template = _cache.get(key)
+    if template is None:
+        with open(path) as f:
+            template = compile_template(f.read())
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        _cache[key] = template
+    return template
+
+
+def read_records(screen, template, send=None, prompt=None, timeout=30):
+    """Parses a screen's input with template up to the prompt, yielding records as the lines
+    arrive (see Screen.read_records())."""
+    if not isinstance(template, Template):
+        template = compile_template(template)
+    screen._poll()
+    if prompt is None:
+        term = screen._term
+        prompt = term.line(term.cursor_row)[:term.cursor_col].strip()
+        if not prompt:
+            raise ValueError("couldn't tell the prompt from the screen; pass prompt=")
+    if send:
+        screen.Send(send)
+    parser = Parser(template)
+    scanner = screen._scanner([prompt], False)
+    deadline = time.time() + timeout if timeout else None
+    keep = len(prompt)  # text that may be (the start of) the prompt is held back from the parser
+    tail = u""
+    while True:
+        captured = []
+        index = screen._consume(scanner, captured)
+        text = tail + u"".join(captured)
+        if index:
+            text, tail = text[:len(text) - keep], u""
+        else:
+            cut = max(len(text) - keep + 1, 0)
+            text, tail = text[:cut], text[cut:]
+        for record in parser.feed(text):
+            yield record
+        if index:
+            break
+        remaining = None if deadline is None else deadline - time.time()
+        if (remaining is not None and remaining <= 0) or not screen._read_more(remaining):
+            screen.MatchIndex = 0
+            for record in parser.feed(tail):  # no prompt: the held-back text is output too
+                yield record
+            break
+    for record in parser.close():
+        yield record
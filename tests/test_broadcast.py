@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import transport
+from fake_scrt import SecureCRT, Tab
+
+
+def test_file_descriptors_above_fd_setsize():
+    padding = [os.dup(0) for _ in range(1100)]  # the tabs' descriptors come after these
+    try:
+        tabs = []
+        for i in range(3):
+            transport.register("bc{}".format(i), lambda args: transport.ScriptedDevice(
+                args.hostname, responses={"show clock": "12:00:00.000 UTC"}))
+            tab = Tab()
+            tab.Session.Connect("/SSH2 bc{}".format(i))
+            assert tab.Screen.WaitForString("bc{}#".format(i), 5)
+            tabs.append(tab)
+        assert min(tab.Screen._transport.fileno() for tab in tabs) >= 1024
+        result = SecureCRT().CommandWindow.broadcast("show clock", tabs, timeout=5)
+        assert result.ok, result.summary()
+        assert all("12:00:00" in r.output for r in result)
+        for tab in tabs:
+            tab.Close()
+    finally:
+        for fd in padding:
+            os.close(fd)
+
+
+@pytest.mark.skipif(transport.pty is None or not os.path.exists("/bin/sh"), reason="needs a POSIX shell in a pty")
+def test_prompt_text_in_the_echo_does_not_end_the_command():
+    env = dict(os.environ, PS1="$ ", ENV="")
+    transport.register("bcsh", lambda args: transport.PtyTransport(["/bin/sh"], env=env))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 bcsh")
+    try:
+        assert tab.Screen.WaitForString("$ ", 5)
+        result = SecureCRT().CommandWindow.broadcast("ls /nonexistent", [tab], timeout=5, exit_status=True)
+        r = result[0]
+        assert r.status == "error" and r.exit_status not in (None, 0), (r.status, r.exit_status, r.output)
+        assert "nonexistent" in r.output and "__SCRT_RC" not in r.output and "echo" not in r.output, r.output
+        result = SecureCRT().CommandWindow.broadcast("echo $((6 * 7))", [tab], timeout=5, exit_status=True)
+        assert result[0].ok and result[0].exit_status == 0 and result[0].output.strip() == "42", result.summary()
+    finally:
+        tab.Close()
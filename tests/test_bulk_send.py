@@ -0,0 +1,59 @@
+import transport
+from fake_scrt import Tab
+
+
+def config_device(args):
+    """Takes config lines in config mode, rejects "bogus", and changes prompt like IOS."""
+    def enter(prompt):
+        def respond(command):
+            device.prompt = prompt.format(hostname=args.hostname)
+            return ""
+        return respond
+
+    responses = dict((line, "") for line in ("", "description y", "!", "hostname x"))
+    responses.update({"conf t": enter("{hostname}(config)#"), "interface x": enter("{hostname}(config-if)#"),
+                      "end": enter("{hostname}#")})
+    device = transport.ScriptedDevice(args.hostname, responses=responses)
+    return device
+
+
+def connected(host, factory=config_device):
+    transport.register(host, factory)
+    tab = Tab()
+    tab.Session.Connect("/SSH2 " + host)
+    assert tab.Screen.WaitForString(host + "#", 5)
+    return tab
+
+
+def test_blank_line_not_confirmed_by_error_output():
+    tab = connected("bulk1")
+    result = tab.Screen.send_lines(["conf t", "interface x", "", " description y", "bogus", "!", "end"],
+                                   confirm=True)
+    assert result.lost == [] and result.lines_confirmed == 7, result.summary()
+    assert [number for number, _ in result.errors] == [5], result.errors
+    tab.Close()
+
+
+def test_error_on_first_line_is_kept():
+    tab = connected("bulk2", lambda args: transport.ScriptedDevice(args.hostname, responses={"": ""}))
+    result = tab.Screen.send_lines(["interface x", "", " description y", "bogus", "!", "end"], confirm=True)
+    assert result.lost == [] and result.lines_confirmed == 6, result.summary()
+    assert [number for number, _ in result.errors] == [1, 3, 4, 5, 6], result.errors
+    tab.Close()
+
+
+def test_short_output_line_does_not_lose_earlier_lines():
+    tab = connected("bulk3")
+    tab.Screen._transport.responses["show x"] = "!\r\nhostname x\r\n"
+    result = tab.Screen.send_lines(["show x", "hostname x", "!", "end"], confirm=True)
+    assert result.lost == [] and result.lines_confirmed == 4, result.summary()
+    tab.Close()
+
+
+def test_prompts_follow_config_mode():
+    tab = connected("bulk4")
+    config = ["conf t", "interface x", " description y", "!", "end"] * 20
+    result = tab.Screen.send_lines(config)
+    assert result.ok and result.lines_confirmed == len(config) and not result.stalls, result.summary()
+    assert tab.Screen.WaitForString("bulk4#", 1)
+    tab.Close()
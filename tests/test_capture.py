@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+import capture
+import transport
+from fake_scrt import Tab
+
+
+def device(args):
+    return transport.ScriptedDevice(args.hostname, responses={"show clock": "12:00", "show ver": "v1.2"})
+
+
+def record(tmp_path, host):
+    path = str(tmp_path / "%H.cap")
+    transport.register(host, capture.recording(device, path))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 " + host)
+    assert tab.Screen.WaitForString(host + "#", 5)
+    for command in ("show clock", "show ver"):
+        tab.Screen.Send(command + "\r")
+        assert tab.Screen.WaitForString(host + "#", 5)
+    tab.Close()
+    return str(tmp_path / "{}.cap".format(host))
+
+
+def test_record_and_replay_round_trip(tmp_path):
+    path = record(tmp_path, "cap1")
+    reader = capture.CaptureReader(path)
+    assert reader.metadata["host"] == "cap1"
+    records = list(reader.records())
+    reader.close()
+    times = [at for at, _, _ in records]
+    assert times == sorted(times)
+    sent = b"".join(data for _, direction, data in records if direction == capture.SENT)
+    received = b"".join(data for _, direction, data in records if direction == capture.RECEIVED)
+    assert sent == b"show clock\rshow ver\r"
+    assert b"12:00\r\ncap1#" in received and received.endswith(b"v1.2\r\ncap1#")
+
+    transport.register("cap1", capture.replaying(str(tmp_path / "%H.cap"), hangup=True))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 cap1")
+    assert tab.Screen.WaitForString("cap1#", 5)
+    # gated: nothing more comes until the script sends its line end too
+    assert tab.Screen.ReadString("cap1#", 0.2) == ""
+    tab.Screen.Send("show clock\r")
+    assert "12:00" in tab.Screen.ReadString("cap1#", 5)
+    tab.Screen.Send("show ver\r")
+    assert "v1.2" in tab.Screen.ReadString("cap1#", 5)
+    assert tab.Screen._transport.sent == [b"show clock\r", b"show ver\r"]
+    tab.Close()
+
+
+def test_replay_in_real_time(tmp_path):
+    path = str(tmp_path / "timed.cap")
+    writer = capture.CaptureWriter(path, {"host": "timed"})
+    writer.write(capture.RECEIVED, b"one")
+    time.sleep(0.2)
+    writer.write(capture.RECEIVED, b"two")
+    writer.close()
+    replay = capture.ReplayTransport(path, speed=2.0, hangup=True)
+    started = time.time()
+    data = b""
+    while data != b"onetwo":
+        transport.wait_ready([replay], timeout=2)
+        chunk = replay.read()
+        assert chunk is not None, data
+        data += chunk
+    assert 0.05 < time.time() - started < 1.0  # 0.2s recorded, at twice the speed
+    transport.wait_ready([replay], timeout=1)
+    assert replay.read() is None
+    replay.close()
+
+
+def test_interrupted_recording_ends_at_the_last_whole_record(tmp_path):
+    path = str(tmp_path / "cut.cap")
+    writer = capture.CaptureWriter(path)
+    writer.write(capture.RECEIVED, b"whole")
+    writer.write(capture.RECEIVED, b"cut short")
+    writer.close()
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+    reader = capture.CaptureReader(path)
+    assert [data for _, _, data in reader.records()] == [b"whole"]
+    reader.close()
+
+
+@pytest.mark.parametrize("content", [b"", b"SCRT", b"SCRTCAP1\x01", b"NOTACAPTURE-FILE"])
+def test_not_a_capture(tmp_path, content):
+    path = tmp_path / "bad.cap"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        capture.CaptureReader(str(path))
+
+
+def test_info_and_cat(tmp_path, capsys):
+    path = str(tmp_path / "info.cap")
+    writer = capture.CaptureWriter(path, {"host": "info"})
+    writer.write(capture.RECEIVED, b"banner\r\n")
+    writer.write(capture.SENT, b"x\r")
+    writer.close()
+    assert capture.main(["capture.py", "info", path]) == 0
+    assert "2 records" in capsys.readouterr().out
+    assert capture.main(["capture.py", "cat", path]) == 0
+    assert capsys.readouterr().out == "banner\r\n"
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import dialogue
+import transport
+from fake_scrt import Tab
+
+LOGIN = {"start": [("Username: ", "{username}\r"), ("Password: ", "{password}\r"),
+                   ("% Authentication failed", None, "fail"), ("dl1#", None, "done")]}
+
+
+@pytest.fixture
+def tab():
+    transport.register("dl1", lambda args: transport.ScriptedDevice(
+        args.hostname, responses={"show clock": "12:00:00.000 UTC"},
+        username="admin", password="pw"))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 dl1")
+    yield tab
+    tab.Close()
+
+
+def test_login_goes_through_the_states(tab):
+    result = tab.Screen.dialogue(LOGIN, timeout=5, username="admin", password="pw")
+    assert result.ok and result.state == "start", result
+    assert [(string, response) for _, string, response in result.transcript] == [
+        ("Username: ", "admin\r"), ("Password: ", "pw\r"), ("dl1#", None)]
+
+    paged = dialogue.compile({"start": [("dl1#", "show clock\r", "wait")], "wait": [("dl1#", None, "done")]})
+    result = paged.run(tab.Screen, send="\r", timeout=5)
+    assert result.ok and result.state == "wait" and "12:00:00.000 UTC" in result.output, result
+
+
+def test_fail_rule(tab):
+    result = tab.Screen.dialogue(LOGIN, timeout=5, username="admin", password="wrong")
+    assert result.status == "failed" and not result.ok
+    assert "Authentication failed" in result.error
+
+
+def test_state_timeout_and_on_timeout(tab):
+    assert tab.Screen.dialogue(LOGIN, timeout=5, username="admin", password="pw").ok
+    silent = {"start": {"timeout": 0.2, "expect": [("never shown", None, "done")]}}
+    started = time.time()
+    result = dialogue.compile(silent).run(tab.Screen)
+    assert result.status == "timeout" and 0.2 <= time.time() - started < 2
+    assert result.transcript == []
+
+    retry = {"start": {"timeout": 0.2, "expect": [("never shown", None, "done")], "on_timeout": ("\r", "prompt")},
+             "prompt": [("dl1#", None, "done")]}
+    result = dialogue.compile(retry).run(tab.Screen, timeout=5)
+    assert result.ok and result.transcript[0] == ("start", None, "\r"), result
+
+
+def test_whole_dialogue_timeout(tab):
+    waiting = dialogue.compile({"start": [("never shown", None, "done")]})
+    started = time.time()
+    result = waiting.run(tab.Screen, timeout=0.2)
+    assert result.status == "timeout" and time.time() - started < 2
+    assert "Username: " in result.output  # consumed while waiting
+
+
+def test_limit(tab, monkeypatch):
+    monkeypatch.setattr(dialogue, "LIMIT", 5)
+    assert tab.Screen.dialogue(LOGIN, timeout=5, username="admin", password="pw").ok
+    loop = dialogue.compile({"start": [("dl1#", "\r")]})
+    result = loop.run(tab.Screen, send="\r", timeout=5)
+    assert result.status == "limit" and len(result.transcript) == 5
+
+
+def test_disconnected():
+    result = dialogue.compile(LOGIN).run(Tab().Screen)
+    assert result.status == "disconnected"
+
+
+def test_bad_specs():
+    with pytest.raises(ValueError):
+        dialogue.compile({"begin": [("#", None, "done")]})
+    with pytest.raises(ValueError):
+        dialogue.compile({"start": [("#", None, "nowhere")]})
+    with pytest.raises(ValueError):
+        dialogue.compile({"start": []})
+    assert dialogue.compile(LOGIN) is dialogue.compile(dict(LOGIN))
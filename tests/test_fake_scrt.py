@@ -0,0 +1,23 @@
+import os
+import shutil
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE = ["fake_scrt.py", "transport.py", "stream_match.py", "vt100.py", "scrollback.py"]
+
+
+def test_works_copied_without_the_extension_modules(tmp_path):
+    for name in CORE:
+        shutil.copy(os.path.join(REPO, name), str(tmp_path))
+    script = tmp_path / "script.py"
+    script.write_text(u"\n".join([
+        "import sys",
+        "from fake_scrt import SecureCRT",
+        "crt = SecureCRT()",
+        "crt.Screen.Send('show version\\r')",
+        "assert crt.GetScriptTab().Index == 1",
+        "print(sorted(m for m in sys.modules if m in ('bulk_send', 'dialogue', 'kermit', 'session_db', 'tab_pool')))",
+    ]))
+    output = subprocess.check_output([sys.executable, str(script)], cwd=str(tmp_path))
+    assert output.decode().strip().splitlines()[-1] == "[]"
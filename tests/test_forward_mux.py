@@ -0,0 +1,227 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import forward_mux
+from forward_registry import ForwardRegistry
+
+
+def serve(handle):
+    """A stand-in for the service behind a forward: handle(client) on a thread per connection."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(64)
+
+    def accept():
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=handle, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def http_server(body):
+    def handle(client):
+        try:
+            if client.recv(65536):  # (spares are closed unused)
+                client.sendall(b"HTTP/1.0 200 OK\r\nContent-Length: " + str(len(body)).encode("ascii")
+                               + b"\r\n\r\n" + body)
+        except OSError:
+            pass
+        client.close()
+    return serve(handle)
+
+
+def echo_server():
+    def handle(client):
+        try:
+            while True:
+                data = client.recv(65536)
+                if not data:
+                    break
+                client.sendall(data)
+        except OSError:
+            pass
+        client.close()
+    return serve(handle)
+
+
+def target(server):
+    return server.getsockname()
+
+
+def receive_all(sock):
+    data = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def get(mux, host):
+    client = socket.create_connection(("127.0.0.1", mux.port), timeout=10)
+    client.sendall("GET / HTTP/1.1\r\nHost: {}:{}\r\n\r\n".format(host, mux.port).encode("ascii"))
+    response = receive_all(client)
+    client.close()
+    return response
+
+
+def socks5(mux, name, port):
+    """A SOCKS5 CONNECT to name:port through the mux.  Returns (reply code, socket)."""
+    client = socket.create_connection(("127.0.0.1", mux.port), timeout=10)
+    client.sendall(b"\x05\x01\x00")
+    assert client.recv(2) == b"\x05\x00"
+    client.sendall(b"\x05\x01\x00\x03" + bytearray([len(name)]) + name.encode("ascii") + struct.pack("!H", port))
+    reply = bytearray(client.recv(10))
+    return reply[1], client
+
+
+def connect(mux, where):
+    client = socket.create_connection(("127.0.0.1", mux.port), timeout=10)
+    client.sendall("CONNECT {} HTTP/1.1\r\nHost: {}\r\n\r\n".format(where, where).encode("ascii"))
+    head = b""
+    while not head.endswith(b"\r\n\r\n"):
+        chunk = client.recv(1)
+        if not chunk:
+            break
+        head += chunk
+    return head, client
+
+
+@pytest.fixture
+def servers():
+    started = []
+    yield started
+    for server in started:
+        server.close()
+
+
+def test_http_routes_by_host(tmp_path, servers):
+    servers.extend([http_server(b"rtr1"), http_server(b"rtr2"), http_server(b"rtr3")])
+    registry = ForwardRegistry(str(tmp_path / "forwards.sqlite3"))
+    registry.add(target(servers[2])[1], "rtr3", "127.0.0.1", 80)
+    mux = forward_mux.start_background(0, routes={"rtr1": target(servers[0]), "rtr2": target(servers[1])},
+                                       registry=registry, spares=0)
+    try:
+        assert get(mux, "rtr1.localhost").endswith(b"\r\n\r\nrtr1")
+        assert get(mux, "rtr2.localhost").endswith(b"\r\n\r\nrtr2")
+        assert get(mux, "RTR3").endswith(b"\r\n\r\nrtr3")  # from the registry
+    finally:
+        mux.close()
+    assert mux.streams == 3 and mux.refused == 0
+
+
+def test_socks5_and_connect_route_by_host_and_port(servers):
+    servers.extend([echo_server(), http_server(b"web")])
+    mux = forward_mux.start_background(0, routes={"rtr1:443": target(servers[0]), "rtr1:80": target(servers[1])},
+                                       registry=False, spares=0)
+    try:
+        code, client = socks5(mux, "rtr1", 443)
+        assert code == 0
+        client.sendall(b"ping")
+        assert client.recv(4) == b"ping"
+        client.close()
+        head, client = connect(mux, "rtr1:443")
+        assert head.startswith(b"HTTP/1.1 200")
+        client.sendall(b"pong")
+        assert client.recv(4) == b"pong"
+        client.close()
+        code, client = socks5(mux, "rtr1", 80)
+        assert code == 0
+        client.sendall(b"GET / HTTP/1.0\r\n\r\n")
+        assert receive_all(client).endswith(b"web")
+        client.close()
+    finally:
+        mux.close()
+    assert [s.protocol for s in mux.history] == ["socks5", "connect", "socks5"]
+
+
+def test_unknown_hosts_are_refused(servers):
+    servers.append(echo_server())
+    mux = forward_mux.start_background(0, routes={"rtr1:443": target(servers[0])}, registry=False, spares=0)
+    try:
+        assert get(mux, "example.com").startswith(b"HTTP/1.1 404")
+        code, client = socks5(mux, "rtr1", 22)  # right host, wrong port
+        assert code == 2  # not allowed
+        client.close()
+        head, client = connect(mux, "example.com:443")
+        assert head.startswith(b"HTTP/1.1 403")
+        client.close()
+    finally:
+        mux.close()
+    assert mux.refused == 3 and mux.streams == 0
+
+
+def test_spares_are_used(servers):
+    servers.append(http_server(b"ok"))
+    mux = forward_mux.start_background(0, routes={"rtr1": target(servers[0])}, registry=False, spares=2)
+    try:
+        for _ in range(3):
+            assert get(mux, "rtr1.localhost").endswith(b"ok")
+            deadline = time.time() + 5
+            while mux.stats(recent=0)["spares"] < 2 and time.time() < deadline:
+                time.sleep(0.01)
+    finally:
+        mux.close()
+    assert (mux.pool_misses, mux.pool_hits) == (1, 2)
+    assert [s.pooled for s in mux.history] == [False, True, True]
+
+
+@pytest.mark.parametrize("zero_copy", [True, False])
+def test_relay_with_and_without_splice(servers, zero_copy):
+    body = os.urandom(3 << 20)
+    servers.append(http_server(body))
+    mux = forward_mux.start_background(0, routes={"rtr1": target(servers[0])}, registry=False, spares=0,
+                                       zero_copy=zero_copy)
+    try:
+        assert get(mux, "rtr1.localhost").endswith(b"\r\n\r\n" + body)
+    finally:
+        mux.close()
+    stream = mux.history[-1]
+    assert stream.zero_copy == (zero_copy and forward_mux._HAS_SPLICE)
+    assert stream.bytes_down == len(body) + len(b"HTTP/1.0 200 OK\r\nContent-Length: \r\n\r\n") + len(str(len(body)))
+
+
+def test_unused_spares_are_closed(servers, monkeypatch):
+    monkeypatch.setattr(forward_mux, "SPARE_MAX_AGE", 0.2)
+    servers.append(http_server(b"ok"))
+    mux = forward_mux.start_background(0, routes={"rtr1": target(servers[0])}, registry=False, spares=2)
+    try:
+        assert get(mux, "rtr1.localhost").endswith(b"ok")
+        deadline = time.time() + 5
+        while mux.stats(recent=0)["spares"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert mux.stats(recent=0)["spares"] == 2
+        while mux.stats(recent=0)["spares"] and time.time() < deadline:  # no stream comes to use them
+            time.sleep(0.05)
+        assert mux.stats(recent=0)["spares"] == 0
+    finally:
+        mux.close()
+
+
+def test_main_prints_the_bound_port(capsys):
+    def interrupt(self):
+        assert self.port != 0
+        raise KeyboardInterrupt
+
+    original = forward_mux.ForwardMux.serve_forever
+    forward_mux.ForwardMux.serve_forever = interrupt
+    try:
+        forward_mux.main(["0", "rtr1=127.0.0.1:80"])
+    finally:
+        forward_mux.ForwardMux.serve_forever = original
+    banner = capsys.readouterr().out.splitlines()[0]
+    assert "127.0.0.1:0 " not in banner and ":0/" not in banner, banner
@@ -0,0 +1,47 @@
+import socket
+
+import forward_registry
+from fake_scrt import Tab
+
+
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1)
+    return sock
+
+
+def test_forwards_for_tab_by_index_and_caption(tmp_path):
+    registry = forward_registry.ForwardRegistry(str(tmp_path / "forwards.sqlite3"))
+    first, second = listener(), listener()
+    tabs = [Tab(), Tab()]
+    for tab, sock in zip(tabs, (first, second)):
+        tab.Caption = "rtr{} {}".format(tab.Index, sock.getsockname()[1])
+        registry.add(sock.getsockname()[1], "rtr{}".format(tab.Index), tab_index=tab.Index, caption=tab.Caption)
+    try:
+        assert [f.local_port for f in registry.for_tab(tabs[1])] == [second.getsockname()[1]]
+        tabs[0].Close()  # tabs[1] moves to tabs[0]'s index: its caption still finds its forward
+        assert [f.local_port for f in registry.for_tab(tabs[1])] == [second.getsockname()[1]]
+        tabs.append(Tab())
+        assert registry.for_tab(tabs[-1]) == []
+    finally:
+        for tab in tabs:
+            tab.Close()
+        first.close()
+        second.close()
+
+
+def test_forwards_for_renamed_tab(tmp_path):
+    registry = forward_registry.ForwardRegistry(str(tmp_path / "forwards.sqlite3"))
+    sock = listener()
+    port = sock.getsockname()[1]
+    tab = Tab()
+    tab.Caption = "rtr1 {}".format(port)
+    registry.add(port, "rtr1", tab_index=tab.Index, caption=tab.Caption)
+    try:
+        tab.Caption = "core router 2"  # ends in a number that isn't the port
+        assert [f.local_port for f in registry.for_tab(tab)] == [port]
+        assert registry.by_port(port).caption == "core router 2"
+    finally:
+        tab.Close()
+        sock.close()
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+import kermit
+from transfers import digest, make_file, partial_download, transfer
+
+
+def test_content(tmp_path):
+    source = str(tmp_path / "image.bin")
+    make_file(source, 300001)
+    folder = str(tmp_path / "received")
+    sent, received = transfer(lambda conn: kermit.send_kermit(conn, [source]),
+                              lambda conn: kermit.receive_kermit(conn, folder))
+    assert digest(os.path.join(folder, "image.bin")) == digest(source)
+    assert sent.bytes == received.bytes == 300001
+
+
+def test_attributes_set_date(tmp_path):
+    source = str(tmp_path / "image.bin")
+    make_file(source, 5000)
+    mtime = time.mktime((2020, 5, 17, 12, 30, 45, 0, 0, -1))
+    os.utime(source, (mtime, mtime))
+    folder = str(tmp_path / "received")
+    transfer(lambda conn: kermit.send_kermit(conn, [source]), lambda conn: kermit.receive_kermit(conn, folder))
+    assert os.path.getmtime(os.path.join(folder, "image.bin")) == mtime
+
+
+def test_attribute_size_checked(tmp_path, monkeypatch):
+    source = str(tmp_path / "image.bin")
+    make_file(source, 5000)
+    folder = str(tmp_path / "received")
+    attributes = kermit._attributes
+    monkeypatch.setattr(kermit, "_attributes", lambda f: attributes(f).replace(b"5000", b"5001"))
+    with pytest.raises(kermit.TransferError):
+        transfer(lambda conn: kermit.send_kermit(conn, [source], timeout=2),
+                 lambda conn: _quietly(kermit.receive_kermit, conn, folder, timeout=2))
+
+
+def _quietly(receive, *args, **kwargs):
+    try:
+        return receive(*args, **kwargs)
+    except kermit.TransferError as e:
+        return e
+
+
+def test_resume_sender(tmp_path):
+    source, folder = partial_download(tmp_path, 200000, 123456)
+    sent, received = transfer(lambda conn: kermit.send_kermit(conn, [source], resume=True),
+                              lambda conn: kermit.receive_kermit(conn, folder))
+    assert digest(os.path.join(folder, "image.bin")) == digest(source)
+    assert sent.bytes == received.bytes == 200000 - 123456
+
+
+def test_resume_receiver(tmp_path):
+    source, folder = partial_download(tmp_path, 200000, 70000)
+    sent, received = transfer(lambda conn: kermit.send_kermit(conn, [source]),
+                              lambda conn: kermit.receive_kermit(conn, folder, resume=True))
+    assert digest(os.path.join(folder, "image.bin")) == digest(source)
+    assert sent.bytes == received.bytes == 200000 - 70000
+
+
+def test_window_resends_over_lossy_line(tmp_path):
+    source = str(tmp_path / "image.bin")
+    make_file(source, 256 * 1024)
+    folder = str(tmp_path / "received")
+    sent, received = transfer(lambda conn: kermit.send_kermit(conn, [source], timeout=1, retries=30),
+                              lambda conn: kermit.receive_kermit(conn, folder, timeout=1, retries=30),
+                              kermit.delay_line(0.005, loss=0.05))
+    assert digest(os.path.join(folder, "image.bin")) == digest(source)
+    assert sent.errors + received.errors > 0  # packets were lost and sent again
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import script_runner
+
+
+class BrokenStream(object):
+    """A client that hung up: every write fails."""
+    def write(self, text):
+        raise BrokenPipeError()
+
+    def flush(self):
+        pass
+
+
+def test_state_restored_when_error_output_fails(tmp_path):
+    script = tmp_path / "fails.py"
+    script.write_text(u"import sys\nprint('hello')\nraise ValueError('boom')\n")
+    runner = script_runner.Runner(preload=(), crt=None)
+    before = (list(sys.argv), list(sys.path), os.getcwd(), sys.stdout, sys.stderr)
+    result = runner.run(str(script), args=["x"], cwd=str(tmp_path), stdout=BrokenStream(), stderr=BrokenStream())
+    assert result.status == "error"
+    assert (list(sys.argv), list(sys.path), os.getcwd(), sys.stdout, sys.stderr) == before
+
+
+def test_exit_message_with_broken_stderr(tmp_path):
+    script = tmp_path / "exits.py"
+    script.write_text(u"import sys\nsys.exit('bad args')\n")
+    runner = script_runner.Runner(preload=(), crt=None)
+    before = (list(sys.argv), list(sys.path), sys.stderr)
+    result = runner.run(str(script), cwd=str(tmp_path), stderr=BrokenStream())
+    assert (result.status, result.exit_code) == ("exit", 1)
+    assert (list(sys.argv), list(sys.path), sys.stderr) == before
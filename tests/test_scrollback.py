@@ -0,0 +1,36 @@
+import scrollback
+
+
+def test_search_stays_within_a_line():
+    sb = scrollback.Scrollback()
+    count = scrollback.BLOCK_LINES + 11  # a packed block and pending lines
+    for i in range(count):
+        sb.add(b"interface Gi0/1" if i % 3 == 0 else b" shutdown" if i % 3 == 1 else b" description x")
+    assert sb.search(r"Gi0/1\s+shutdown") == []
+    assert sb.search(r"shutdown[^x]*x") == []
+    shut = sb.search(r"^ shut")
+    assert len(shut) == count // 3 and shut[0] == (2, u" shutdown")
+    # a match that runs on into the next line still counts if the line matches on its own
+    assert sb.search(r"Gi0/1[^z]*", limit=2) == [(1, u"interface Gi0/1"), (4, u"interface Gi0/1")]
+
+
+def test_index_skips_blocks_but_not_matches():
+    import random
+    import re
+    rng = random.Random(4)
+    words = ["interface", "Gi0/1", "%Error", "errors", "rtr12", "#", "is", "down", "up", "x_1", "Router"]
+    lines = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 5))) for _ in range(5 * scrollback.BLOCK_LINES)]
+    lines[3000] = "unique %Errorneous xyzzy-rtr12 #end"
+    sb = scrollback.Scrollback()
+    for line in lines:
+        sb.add(line.encode("latin-1"))
+    for text in ["%Error", "rtr12 #", "rr", "s down", "xyzzy-rtr12 #e", "%errors", "Gi0/1 is"]:
+        for ignore_case in (False, True):
+            folded = text.lower() if ignore_case else text
+            expected = [(n, line) for n, line in enumerate(lines, 1)
+                        if folded in (line.lower() if ignore_case else line)]
+            assert sb.find(text, ignore_case=ignore_case) == expected, (text, ignore_case)
+    for pattern in [r"^interface \S+ is down", r"Error$", r"\bdown\b", r"rtr12 #e", r"(?i)router up", r"ors|own",
+                    r"rrors? ", r"^$"]:
+        expected = [(n, line) for n, line in enumerate(lines, 1) if re.search(pattern, line)]
+        assert sb.search(pattern) == expected, pattern
@@ -0,0 +1,75 @@
+import os
+import time
+
+import session_db
+from session_db import SessionDatabase, parse, serialize
+
+
+def write_session(folder, path, hostname, extra=b""):
+    filename = os.path.join(folder, *(path + ".ini").split("/"))
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, "wb") as f:
+        f.write(serialize({"Hostname": ("S", hostname)}) + extra)
+    return filename
+
+
+def test_serialize_parse_round_trip():
+    options = {
+        "Hostname": ("S", u"10.1.1.1"),
+        "Port": ("D", 22),
+        "Negative": ("D", 0xfffffffe),
+        "Login Script V3": ("Z", [u"user", u"", u"enable"]),
+        "Empty List": ("Z", []),
+        "Key Exchange": ("B", bytearray(range(40))),
+        "Unicode": ("S", u"réseau"),
+    }
+    for newline in ("\r\n", "\n"):
+        data = serialize(options, newline)
+        assert data.startswith(b"\xef\xbb\xbf")
+        assert dict(parse(data)) == options
+    assert parse(serialize(options)).keys() == options.keys()  # file order
+
+
+def test_hostname_on_the_first_line_after_the_bom(tmp_path):
+    folder = str(tmp_path / "Sessions")
+    write_session(folder, "lab/rtr1", u"10.1.1.1")  # serialize() puts it first, after the BOM
+    write_session(folder, "lab/rtr2", u"10.1.1.2", b'S:"Hostname"=ignored\r\n')
+    db = SessionDatabase(folder, index_file=str(tmp_path / "index.json"))
+    assert db.find_host("10.1.1.1") == ["lab/rtr1"]
+    assert db.hostname("lab/rtr2") == u"10.1.1.2"
+
+
+def test_find_host_save_and_reopen(tmp_path):
+    folder = str(tmp_path / "Sessions")
+    index = str(tmp_path / "index.json")
+    write_session(folder, "lab/rtr1", u"Router1.example.com")
+    db = SessionDatabase(folder, index_file=index)
+    assert db.find_host("router1.EXAMPLE.com") == ["lab/rtr1"]
+    assert db.find_host("nowhere") == []
+    db.save("lab/rtr2", {"Hostname": ("S", u"10.2.2.2"), "Port": ("D", 2222)})
+    assert db.find_host("10.2.2.2") == ["lab/rtr2"]  # queued, not written yet
+    db.flush()
+    again = SessionDatabase(folder, index_file=index)
+    assert again.paths() == ["lab/rtr1", "lab/rtr2"]
+    assert again.load("lab/rtr2")["Port"] == ("D", 2222)
+
+
+def test_changes_to_the_files_are_noticed(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_db, "REFRESH_SECONDS", 0)
+    folder = str(tmp_path / "Sessions")
+    filename = write_session(folder, "rtr1", u"10.1.1.1")
+    db = SessionDatabase(folder, index_file=str(tmp_path / "index.json"))
+    assert db.find_host("10.1.1.1") == ["rtr1"]
+
+    time.sleep(0.01)
+    write_session(folder, "rtr1", u"10.9.9.9", b"# longer\r\n")  # edited in place: no folder change
+    assert db.find_host("10.1.1.1") == []
+    assert db.find_host("10.9.9.9") == ["rtr1"]
+
+    write_session(folder, "lab/rtr2", u"10.1.1.2")  # a new folder and session
+    assert db.find_host("10.1.1.2") == ["lab/rtr2"]
+
+    os.remove(filename)
+    assert db.find_host("10.9.9.9") == []
+    assert db.paths() == ["lab/rtr2"]
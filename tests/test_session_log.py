@@ -0,0 +1,110 @@
+import gzip
+import os
+import time
+
+import pytest
+
+import session_log
+
+
+def test_expand_filename():
+    now = time.mktime((2024, 3, 5, 7, 8, 9, 0, 0, -1)) + 0.042
+    fields = {"host": "rtr1", "session": "core", "port": 22, "username": "admin", "tab_index": 3}
+    name = session_log.expand_filename("%H-%S-%P-%U-%I-%Y%M%D-%h%m%s.%t-100%%.log", fields, now)
+    assert name == "rtr1-core-22-admin-3-20240305-070809.042-100%.log"
+    assert session_log.expand_filename("%H%U.log", {"host": "rtr1"}) == "rtr1.log"
+
+
+def test_writes_reach_the_file_in_order(tmp_path):
+    path = str(tmp_path / "logs" / "%H.log")
+    log = session_log.SessionLog(path, {"host": "rtr1"}, compress=None)
+    for i in range(1000):
+        log.write(b"line %d\r\n" % i)
+    assert log.flush()
+    with open(str(tmp_path / "logs" / "rtr1.log"), "rb") as f:
+        assert f.read() == b"".join(b"line %d\r\n" % i for i in range(1000))
+    assert log.close()
+    log.write(b"after close")
+    assert log.flush()
+    assert os.path.getsize(log.path) == len(b"".join(b"line %d\r\n" % i for i in range(1000)))
+
+
+def test_append(tmp_path):
+    path = str(tmp_path / "rtr1.log")
+    with open(path, "wb") as f:
+        f.write(b"old\n")
+    log = session_log.SessionLog(path, append=True, compress=None)
+    log.write(b"new\n")
+    log.close()
+    with open(path, "rb") as f:
+        assert f.read() == b"old\nnew\n"
+
+
+@pytest.mark.parametrize("compress", [None, "gzip", "zstd"])
+def test_rotates_by_size_and_compresses(tmp_path, compress):
+    if compress == "zstd" and session_log.zstandard is None:
+        pytest.skip("needs the zstandard package")
+    path = str(tmp_path / "rtr1.log")
+    log = session_log.SessionLog(path, max_bytes=100, compress=compress)
+    chunks = [bytes(bytearray([65 + i])) * 60 for i in range(3)]
+    for chunk in chunks:
+        log.write(chunk)
+        log.flush()  # one write each, so each one after the first goes over max_bytes
+    log.close()
+    session_log.flush_all()
+    assert len(log.rotated) == 2 and len(set(log.rotated)) == 2
+    contents = []
+    for rotated in log.rotated:
+        assert rotated.startswith(path + ".")
+        if compress == "gzip":
+            assert rotated.endswith(".gz")
+            with gzip.open(rotated) as f:
+                contents.append(f.read())
+        elif compress == "zstd":
+            assert rotated.endswith(".zst")
+            with open(rotated, "rb") as f:
+                contents.append(session_log.zstandard.ZstdDecompressor().decompressobj().decompress(f.read()))
+        else:
+            with open(rotated, "rb") as f:
+                contents.append(f.read())
+        assert not (compress and os.path.exists(rotated[:rotated.rindex(".")]))  # original removed
+    with open(path, "rb") as f:
+        contents.append(f.read())
+    assert contents == chunks
+
+
+def test_rotates_by_age_into_a_new_name(tmp_path):
+    log = session_log.SessionLog(str(tmp_path / "rtr1-%h%m%s.%t.log"), max_bytes=None, rotate_seconds=0.05,
+                                 compress=None)
+    log.write(b"first")
+    log.flush()
+    time.sleep(0.1)
+    log.write(b"second")
+    log.close()
+    assert len(log.rotated) == 1 and log.rotated[0] != log.path
+    with open(log.rotated[0], "rb") as f:
+        assert f.read() == b"first"
+    with open(log.path, "rb") as f:
+        assert f.read() == b"second"
+
+
+class StalledWriter(object):
+    """A writer thread that never gets round to anything."""
+    def put(self, log):
+        pass
+
+
+def test_drops_rather_than_blocks_when_too_far_behind(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_log, "PENDING_BYTES", 10)
+    monkeypatch.setattr(session_log, "_writer", StalledWriter)
+    log = session_log.SessionLog(str(tmp_path / "rtr1.log"), compress=None)
+    log.write(b"12345678")
+    log.write(b"abc")
+    log.write(b"90")
+    assert log.dropped == 3
+    assert log._take() == [b"12345678", b"90"]
+
+
+def test_bad_compression():
+    with pytest.raises(ValueError):
+        session_log.SessionLog("x.log", compress="bzip2")
@@ -0,0 +1,45 @@
+import random
+
+from stream_match import compile_strings, fold_case
+
+
+def first_match(strings, text, ignore_case=False):
+    """Brute force: (1-based index, end) of the string ending earliest, first listed on a tie."""
+    if ignore_case:
+        strings, text = [fold_case(s) for s in strings], fold_case(text)
+    for end in range(len(text) + 1):
+        for index, string in enumerate(strings, 1):
+            if len(string) <= end and text[end - len(string):end] == string:
+                return index, end
+    return None
+
+
+def test_matches_like_brute_force():
+    rng = random.Random(2)
+    for _ in range(2000):
+        strings = ["".join(rng.choice("abAB#") for _ in range(rng.randint(1, 4)))
+                   for _ in range(rng.randint(1, 5))]
+        text = "".join(rng.choice("abAB# ") for _ in range(rng.randint(0, 30)))
+        ignore_case = rng.random() < 0.5
+        found = compile_strings(strings, ignore_case).scanner().scan(text)
+        assert found == first_match(strings, text, ignore_case), (strings, text, ignore_case)
+
+
+def test_match_split_across_chunks():
+    rng = random.Random(3)
+    for _ in range(500):
+        strings = ["".join(rng.choice("ab#") for _ in range(rng.randint(2, 5))) for _ in range(3)]
+        text = "".join(rng.choice("ab# ") for _ in range(rng.randint(0, 40)))
+        expected = first_match(strings, text)
+        cut = rng.randint(0, len(text))
+        scanner = compile_strings(strings).scanner()
+        found = scanner.scan(text[:cut])
+        if found is None:
+            found = scanner.scan(text[cut:])
+            found = found and (found[0], found[1] + cut)
+        assert found == expected, (strings, text, cut)
+
+
+def test_empty_string_and_no_strings():
+    assert compile_strings(["x", ""]).scanner().scan("abc", 1) == (2, 1)
+    assert compile_strings([]).scanner().scan("abc") is None
@@ -0,0 +1,82 @@
+import pytest
+
+import tab_pool
+import transport
+from fake_scrt import SecureCRT
+
+devices = []
+
+
+@pytest.fixture
+def pool():
+    def connect(args):
+        device = transport.ScriptedDevice(args.hostname, responses={"show clock": "12:00:00.000 UTC"})
+        devices.append(device)
+        return device
+    for host in ("tp1", "tp2", "tp3"):
+        transport.register(host, connect)
+    del devices[:]
+    pool = tab_pool.TabPool(SecureCRT(), max_size=2, check_timeout=0.5,
+                            login=lambda tab: tab.Screen.WaitForString("#", 5))
+    yield pool
+    pool.close()
+
+
+def test_hit_after_release(pool):
+    tab = pool.get("tp1")
+    pool.release(tab)
+    assert pool.get("TP1") is tab
+    assert (pool.hits, pool.misses, pool.clones) == (1, 1, 0)
+    tab.Screen.Send("show clock\r")
+    assert tab.Screen.WaitForString("12:00:00", 5)
+
+
+def test_second_tab_for_a_busy_host_is_a_clone(pool):
+    first = pool.get("tp1")
+    second = pool.get("tp1")
+    assert second is not first and second.Session.Connected
+    assert (pool.hits, pool.misses, pool.clones) == (0, 2, 1)
+
+
+def test_least_recently_used_idle_tab_is_evicted(pool):
+    with pool.tab("tp1") as tp1:
+        pass
+    with pool.tab("tp2"):
+        pass
+    tp3 = pool.get("tp3")  # the pool holds 2: tp1 (the oldest idle) makes room
+    assert pool.evictions == 1 and not tp1.Session.Connected
+    assert len(pool) == 2 and pool.stats()["idle"] == 1
+    pool.release(tp3)
+    assert pool.get("tp2") and pool.hits == 1
+
+
+def test_failed_health_check_opens_a_new_tab(pool):
+    tab = pool.get("tp1")
+    pool.release(tab)
+    devices[0].prompt = "tp1(config)#"  # a return won't bring back the prompt the tab was left at
+    again = pool.get("tp1")
+    assert again is not tab and not tab.Session.Connected
+    assert (pool.hits, pool.misses, pool.failed_checks) == (0, 2, 1)
+
+
+def test_dead_idle_tab_is_swept(pool):
+    tab = pool.get("tp1")
+    pool.release(tab)
+    tab.Session.Disconnect()
+    assert pool.get("tp1") is not tab
+    assert (pool.hits, pool.misses, pool.evictions) == (0, 2, 1)
+
+
+def test_pool_full(pool):
+    pool.get("tp1")
+    pool.get("tp2")
+    with pytest.raises(tab_pool.PoolFull):
+        pool.get("tp3")
+    assert pool.misses == 2  # the get() that raised opened nothing
+
+
+def test_discard_on_error(pool):
+    with pytest.raises(RuntimeError):
+        with pool.tab("tp1") as tab:
+            raise RuntimeError("went wrong")
+    assert not tab.Session.Connected and len(pool) == 0
@@ -0,0 +1,41 @@
+import transport
+from fake_scrt import Tab
+
+ARP = r"""
+Value ADDRESS (\d+\.\d+\.\d+\.\d+)
+Value AGE (\S+)
+Value MAC ([0-9a-f.]+)
+Value INTERFACE (\S+)
+
+Start
+  ^Internet\s+${ADDRESS}\s+${AGE}\s+${MAC}\s+ARPA\s+${INTERFACE} -> Record
+"""
+OUTPUT = ("Protocol  Address          Age (min)  Hardware Addr   Type   Interface\r\n"
+          "Internet  10.0.0.1                -   0011.2233.4455  ARPA   Gi0/0\r\n"
+          "Internet  10.0.0.2                5   0011.2233.4466  ARPA   Gi0/1\r\n")
+RECORDS = [("10.0.0.1", "-", "0011.2233.4455", "Gi0/0"), ("10.0.0.2", "5", "0011.2233.4466", "Gi0/1")]
+
+
+def connected(host):
+    transport.register(host, lambda args: transport.ScriptedDevice(args.hostname,
+                                                                  responses={"show ip arp": OUTPUT}))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 " + host)
+    assert tab.Screen.WaitForString(host + "#", 5)
+    return tab
+
+
+def test_records_up_to_the_prompt():
+    tab = connected("tp1")
+    assert list(tab.Screen.read_records(ARP, send="show ip arp\r", prompt="tp1#", timeout=5)) == RECORDS
+    assert tab.Screen.MatchIndex == 1
+    tab.Close()
+
+
+def test_records_without_the_prompt():
+    tab = connected("tp2")
+    # the prompt never comes: the rows held back in case they were the start of it still count
+    records = list(tab.Screen.read_records(ARP, send="show ip arp\r", prompt="tp2(config-router-af)#", timeout=1))
+    assert records == RECORDS
+    assert tab.Screen.MatchIndex == 0
+    tab.Close()
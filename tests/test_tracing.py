@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import fake_scrt
+import tracing
+import transport
+from fake_scrt import Tab
+
+
+@pytest.fixture
+def traced():
+    tracing.enable(summary=False, module=fake_scrt)
+    try:
+        yield
+    finally:
+        tracing.disable()
+
+
+def connected_tab(name):
+    transport.register(name, lambda args: transport.ScriptedDevice(
+        args.hostname, responses={"show clock": "12:00:00.000 UTC"}, echo=False))
+    tab = Tab()
+    tab.Session.Connect("/SSH2 " + name)
+    assert tab.Screen.WaitForString(name + "#", 5)
+    return tab
+
+
+def test_counts_calls_and_bytes(traced):
+    tab = connected_tab("tr1")
+    tracing.reset()
+    tab.Screen.Send(u"show clock ½\r")  # "½" is two bytes on the wire
+    assert tab.Screen.WaitForString("tr1#", 5)
+    tab.Close()
+    stats = tracing.stats()
+    send = stats["Screen.Send"]
+    assert send.count == 1 and send.bytes_out == len(u"show clock ½\r".encode("utf-8"))
+    wait = stats["Screen.WaitForString"]
+    assert wait.count == 1 and wait.bytes_in > 0 and wait.percentile(99) <= wait.max
+    assert "Screen.WaitForString" in tracing.summary()
+
+
+def test_stacks_name_the_script_frames(traced):
+    tab = connected_tab("tr2")
+    tracing.reset()
+
+    def show_clock():
+        tab.Screen.Send("show clock\r")
+
+    show_clock()
+    tab.Close()
+    lines = tracing.folded().splitlines()
+    assert any(line.split(" ")[0].endswith(";test_tracing.py:test_stacks_name_the_script_frames;"
+                                          "test_tracing.py:show_clock;Screen.Send") for line in lines), lines
+    assert any(line.startswith("(script's own work) ") for line in lines)
+
+
+def test_deep_stacks_are_cut_to_stack_depth(traced, monkeypatch):
+    monkeypatch.setattr(tracing, "STACK_DEPTH", 4)
+    crt = fake_scrt.SecureCRT()
+    tracing.reset()
+
+    def nested(depth):
+        return crt.GetTabCount() if depth == 0 else nested(depth - 1)
+
+    nested(10)
+    stack = [line for line in tracing.folded().splitlines() if "crt.GetTabCount" in line][0].rsplit(" ", 1)[0]
+    assert stack == "...;" + ";".join(["test_tracing.py:nested"] * 4) + ";crt.GetTabCount"
+
+
+def test_disable_restores_the_api(traced):
+    assert getattr(fake_scrt.Screen.Send, "_traced", None) is not None
+    tracing.disable()
+    assert getattr(fake_scrt.Screen.Send, "_traced", None) is None
+    assert tracing.stats() == {}
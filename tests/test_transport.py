@@ -0,0 +1,110 @@
+import os
+import resource
+import socket
+import sys
+import time
+
+import pytest
+
+import transport
+
+
+def read_until(conn, text, timeout=5):
+    """Reads conn until text has been seen (or it hangs up); returns everything read."""
+    data = b""
+    deadline = time.time() + timeout
+    while text not in data:
+        remaining = deadline - time.time()
+        assert remaining > 0, data
+        transport.wait_ready([conn], timeout=remaining)
+        chunk = conn.read()
+        if chunk is None:
+            break
+        data += chunk
+    return data
+
+
+def test_parse_cmdline():
+    args = transport.parse_cmdline('/SSH2 /L admin /LOCAL 5000:127.0.0.1:80 /LOCAL 5001:10.0.0.1:443 /T rtr1:2222')
+    assert (args.protocol, args.username, args.hostname, args.port) == ("SSH2", "admin", "rtr1", 2222)
+    assert args.local_forwards == [(5000, "127.0.0.1", 80), (5001, "10.0.0.1", 443)]
+    assert args.options == ["/T"]
+    args = transport.parse_cmdline("/TELNET bob@sw1")
+    assert (args.protocol, args.username, args.hostname, args.port) == ("TELNET", "bob", "sw1", 23)
+    with pytest.raises(ValueError):
+        transport.parse_cmdline("/LOCAL 5000:80 rtr1")
+
+
+def test_scripted_device_login_echo_and_hangup():
+    device = transport.ScriptedDevice("rtr1", responses={"show clock": "12:00"}, banner="Welcome\r\n",
+                                      username="admin", password="secret")
+    assert read_until(device, b"Username: ") == b"Welcome\r\nUsername: "
+    device.write(b"admin\r")
+    assert read_until(device, b"Password: ") == b"admin\r\nPassword: "
+    device.write(b"wrong\r")
+    assert read_until(device, b"Username: ").endswith(b"% Authentication failed\r\n\r\nUsername: ")
+    device.write(b"admin\rsecret\r")
+    assert b"secret" not in read_until(device, b"rtr1#")  # passwords aren't echoed
+    device.write(b"show clocx\x08k\r")
+    assert read_until(device, b"rtr1#") == b"show clocx\x08 \x08k\r\n12:00\r\nrtr1#"
+    device.write(b"bogus\r")
+    assert b"% Invalid input" in read_until(device, b"rtr1#")
+    device.write(b"exit\r")
+    assert device.read() is None
+    assert device.received == ["admin", "wrong", "admin", "secret", "show clock", "bogus", "exit"]
+    device.close()
+
+
+def test_scripted_device_line_rate_drops_overflow():
+    device = transport.ScriptedDevice("rtr1", responses={"x": ""}, line_rate=200, input_buffer=8)
+    read_until(device, b"rtr1#")
+    device.write(b"x\rx\rx\rx\rx\r")  # 10 bytes into an 8-byte buffer
+    assert device.dropped == 2
+    deadline = time.time() + 5
+    while len(device.received) < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert device.received == ["x"] * 4
+    device.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork") or transport.pty is None, reason="needs pseudo-terminals")
+def test_pty_transport_runs_a_program():
+    conn = transport.PtyTransport(["/bin/sh", "-c", "read line; echo got $line"], rows=30, columns=100)
+    conn.write(b"hello\n")
+    assert b"got hello" in read_until(conn, b"got hello")
+    assert read_until(conn, b"never") is not None  # reads up to the hang-up
+    assert conn.read() in (None, b"")
+    conn.close()
+
+
+def test_wait_ready_reports_readable_and_writable():
+    a, b = socket.socketpair()
+    try:
+        assert transport.wait_ready([a], [], 0) == ([], [])
+        b.send(b"x")
+        readable, writable = transport.wait_ready([a.fileno()], [b], 1)
+        assert readable == [a.fileno()] and writable == [b]  # given back as given
+        b.close()
+        assert transport.wait_ready([a], [], 1)[0] == [a]  # a hang-up is readable: read() tells
+    finally:
+        a.close()
+        b.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no poll()")
+def test_wait_ready_beyond_fd_setsize():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if max(soft, hard) <= 1100:
+        pytest.skip("can't open file descriptors past 1024 here")
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 1100), hard))
+    a, b = socket.socketpair()
+    high = 1050
+    os.dup2(a.fileno(), high)
+    try:
+        b.send(b"x")
+        assert transport.wait_ready([high], [], 1)[0] == [high]
+    finally:
+        os.close(high)
+        a.close()
+        b.close()
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
@@ -0,0 +1,45 @@
+"""Helpers for the file transfer tests (test_xyzmodem.py, test_kermit.py)."""
+import hashlib
+import threading
+
+import xyzmodem
+
+
+def make_file(path, size, seed=b"x"):
+    data = (hashlib.sha256(seed).digest() * (size // 32 + 1))[:size]
+    data = bytes(bytearray((b * 7 + i) % 256 for i, b in enumerate(bytearray(data))))  # every byte value, ZDLE too
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def transfer(send, receive, pair=None):
+    """Runs receive(conn) on a thread and send(conn) here.  Returns both results."""
+    ours, theirs = pair or xyzmodem.loopback()
+    received = []
+    thread = threading.Thread(target=lambda: received.append(receive(theirs)))
+    thread.start()
+    try:
+        sent = send(ours)
+    finally:
+        thread.join(60)
+        ours.close()
+        theirs.close()
+    assert received, "the receiver failed"
+    return sent, received[0]
+
+
+def partial_download(tmp_path, size, have):
+    """A size byte file to send, and a folder where the first have bytes of it arrived already."""
+    source = str(tmp_path / "image.bin")
+    data = make_file(source, size)
+    folder = tmp_path / "received"
+    folder.mkdir()
+    with open(str(folder / "image.bin"), "wb") as f:
+        f.write(data[:have])
+    return source, str(folder)
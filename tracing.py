@@ -0,0 +1,309 @@
+"""
+Opt-in tracing of the mock crt API: where does a script's time go?  Into the device
+(WaitForString, ReadString, Connect...), Sleep, dialogs, or its own work?
+
+    SCRT_TRACE=1 python myscript.py                 # summary table on stderr at exit
+    SCRT_TRACE=/tmp/run.folded python myscript.py   # ... and a flame graph trace
+
+or from code:
+
+    import tracing
+    tracing.enable("/tmp/run.folded")
+    ...
+    print(tracing.summary())
+
+enable() wraps every crt entry point (the CamelCase methods of fake_scrt's classes:
+Screen.Send, Screen.WaitForString(s), Screen.ReadString, Session.Connect, crt.Sleep,
+Dialog.Prompt...).  For each it records the call count, time spent in it (a log2
+histogram, so it stays small and cheap however many calls there are), and bytes received
+from and sent to the remote during the call.  A call made from inside another (e.g.
+ConnectInTab -> Connect) is counted in its own row, but only the outermost one counts as
+time the script spent in crt.
+
+The trace is in the folded stack format (flamegraph.pl, speedscope, inferno): one line per
+stack, script frames then crt calls, with the microseconds spent there.  Only the innermost
+STACK_DEPTH frames are kept (deeper stacks start with "..."), so a call's cost doesn't grow
+with the depth of the script's stack.  The time the
+script spent outside crt calls is under "(script's own work)".
+"""
+import atexit
+import collections
+import os
+import sys
+import threading
+import time
+
+clock = getattr(time, "perf_counter", time.time)
+
+STACK_DEPTH = 16  # frames above a crt call kept in its stack in the trace
+
+_BUCKETS = 40  # histogram buckets: bucket n holds calls of less than 2**n microseconds
+_OWN_WORK = "(script's own work)"
+_CATEGORIES = (("crt.Sleep", "sleep"), ("Dialog.", "dialogs"), ("Screen.", "device"), ("Session.", "device"),
+               ("Tab.", "device"), ("FileTransferObject.", "device"), ("CommandWindow.", "device"))
+
+
+class CallStats(object):
+    """One entry point's numbers.  Times are in seconds."""
+    __slots__ = ("name", "count", "total", "max", "bytes_in", "bytes_out", "histogram")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes_in = 0  # received from the remote during the calls
+        self.bytes_out = 0  # sent to it
+        self.histogram = [0] * _BUCKETS
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """An upper bound (within 2x) on the p-th percentile call time."""
+        wanted = self.count * p / 100.0
+        seen = 0
+        for bucket, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= wanted:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def __repr__(self):
+        return "<CallStats {} x{} {:.3f}s>".format(self.name, self.count, self.total)
+
+
+class _Tracer(object):
+    def __init__(self):
+        self.stats = {}
+        self.stacks = collections.defaultdict(float)  # folded stack -> seconds of self time
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.in_crt = 0.0  # outermost calls only
+        self.started = clock()
+        self.local = threading.local()
+        self._stack_names = {}  # (code objects..., call names...) -> folded stack
+
+
+_tracer = None
+_patched = []  # (class, name, original attribute)
+_exit_hook = {"registered": False, "trace_file": None, "summary": True}
+_skip_files = set()
+
+
+def enable(trace_file=None, summary=True, module=None):
+    """Starts tracing the crt API.
+
+    Args:
+        trace_file (str): where to write the folded stack trace at exit (None: no trace)
+        summary (bool): print the summary table to stderr at exit
+        module: the fake_scrt module (default: import it)
+    """
+    global _tracer
+    if module is None:
+        import fake_scrt as module
+    if _tracer is None:
+        _tracer = _Tracer()
+        _skip_files.update(_source(m) for m in (sys.modules[__name__], module))
+        _instrument(module)
+    _exit_hook["trace_file"] = trace_file
+    _exit_hook["summary"] = summary
+    if not _exit_hook["registered"]:
+        atexit.register(_at_exit)
+        _exit_hook["registered"] = True
+    return _tracer
+
+
+def disable():
+    """Stops tracing (the numbers so far are dropped)."""
+    global _tracer
+    while _patched:
+        cls, name, original = _patched.pop()
+        setattr(cls, name, original)
+    _tracer = None
+
+
+def reset():
+    """Drops the numbers so far (tracing goes on)."""
+    if _tracer is not None:
+        _tracer.__init__()
+
+
+def stats():
+    """{entry point: CallStats}"""
+    return dict(_tracer.stats) if _tracer else {}
+
+
+def summary():
+    """The numbers as a table: where the time went, then one row per entry point."""
+    if _tracer is None:
+        return "tracing is off"
+    wall = clock() - _tracer.started
+    by_category = collections.defaultdict(float)
+    for stack, seconds in _tracer.stacks.items():
+        by_category[_category(stack.rsplit(";", 1)[-1])] += seconds  # self time, so nothing twice
+    own = max(wall - _tracer.in_crt, 0.0)
+    parts = ["{} {:.3f}s ({:.0f}%)".format(name, seconds, seconds / wall * 100 if wall else 0)
+             for name, seconds in sorted(by_category.items(), key=lambda item: -item[1])]
+    lines = ["wall {:.3f}s: {}, own work {:.3f}s ({:.0f}%); {} bytes in, {} bytes out".format(
+        wall, ", ".join(parts) or "no crt calls", own, own / wall * 100 if wall else 0,
+        _tracer.bytes_in, _tracer.bytes_out)]
+    lines.append("{:<36} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "call", "count", "total s", "mean ms", "p50 ms", "p99 ms", "max ms", "bytes in", "bytes out"))
+    for s in sorted(_tracer.stats.values(), key=lambda s: -s.total):
+        lines.append("{:<36} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10} {:>10}".format(
+            s.name, s.count, s.total, s.mean * 1000, s.percentile(50) * 1000, s.percentile(99) * 1000,
+            s.max * 1000, s.bytes_in, s.bytes_out))
+    return "\n".join(lines)
+
+
+def folded():
+    """The trace, in the folded stack format: "frame;frame;call microseconds" lines."""
+    if _tracer is None:
+        return ""
+    stacks = dict(_tracer.stacks)
+    stacks[_OWN_WORK] = max(clock() - _tracer.started - _tracer.in_crt, 0.0)
+    return "".join("{} {}\n".format(stack, int(seconds * 1e6)) for stack, seconds in sorted(stacks.items())
+                   if seconds >= 1e-6)
+
+
+def write_folded(path):
+    with open(path, "w") as f:
+        f.write(folded())
+
+
+#####
+# wrapping
+
+def _instrument(module):
+    """Wraps the CamelCase methods of the module's API classes, and counts the bytes going
+    through Screen."""
+    screen = module.Screen
+    receive, send = screen._receive, screen.Send
+
+    def _receive(self, data):
+        _tracer.bytes_in += len(data)
+        return receive(self, data)
+
+    def Send(self, string="Send String", send_to_screen_only=False):
+        if not send_to_screen_only and self._transport is not None:
+            _tracer.bytes_out += len(string if isinstance(string, bytes) else string.encode("utf-8"))
+        return send(self, string, send_to_screen_only)
+    Send.__doc__ = send.__doc__
+    _patch(screen, "_receive", _receive)
+    _patch(screen, "Send", Send)  # (wrapped below like the rest, so its call sees the bytes)
+    seen = set()
+    for cls, label in _api_classes(module):
+        if cls in seen:
+            continue
+        seen.add(cls)
+        for name, attr in list(vars(cls).items()):
+            if not name[:1].isupper():
+                continue
+            if isinstance(attr, staticmethod):
+                _patch(cls, name, staticmethod(_wrap(attr.__func__, label + "." + name)))
+            elif callable(attr) and not isinstance(attr, type):
+                _patch(cls, name, _wrap(attr, label + "." + name))
+
+
+def _api_classes(module):
+    """(class, label) for the API classes: the module's own, and those nested in SecureCRT
+    (or whose instances are)."""
+    found = [(module.SecureCRT, "crt")]
+    for name in ("Screen", "Session", "Tab", "SessionConfig"):
+        found.append((getattr(module, name), name))
+    for name, value in vars(module.SecureCRT).items():
+        cls = value if isinstance(value, type) else type(value)
+        if getattr(cls, "__module__", None) == module.__name__ and cls is not module.SecureCRT:
+            found.append((cls, cls.__name__))
+    return found
+
+
+def _patch(cls, name, attr):
+    _patched.append((cls, name, cls.__dict__[name]))
+    setattr(cls, name, attr)
+
+
+def _wrap(func, name):
+    def traced(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return func(*args, **kwargs)
+        local = tracer.local
+        calls = getattr(local, "calls", None)
+        if calls is None:
+            calls = local.calls = []
+        frame = [name, 0.0]  # name, time in calls made from this one
+        calls.append(frame)
+        bytes_in, bytes_out = tracer.bytes_in, tracer.bytes_out
+        started = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = clock() - started
+            calls.pop()
+            stats = tracer.stats.get(name)
+            if stats is None:
+                stats = tracer.stats[name] = CallStats(name)
+            stats.count += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+            stats.histogram[min(int(elapsed * 1e6).bit_length(), _BUCKETS - 1)] += 1
+            stats.bytes_in += tracer.bytes_in - bytes_in
+            stats.bytes_out += tracer.bytes_out - bytes_out
+            if calls:
+                calls[-1][1] += elapsed
+            else:
+                tracer.in_crt += elapsed
+            tracer.stacks[_stack_name(tracer, calls, name)] += elapsed - frame[1]
+    traced.__name__ = func.__name__
+    traced.__doc__ = func.__doc__
+    traced._traced = func
+    return traced
+
+
+def _stack_name(tracer, calls, name):
+    """The folded stack for a call: the script's frames (outermost first), then the crt calls."""
+    codes = [call[0] for call in calls]
+    codes.append(name)
+    frame = sys._getframe(2)
+    for _ in range(STACK_DEPTH):
+        if frame is None:
+            break
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    else:
+        if frame is not None:
+            codes.append(None)  # truncated
+    key = tuple(codes)
+    stack = tracer._stack_names.get(key)
+    if stack is None:
+        frames = ["..." if code is None else "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+                  for code in reversed(key[len(calls) + 1:]) if code is None or code.co_filename not in _skip_files]
+        stack = tracer._stack_names[key] = ";".join(frames + list(key[:len(calls) + 1]))
+    return stack
+
+
+def _category(name):
+    for prefix, category in _CATEGORIES:
+        if name.startswith(prefix):
+            return category
+    return "other crt"
+
+
+def _source(module):
+    filename = getattr(module, "__file__", "") or ""
+    return filename[:-1] if filename.endswith(".pyc") else filename
+
+
+def _at_exit():
+    if _tracer is None:
+        return
+    if _exit_hook["trace_file"]:
+        write_folded(_exit_hook["trace_file"])
+    if _exit_hook["summary"]:
+        sys.stderr.write(summary() + "\n")
+        if _exit_hook["trace_file"]:
+            sys.stderr.write("trace: {}\n".format(_exit_hook["trace_file"]))
@@ -0,0 +1,562 @@
+"""
+Local stand-ins for a SecureCRT connection, so fake_scrt's Session.Connect/ConnectInTab
+drive a real byte stream instead of returning an empty Tab.
+
+The SecureCRT command line (as built by connect.py) is parsed by parse_cmdline(), and
+open_transport() picks a transport for the hostname:
+
+- PtyTransport runs a local program (by default your shell) in a pseudo-terminal.
+- ScriptedDevice is an in-process fake network device: prompt, echo, canned command output.
+- SocketTransport is a socket, e.g. a socketpair() with a thread on the other end.
+
+Register your own stand-ins by hostname pattern, e.g.:
+
+    import transport
+    transport.register("rtr-*", lambda args: transport.ScriptedDevice(args.hostname, responses={...}))
+
+Every transport has a fileno() for select() (or wait_ready()), a non-blocking read() and write().  /LOCAL port
+forwards from the command line are started as real listeners on 127.0.0.1, relaying to the
+target as seen from the stand-in (i.e. from this machine).
+"""
+import errno
+import fnmatch
+import math
+import os
+import re
+import select
+import shlex
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+    import pty
+    import struct
+    import termios
+except ImportError:  # Windows: no pseudo-terminals, only ScriptedDevice
+    pty = None
+
+_READ_SIZE = 65536
+# what ScriptedDevice's line editor cares about: line ends and backspaces
+_LINE_EDIT_RE = re.compile(b"([\r\n\x08\x7f])")
+_LINE_END_RE = re.compile(b"[\r\n]")
+
+
+class ConnectArgs(object):
+    """A parsed SecureCRT connect command line, e.g. "/SSH2 /L user /LOCAL 5000:127.0.0.1:80 host"."""
+    def __init__(self):
+        self.protocol = "SSH2"
+        self.hostname = ""
+        self.port = None
+        self.username = None
+        self.password = None
+        self.identity_file = None
+        self.session = None
+        self.accept_host_keys = False
+        self.local_forwards = []  # (local port, remote host, remote port)
+        self.remote_forwards = []  # (remote port, local host, local port)
+        self.options = []  # any other switches, e.g. "/T", "/FORWARDX11PACKETS"
+
+    def __repr__(self):
+        return "<ConnectArgs {} {}@{}:{}>".format(self.protocol, self.username, self.hostname, self.port)
+
+
+_PROTOCOLS = ("SSH1", "SSH2", "TELNET", "RLOGIN", "SERIAL", "TAPI", "RAW")
+_DEFAULT_PORTS = {"SSH1": 22, "SSH2": 22, "TELNET": 23, "RLOGIN": 513}
+_VALUE_SWITCHES = ("L", "P", "PASSWORD", "PW", "I", "S", "LOCAL", "REMOTE", "ARG")
+
+
+def _forward_spec(spec):
+    """'5000:127.0.0.1:80' -> (5000, '127.0.0.1', 80)"""
+    parts = spec.strip().split(":")
+    try:
+        if len(parts) < 3:
+            raise ValueError
+        return int(parts[0]), ":".join(parts[1:-1]), int(parts[-1])
+    except ValueError:
+        raise ValueError("Bad port forward spec (want <port>:<host>:<port>): {!r}".format(spec))
+
+
+def parse_cmdline(arguments):
+    """Parses SecureCRT command line arguments into a ConnectArgs."""
+    args = ConnectArgs()
+    tokens = shlex.split(arguments, posix=os.name != "nt")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if not token.startswith("/"):
+            args.hostname = token  # the last bare word is the host
+            continue
+        switch = token[1:].upper()
+        if switch in _PROTOCOLS:
+            args.protocol = switch
+            continue
+        if switch == "ACCEPTHOSTKEYS":
+            args.accept_host_keys = True
+            continue
+        if switch not in _VALUE_SWITCHES or i >= len(tokens):
+            args.options.append(token)
+            continue
+        value = tokens[i]
+        i += 1
+        if switch == "L":
+            args.username = value
+        elif switch == "P":
+            args.port = int(value)
+        elif switch in ("PASSWORD", "PW"):
+            args.password = value
+        elif switch == "I":
+            args.identity_file = value
+        elif switch == "S":
+            args.session = value
+        elif switch == "LOCAL":
+            args.local_forwards.append(_forward_spec(value))
+        elif switch == "REMOTE":
+            args.remote_forwards.append(_forward_spec(value))
+        else:
+            args.options.extend([token, value])
+    if "@" in args.hostname:
+        user, args.hostname = args.hostname.rsplit("@", 1)
+        args.username = args.username or user
+    host, _, port = args.hostname.rpartition(":")
+    if host and ":" not in host and port.isdigit():
+        args.hostname, args.port = host, int(port)
+    if args.port is None:
+        args.port = _DEFAULT_PORTS.get(args.protocol)
+    return args
+
+
+#####
+# transports
+
+def wait_ready(readers, writers=(), timeout=None):
+    """Like select.select(readers, writers, [], timeout)[:2], but with poll() where there is
+    one, so file descriptors of FD_SETSIZE (1024) and up work too.  Returns the (readable,
+    writable) ones; timeout None waits forever."""
+    if not hasattr(select, "poll"):  # Windows
+        return select.select(readers, writers, [], timeout)[:2]
+    wanted = dict()  # fd -> [object, events]
+    for obj, events in [(obj, select.POLLIN) for obj in readers] + [(obj, select.POLLOUT) for obj in writers]:
+        wanted.setdefault(obj if isinstance(obj, int) else obj.fileno(), [obj, 0])[1] |= events
+    poller = select.poll()
+    for fd, (obj, events) in wanted.items():
+        poller.register(fd, events)
+    readable, writable = [], []
+    for fd, events in poller.poll(None if timeout is None else int(math.ceil(timeout * 1000))):
+        obj, asked = wanted[fd]
+        if events & select.POLLOUT or (events & ~select.POLLIN and asked & select.POLLOUT):
+            writable.append(obj)
+        if events & select.POLLIN or (events & ~select.POLLOUT and asked & select.POLLIN):
+            readable.append(obj)  # hangups and errors too: read() will tell
+    return readable, writable
+
+
+class Transport(object):
+    """Base class for connection stand-ins."""
+    closed = False
+
+    def __init__(self):
+        self.forwards = []
+
+    def fileno(self):
+        """File descriptor that select() reports readable when read() has data (or EOF)."""
+        raise NotImplementedError
+
+    def read(self):
+        """Returns the bytes available now (b"" if none), or None once the remote has gone away."""
+        raise NotImplementedError
+
+    def write(self, data):
+        """Sends bytes to the remote."""
+        raise NotImplementedError
+
+    def write_some(self, data):
+        """Sends as much of data as can go without blocking; returns how many bytes that was."""
+        self.write(data)
+        return len(data)
+
+    def resolve_forward(self, host, port):
+        """Where a port forward to host:port (as seen from the remote) really goes."""
+        return host, port
+
+    def close(self):
+        self.closed = True
+        for forward in self.forwards:
+            forward.close()
+        self.forwards = []
+
+
+class PtyTransport(Transport):
+    """Runs a local program in a pseudo-terminal (POSIX only)."""
+    def __init__(self, argv=None, env=None, rows=24, columns=80):
+        Transport.__init__(self)
+        if pty is None:
+            raise OSError("PtyTransport needs pseudo-terminal support (not available on this OS).")
+        argv = argv or [os.environ.get("SHELL", "/bin/sh")]
+        env = dict(os.environ if env is None else env, TERM="vt100")
+        pid, fd = pty.fork()
+        if pid == 0:  # child
+            try:
+                os.execvpe(argv[0], argv, env)
+            finally:
+                os._exit(127)
+        self.pid = pid
+        self._fd = fd
+        fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, columns, 0, 0))
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self._fd
+
+    def read(self):
+        if self.closed:
+            return None
+        try:
+            return os.read(self._fd, _READ_SIZE) or None
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return b""
+            if e.errno == errno.EIO:  # Linux: the child has exited
+                return None
+            raise
+
+    def write(self, data):
+        while data:
+            sent = self.write_some(data)
+            data = data[sent:]
+            if data and not sent:
+                wait_ready([], [self._fd], 1.0)
+
+    def write_some(self, data):
+        try:
+            return os.write(self._fd, data)
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise
+            return 0
+
+    def close(self):
+        if self.closed:
+            return
+        Transport.close(self)
+        os.close(self._fd)
+        try:
+            os.kill(self.pid, 1)  # SIGHUP, as a real terminal hang-up would
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+
+
+class ScriptedDevice(Transport):
+    """An in-process fake network device.
+
+    Args:
+        hostname (str): shows up in the prompt
+        prompt (str): prompt format, "{hostname}" is substituted
+        responses (dict): command -> output (str), or callable(command) -> output
+        banner (str): sent when the connection opens
+        username (str): if set, the device asks for a username and password first
+        password (str): the password that goes with username
+        echo (bool): echo input, like a real terminal line
+        line_rate (float): lines per second the device gets through (None: as fast as they come).
+            Input waits in a buffer of input_buffer bytes meanwhile; what doesn't fit is lost.
+        input_buffer (int): see line_rate
+    """
+    def __init__(self, hostname="device", prompt="{hostname}#", responses=None, banner="",
+                 username=None, password=None, echo=True, line_rate=None, input_buffer=4096):
+        Transport.__init__(self)
+        self.hostname = hostname
+        self.prompt = prompt.format(hostname=hostname)
+        self.responses = responses or dict()
+        self.username = username
+        self.password = password
+        self.echo = echo
+        self.received = []  # lines the device has received, for checking a script's work
+        self._state = "username" if username else "cli"
+        self._given_user = None
+        self._line = bytearray()
+        self._last_was_cr = False
+        self._out = bytearray()
+        self._lock = threading.Lock()
+        self._signal_r, self._signal_w = socket.socketpair()
+        self._signal_r.setblocking(False)
+        self.line_rate = line_rate
+        self.input_buffer = input_buffer
+        self.dropped = 0  # bytes lost to a full input buffer
+        self._pending = bytearray()
+        self._pending_ready = threading.Condition(self._lock)
+        if line_rate:
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+        self._output(banner + self._prompt_text())
+
+    def _prompt_text(self):
+        return {"username": "Username: ", "password": "Password: "}.get(self._state, self.prompt)
+
+    def _output(self, text):
+        if not text:
+            return
+        data = text.encode("utf-8") if not isinstance(text, bytes) else text
+        with self._lock:
+            was_empty = not self._out
+            self._out += data
+        if was_empty:
+            self._signal()
+
+    def _signal(self):
+        """Makes fileno() readable."""
+        try:
+            self._signal_w.send(b"x")
+        except socket.error:
+            pass
+
+    def respond(self, command):
+        """Returns the device's output for a command line."""
+        response = self.responses.get(command)
+        if response is None and not command:
+            response = ""
+        if response is None:
+            return "% Invalid input detected at '^' marker.\r\n"
+        if callable(response):
+            response = response(command)
+        return response if response.endswith("\n") or not response else response + "\r\n"
+
+    def fileno(self):
+        return self._signal_r.fileno()
+
+    def read(self):
+        if self.closed:
+            return None
+        try:
+            self._signal_r.recv(_READ_SIZE)
+        except socket.error:
+            pass
+        with self._lock:
+            data = bytes(self._out[:_READ_SIZE])  # at most what a socket read would return
+            del self._out[:_READ_SIZE]
+            more = bool(self._out)
+        if more:
+            self._signal()
+        return data
+
+    def write(self, data):
+        if isinstance(data, bytearray):
+            data = bytes(data)
+        if not self.line_rate:
+            self._type(data)
+            return
+        with self._lock:
+            room = max(self.input_buffer - len(self._pending), 0)
+            self._pending += data[:room]
+            self.dropped += max(len(data) - room, 0)
+            self._pending_ready.notify()
+
+    def _work(self):
+        """With a line_rate: takes input from the buffer, a line every 1/line_rate seconds."""
+        while not self.closed:
+            with self._lock:
+                while not self._pending and not self.closed:
+                    self._pending_ready.wait(0.5)
+                m = _LINE_END_RE.search(self._pending)
+                end = m.end() if m else len(self._pending)
+                data = bytes(self._pending[:end])
+                del self._pending[:end]
+            if data and not self.closed:
+                self._type(data)
+                if m:
+                    time.sleep(1.0 / self.line_rate)
+
+    def _type(self, data):
+        for piece in _LINE_EDIT_RE.split(data):
+            if not piece:
+                continue
+            if piece in (b"\r", b"\n"):
+                if piece == b"\n" and self._last_was_cr:
+                    self._last_was_cr = False
+                    continue
+                self._last_was_cr = piece == b"\r"
+                line = self._line.decode("utf-8", "replace")
+                del self._line[:]
+                self._output("\r\n")
+                self._enter(line)
+                continue
+            self._last_was_cr = False
+            if piece in (b"\x08", b"\x7f"):
+                if self._line:
+                    del self._line[-1]
+                    if self._echoing():
+                        self._output("\x08 \x08")
+                continue
+            self._line += piece
+            if self._echoing():
+                self._output(piece)
+
+    def _echoing(self):
+        return self.echo and self._state != "password"
+
+    def _enter(self, line):
+        self.received.append(line)
+        if self._state == "username":
+            self._given_user = line
+            self._state = "password"
+        elif self._state == "password":
+            ok = self._given_user == self.username and line == self.password
+            if not ok:
+                self._output("% Authentication failed\r\n\r\n")
+            self._state = "cli" if ok else "username"
+        elif line.strip() in ("exit", "logout", "quit"):
+            self.closed = True  # hang up: the next read() reports EOF
+            self._signal()
+            return
+        else:
+            self._output(self.respond(line.strip()))
+        self._output(self._prompt_text())
+
+    def close(self):
+        Transport.close(self)
+        with self._lock:
+            self._pending_ready.notify()
+        self._signal_r.close()
+        self._signal_w.close()
+
+
+class SocketTransport(Transport):
+    """A connected socket, e.g. one end of socket.socketpair() with something on the other
+    end playing the remote (see xyzmodem.loopback)."""
+    def __init__(self, sock):
+        Transport.__init__(self)
+        self.sock = sock
+        sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read(self):
+        if self.closed:
+            return None
+        try:
+            return self.sock.recv(_READ_SIZE) or None
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return b""
+            if e.errno in (errno.ECONNRESET, errno.EPIPE):
+                return None
+            raise
+
+    def write(self, data):
+        while data:
+            sent = self.write_some(data)
+            data = data[sent:]
+            if data and not sent:
+                wait_ready([], [self.sock], 1.0)
+
+    def write_some(self, data):
+        try:
+            return self.sock.send(data)
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise
+            return 0
+
+    def close(self):
+        if self.closed:
+            return
+        Transport.close(self)
+        self.sock.close()
+
+
+#####
+# port forwards
+
+class LocalForward(object):
+    """Listens on 127.0.0.1:<port> and relays each connection to host:port."""
+    def __init__(self, listen_port, host, port, bind="127.0.0.1"):
+        self.host = host
+        self.port = port
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((bind, listen_port))
+        self._sock.listen(64)
+        self.listen_port = self._sock.getsockname()[1]
+        self._closed = False
+        thread = threading.Thread(target=self._accept_loop, name="forward-{}".format(self.listen_port))
+        thread.daemon = True
+        thread.start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                client, _ = self._sock.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self._relay, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _relay(self, client):
+        try:
+            upstream = socket.create_connection((self.host, self.port), timeout=10)
+        except socket.error:
+            client.close()
+            return
+        upstream.settimeout(None)
+        peers = {client: upstream, upstream: client}
+        try:
+            while True:
+                readable, _ = wait_ready(list(peers))
+                for sock in readable:
+                    data = sock.recv(_READ_SIZE)
+                    if not data:
+                        return
+                    peers[sock].sendall(data)
+        except socket.error:
+            pass
+        finally:
+            client.close()
+            upstream.close()
+
+    def close(self):
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)  # wakes up the accept() in _accept_loop
+        except socket.error:
+            pass
+        self._sock.close()
+
+
+#####
+# picking a transport for a host
+
+_factories = []
+
+
+def register(host_pattern, factory):
+    """Use factory(ConnectArgs) -> Transport for hosts matching host_pattern (fnmatch-style).
+    Later registrations take precedence."""
+    _factories.insert(0, (host_pattern.lower(), factory))
+
+
+def local_shell(args):
+    """Default stand-in: a local shell in a pty."""
+    return PtyTransport()
+
+
+def open_transport(args):
+    """Opens a transport for a ConnectArgs, and starts its /LOCAL port forwards."""
+    hostname = args.hostname.lower()
+    for pattern, factory in _factories:
+        if fnmatch.fnmatch(hostname, pattern):
+            break
+    else:
+        factory = local_shell
+    transport = factory(args)
+    try:
+        for listen_port, host, port in args.local_forwards:
+            transport.forwards.append(LocalForward(listen_port, *transport.resolve_forward(host, port)))
+    except socket.error:
+        transport.close()
+        raise
+    return transport
@@ -0,0 +1,379 @@
+"""
+A small VT100/ANSI terminal model, used by fake_scrt.Screen to keep a real picture of the
+screen, so that Get/Get2 and the cursor properties return what SecureCRT would show.
+
+Each row is stored as a bytearray of Columns cells (latin-1; characters outside latin-1 are
+stored as '?'), with a per-row text cache (and one of the text right-stripped, for Get2)
+so rectangle reads are just str slices.  Rows
+that change are recorded in Terminal.dirty until someone calls take_dirty().  Rows that
+scroll off the top of the screen are passed to Terminal.on_scroll, if set (see
+scrollback.py).
+"""
+import codecs
+import re
+
+# printable runs, CRLF, CSI, OSC, other ESC sequences, single C0/DEL control chars
+_TOKEN_RE = re.compile(
+    u"([^\x00-\x1f\x7f]+)"
+    u"|(\r\n)"
+    u"|\x1b\\[([0-?]*)[ -/]*([@-~])"
+    u"|\x1b\\][^\x07\x1b]*(?:\x07|\x1b\\\\)"
+    u"|\x1b([ -/]*[0-Z\\^-~])"
+    u"|([\x00-\x1a\x1c-\x1f\x7f])")
+# an escape sequence that was cut off at the end of a chunk
+_PARTIAL_RE = re.compile(u"\x1b(?:\\[[0-?]*[ -/]*|\\][^\x07\x1b]*\x1b?|[ -/]*)?\\Z")
+_TAB_WIDTH = 8
+
+
+class Terminal(object):
+    """VT100 screen model: parses a stream of output and maintains the visible screen.
+
+    Rows and columns are 0-based internally; fake_scrt.Screen translates to SecureCRT's
+    1-based coordinates.
+    """
+    def __init__(self, rows=24, columns=80, encoding="utf-8"):
+        self.rows = rows
+        self.columns = columns
+        self.dirty = set()
+        self.on_scroll = None  # callable(row bytearray) for each row scrolled off the top
+        self._decoder = codecs.getincrementaldecoder(encoding)("replace")
+        self.reset()
+
+    def reset(self):
+        """Full reset (RIS): blank screen, home cursor, full scroll region."""
+        self._blank = bytearray(b" " * self.columns)
+        self._lines = [bytearray(self._blank) for _ in range(self.rows)]
+        self._text = [None] * self.rows
+        self._stripped = [None] * self.rows
+        self.cursor_row = 0
+        self.cursor_col = 0
+        self._saved = (0, 0)
+        self._top = 0
+        self._bottom = self.rows - 1
+        self._wrap_pending = False
+        self._partial = u""
+        self.dirty.update(range(self.rows))
+
+    def resize(self, rows, columns):
+        """Change the screen size, keeping the bottom-most rows and the left-most columns."""
+        if self.on_scroll is not None:
+            for line in self._lines[:-rows]:
+                self.on_scroll(line)
+        lines = [self._fit(line, columns) for line in self._lines[-rows:]]
+        while len(lines) < rows:
+            lines.append(bytearray(b" " * columns))
+        self.rows = rows
+        self.columns = columns
+        self._blank = bytearray(b" " * columns)
+        self._lines = lines
+        self._text = [None] * rows
+        self._stripped = [None] * rows
+        self.cursor_row = min(self.cursor_row, rows - 1)
+        self.cursor_col = min(self.cursor_col, columns - 1)
+        self._top = 0
+        self._bottom = rows - 1
+        self._wrap_pending = False
+        self.dirty = set(range(rows))
+
+    @staticmethod
+    def _fit(line, columns):
+        if len(line) >= columns:
+            return line[:columns]
+        return line + b" " * (columns - len(line))
+
+    #####
+    # reading the screen
+
+    def line(self, row):
+        """Returns the text of a (0-based) row, including trailing blanks."""
+        text = self._text[row]
+        if text is None:
+            text = self._text[row] = self._lines[row].decode("latin-1")
+        return text
+
+    def stripped_line(self, row):
+        """Returns the text of a (0-based) row, without trailing blanks."""
+        text = self._stripped[row]
+        if text is None:
+            text = self._stripped[row] = self.line(row).rstrip(u" ")
+        return text
+
+    def get(self, row1, col1, row2, col2):
+        """Returns the rectangle between two (1-based, inclusive) corners, rows concatenated."""
+        row1, col1, row2, col2 = self._clamp(row1, col1, row2, col2)
+        line = self.line
+        return u"".join([line(r)[col1:col2] for r in range(row1, row2)])
+
+    def get2(self, row1, col1, row2, col2):
+        """Like get(), but each row has trailing blanks stripped and rows are joined by \\r\\n."""
+        row1, col1, row2, col2 = self._clamp(row1, col1, row2, col2)
+        stripped = self.stripped_line
+        rows = []
+        for r in range(row1, row2):
+            text = stripped(r)
+            # the row's blanks only run past col2 if its text does
+            rows.append(text[col1:col2].rstrip(u" ") if len(text) > col2 else text[col1:])
+        return u"\r\n".join(rows)
+
+    def _clamp(self, row1, col1, row2, col2):
+        """1-based inclusive corners -> 0-based half-open row/column ranges."""
+        row1 = max(int(row1), 1) - 1
+        col1 = max(int(col1), 1) - 1
+        row2 = min(int(row2), self.rows)
+        col2 = min(int(col2), self.columns)
+        return row1, col1, max(row1, row2), max(col1, col2)
+
+    def take_dirty(self):
+        """Returns the sorted list of rows changed since the last call, and clears it."""
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        return dirty
+
+    #####
+    # writing to the screen
+
+    def clear(self):
+        """Blanks the screen and homes the cursor."""
+        self._erase_rows(0, self.rows)
+        self.cursor_row = self.cursor_col = 0
+        self._wrap_pending = False
+
+    def feed(self, data):
+        """Parses terminal output (bytes or text) and updates the screen."""
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        if self._partial:
+            data = self._partial + data
+            self._partial = u""
+        pos = 0
+        end = len(data)
+        match = _TOKEN_RE.match
+        while pos < end:
+            m = match(data, pos)
+            if m is None:
+                # a lone/unfinished ESC: hold it for the next chunk, or drop it if malformed
+                if _PARTIAL_RE.match(data, pos):
+                    self._partial = data[pos:]
+                    return
+                pos += 1
+                continue
+            pos = m.end()
+            text, crlf, csi_params, csi_final, esc, ctrl = m.groups()
+            if text is not None:
+                self._write(text.encode("latin-1", "replace"))
+            elif crlf is not None:
+                # by far the most common control sequence, so it gets its own fast path
+                self.cursor_col = 0
+                self._wrap_pending = False
+                self._linefeed()
+            elif csi_final is not None:
+                self._csi(csi_params, csi_final)
+            elif esc is not None:
+                self._esc(esc)
+            elif ctrl is not None:
+                self._control(ctrl)
+
+    def _write(self, run):
+        columns = self.columns
+        while run:
+            if self._wrap_pending:
+                self._wrap_pending = False
+                self.cursor_col = 0
+                self._linefeed()
+            row, col = self.cursor_row, self.cursor_col
+            chunk = run[:columns - col]
+            run = run[len(chunk):]
+            end = col + len(chunk)
+            self._lines[row][col:end] = chunk
+            self._text[row] = self._stripped[row] = None
+            self.dirty.add(row)
+            if end >= columns:
+                self.cursor_col = columns - 1
+                self._wrap_pending = True
+            else:
+                self.cursor_col = end
+
+    def _control(self, char):
+        if char == u"\r":
+            self.cursor_col = 0
+        elif char in u"\n\x0b\x0c":
+            self._linefeed()
+        elif char == u"\b":
+            self.cursor_col = max(self.cursor_col - 1, 0)
+        elif char == u"\t":
+            self.cursor_col = min((self.cursor_col // _TAB_WIDTH + 1) * _TAB_WIDTH, self.columns - 1)
+        else:
+            return  # BEL, NUL, SO/SI etc. don't touch the screen
+        self._wrap_pending = False
+
+    def _esc(self, seq):
+        if seq == u"7":
+            self._saved = (self.cursor_row, self.cursor_col)
+        elif seq == u"8":
+            self._move(*self._saved)
+        elif seq == u"D":
+            self._linefeed()
+        elif seq == u"E":
+            self.cursor_col = 0
+            self._linefeed()
+        elif seq == u"M":
+            if self.cursor_row == self._top:
+                self._scroll_down(1)
+            else:
+                self._move(self.cursor_row - 1, self.cursor_col)
+        elif seq == u"c":
+            self.reset()
+        # charset designations ("(B" etc.) and keypad modes don't affect the text model
+
+    def _csi(self, params, final):
+        if params.startswith(u"?") or params.startswith(u">"):
+            return  # private modes (cursor visibility, alt screen, ...) - not modelled
+        args = [int(p) if p.isdigit() else 0 for p in params.split(u";")] if params else []
+        n = (args[0] if args else 0) or 1
+        row, col = self.cursor_row, self.cursor_col
+        if final == u"A":
+            self._move(max(row - n, self._top if row >= self._top else 0), col)
+        elif final == u"B":
+            self._move(min(row + n, self._bottom if row <= self._bottom else self.rows - 1), col)
+        elif final == u"C":
+            self._move(row, col + n)
+        elif final == u"D":
+            self._move(row, col - n)
+        elif final == u"E":
+            self._move(row + n, 0)
+        elif final == u"F":
+            self._move(row - n, 0)
+        elif final in u"G`":
+            self._move(row, n - 1)
+        elif final == u"d":
+            self._move(n - 1, col)
+        elif final in u"Hf":
+            r = (args[0] if args else 0) or 1
+            c = (args[1] if len(args) > 1 else 0) or 1
+            self._move(r - 1, c - 1)
+        elif final == u"J":
+            mode = args[0] if args else 0
+            if mode == 0:
+                self._erase_cols(row, col, self.columns)
+                self._erase_rows(row + 1, self.rows)
+            elif mode == 1:
+                self._erase_rows(0, row)
+                self._erase_cols(row, 0, col + 1)
+            else:
+                self._erase_rows(0, self.rows)
+        elif final == u"K":
+            mode = args[0] if args else 0
+            if mode == 0:
+                self._erase_cols(row, col, self.columns)
+            elif mode == 1:
+                self._erase_cols(row, 0, col + 1)
+            else:
+                self._erase_cols(row, 0, self.columns)
+        elif final == u"X":
+            self._erase_cols(row, col, col + n)
+        elif final == u"@":
+            line = self._lines[row]
+            line[col:col] = b" " * n
+            del line[self.columns:]
+            self._touch(row)
+        elif final == u"P":
+            line = self._lines[row]
+            del line[col:col + n]
+            line.extend(b" " * (self.columns - len(line)))
+            self._touch(row)
+        elif final == u"L":
+            if self._top <= row <= self._bottom:
+                self._scroll_down(n, top=row)
+        elif final == u"M":
+            if self._top <= row <= self._bottom:
+                self._scroll_up(n, top=row)
+        elif final == u"S":
+            self._scroll_up(n)
+        elif final == u"T":
+            self._scroll_down(n)
+        elif final == u"r":
+            top = (args[0] if args else 0) or 1
+            bottom = (args[1] if len(args) > 1 else 0) or self.rows
+            if top < bottom <= self.rows:
+                self._top, self._bottom = top - 1, bottom - 1
+                self._move(0, 0)
+        elif final == u"s":
+            self._saved = (row, col)
+        elif final == u"u":
+            self._move(*self._saved)
+        # SGR (m), modes (h/l), DSR (n) etc. don't change the text on screen
+
+    #####
+    # primitives
+
+    def _move(self, row, col):
+        self.cursor_row = min(max(row, 0), self.rows - 1)
+        self.cursor_col = min(max(col, 0), self.columns - 1)
+        self._wrap_pending = False
+
+    def _touch(self, row):
+        self._text[row] = self._stripped[row] = None
+        self.dirty.add(row)
+
+    def _erase_cols(self, row, col1, col2):
+        col2 = min(col2, self.columns)
+        if col1 < col2:
+            self._lines[row][col1:col2] = self._blank[col1:col2]
+            self._touch(row)
+
+    def _erase_rows(self, row1, row2):
+        for row in range(row1, row2):
+            self._lines[row] = bytearray(self._blank)
+            self._touch(row)
+
+    def _linefeed(self):
+        if self.cursor_row == self._bottom:
+            self._scroll_up(1)
+        elif self.cursor_row < self.rows - 1:
+            self.cursor_row += 1
+
+    def _scroll_up(self, n, top=None):
+        """Scrolls the region [top, bottom] up by n lines, blank lines entering at the bottom."""
+        top = self._top if top is None else top
+        bottom = self._bottom
+        lines, text, stripped = self._lines, self._text, self._stripped
+        if n == 1 and top == 0 and bottom == self.rows - 1:
+            # whole screen scrolling up a line, e.g. command output going by
+            if self.on_scroll is not None:
+                self.on_scroll(lines[0])
+            del lines[0]
+            del text[0]
+            del stripped[0]
+            lines.append(bytearray(self._blank))
+            text.append(None)
+            stripped.append(None)
+            if len(self.dirty) < self.rows:
+                self.dirty.update(range(self.rows))
+            return
+        n = min(n, bottom - top + 1)
+        if top == 0 and self.on_scroll is not None:
+            for line in lines[:n]:
+                self.on_scroll(line)
+        del lines[top:top + n]
+        del text[top:top + n]
+        del stripped[top:top + n]
+        for _ in range(n):
+            lines.insert(bottom - n + 1, bytearray(self._blank))
+            text.insert(bottom - n + 1, None)
+            stripped.insert(bottom - n + 1, None)
+        self.dirty.update(range(top, bottom + 1))
+
+    def _scroll_down(self, n, top=None):
+        """Scrolls the region [top, bottom] down by n lines, blank lines entering at the top."""
+        top = self._top if top is None else top
+        bottom = self._bottom
+        n = min(n, bottom - top + 1)
+        lines, text, stripped = self._lines, self._text, self._stripped
+        del lines[bottom - n + 1:bottom + 1]
+        del text[bottom - n + 1:bottom + 1]
+        del stripped[bottom - n + 1:bottom + 1]
+        for _ in range(n):
+            lines.insert(top, bytearray(self._blank))
+            text.insert(top, None)
+            stripped.insert(top, None)
+        self.dirty.update(range(top, bottom + 1))
@@ -0,0 +1,1007 @@
+"""
+XMODEM, YMODEM and ZMODEM file transfer over a transport (see transport.py): what
+crt.FileTransfer's Send*/Receive* methods run on the session.
+
+    result = send_zmodem(tab.Screen._transport, ["firmware.bin"])   # the remote ran "rz"
+    print(result)   # <TransferResult zmodem 1 file(s) 33554432 bytes in 1.42s: 22.5 MB/s ...>
+
+- XMODEM: one file, 128 byte blocks (1K with block_size=1024), CRC16, or the old
+  checksum if the receiver asks for it.  The receiver strips the trailing ^Z padding.
+- YMODEM (batch): 1K blocks, and a block 0 with each file's name, size and mtime.
+- ZMODEM: the sender streams data subpackets without waiting, asking for an ack every
+  window/4 bytes and only stopping when more than window bytes are unacknowledged (window
+  None: never), so throughput doesn't depend on the round trip time.  CRC32 when the
+  receiver can do it.  Errors are recovered from with ZRPOS, and a receiver with resume=True
+  carries on from the end of a partial file.
+
+Files to send are memory-mapped, and blocks are taken as views of the mapping, not read
+into strings; received data is written to disk as it arrives.  The CRCs are binascii's
+(table-driven, in C).
+
+Every function takes a transport or a Channel, and returns a TransferResult; a Channel
+keeps anything read past the end of the transfer (e.g. the shell prompt) in leftover().
+
+    python xyzmodem.py bench [megabytes]   # loopback throughput and CPU per MB
+"""
+import binascii
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+
+import transport
+
+TIMEOUT = 10  # seconds to wait for the other end, before retrying
+RETRIES = 10
+WINDOW = 256 * 1024  # ZMODEM: bytes the sender may have unacknowledged (None: unlimited)
+ZMODEM_BLOCK = 1024  # ZMODEM data subpacket size (up to 8192)
+
+SOH, STX, EOT, ACK, NAK, CAN, SUB = 0x01, 0x02, 0x04, 0x06, 0x15, 0x18, 0x1a
+CRC = 0x43  # "C": the receiver wants CRC16
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:  # Python 2
+    _cpu_time = time.clock
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferTimeout(TransferError):
+    pass
+
+
+class TransferCancelled(TransferError):
+    pass
+
+
+class TransferResult(object):
+    """What a transfer did: files ([(path, bytes)]), bytes, elapsed (s), cpu (s of this
+    process's CPU time, both ends if they run here), and errors (blocks sent again)."""
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.files = []
+        self.bytes = 0
+        self.errors = 0
+        self._started = time.time()
+        self._cpu_started = _cpu_time()
+        self.elapsed = None
+        self.cpu = None
+
+    def _add(self, path, size):
+        self.files.append((path, size))
+        self.bytes += size
+
+    def _done(self):
+        self.elapsed = time.time() - self._started
+        self.cpu = _cpu_time() - self._cpu_started
+        return self
+
+    @property
+    def rate(self):
+        """MB/s"""
+        return self.bytes / 1e6 / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cpu_per_mb(self):
+        """CPU seconds per MB"""
+        return self.cpu / (self.bytes / 1e6) if self.bytes else 0.0
+
+    def __repr__(self):
+        return "<TransferResult {} {} file(s) {} bytes in {:.2f}s: {:.1f} MB/s, {:.3f} CPU s/MB, {} error(s)>".format(
+            self.protocol, len(self.files), self.bytes, self.elapsed or 0, self.rate, self.cpu_per_mb, self.errors)
+
+
+class Channel(object):
+    """Blocking reads (with timeouts) over a transport's non-blocking read().
+
+    Args:
+        conn (transport.Transport): the connection
+        pending (bytes): input already read from conn (e.g. the screen's unread input)
+    """
+    def __init__(self, conn, pending=b""):
+        self.conn = conn
+        self.buf = bytearray(pending)
+        self.pos = 0  # next unread byte in buf
+
+    def _fill(self, timeout):
+        """Waits up to timeout seconds for input, and adds it to buf."""
+        if not transport.wait_ready([self.conn], (), max(timeout, 0))[0]:
+            return
+        data = self.conn.read()
+        if data is None:
+            raise TransferError("the remote hung up")
+        if self.pos > 65536:
+            del self.buf[:self.pos]
+            self.pos = 0
+        self.buf += data
+
+    def need(self, n, timeout):
+        """Waits until n unread bytes are in buf."""
+        deadline = time.time() + timeout
+        while len(self.buf) - self.pos < n:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TransferTimeout("no answer within {}s".format(timeout))
+            self._fill(remaining)
+
+    def getc(self, timeout):
+        """The next byte (an int)."""
+        if self.pos >= len(self.buf):
+            self.need(1, timeout)
+        c = self.buf[self.pos]
+        self.pos += 1
+        return c
+
+    def read(self, n, timeout):
+        self.need(n, timeout)
+        data = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return data
+
+    def available(self):
+        """How many unread bytes there are, after taking in what has arrived."""
+        while transport.wait_ready([self.conn], (), 0)[0]:
+            before = len(self.buf) - self.pos
+            self._fill(0)
+            if len(self.buf) - self.pos == before:
+                break
+        return len(self.buf) - self.pos
+
+    def purge(self, quiet=0.2):
+        """Discards input until none arrives for quiet seconds (line noise, a stale block)."""
+        while True:
+            self.pos = len(self.buf)
+            try:
+                self.need(1, quiet)
+            except TransferTimeout:
+                return
+
+    def write(self, data):
+        self.conn.write(data)
+
+    def leftover(self):
+        """Takes the unread input."""
+        data = bytes(self.buf[self.pos:])
+        self.buf = bytearray()
+        self.pos = 0
+        return data
+
+
+def _channel(conn):
+    return conn if isinstance(conn, Channel) else Channel(conn)
+
+
+def make_folder(folder):
+    """Creates folder (and its parents) for received files, if it isn't there yet."""
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+
+def _cancel(ch):
+    ch.write(b"\x18" * 8 + b"\x08" * 8)
+
+
+class MappedFile(object):
+    """A file to send, memory-mapped; view(start, end) slices it without copying.  (Kermit
+    sends from these too.)"""
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.mode = stat.st_mode & 0o7777
+        self._file = open(path, "rb")
+        self._mm = None
+        self._view = b""
+        if self.size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self._view = memoryview(self._mm)
+            except TypeError:  # Python 2: no memoryview of an mmap; slicing it copies
+                self._view = self._mm
+
+    def view(self, start, end):
+        return self._view[start:end]
+
+    def close(self):
+        self._file.close()
+        if self._mm is not None:
+            try:
+                if isinstance(self._view, memoryview):
+                    self._view.release()
+                self._mm.close()
+            except BufferError:  # a slice is still around (e.g. in a traceback): unmapped when it goes
+                pass
+
+
+def _crc16(data):
+    return struct.pack(">H", binascii.crc_hqx(data, 0))
+
+
+def _checksum(data):
+    return struct.pack("B", sum(bytearray(data)) & 0xff)
+
+
+#####
+# XMODEM / YMODEM
+
+def _wait_start(ch, timeout, retries):
+    """Waits for the receiver's "C" or NAK.  Returns True for CRC16."""
+    for _ in range(retries):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                c = ch.getc(deadline - time.time())
+            except TransferTimeout:
+                break
+            if c == CRC:
+                return True
+            if c == NAK:
+                return False
+            if c == CAN and ch.getc(1) == CAN:
+                raise TransferCancelled("the receiver cancelled")
+    raise TransferTimeout("the receiver didn't start")
+
+
+def _send_block(ch, seq, data, size, use_crc, timeout, retries, result, pad=b"\x1a"):
+    """Sends one block, and waits for its ACK."""
+    frame = [struct.pack("BBB", STX if size == 1024 else SOH, seq & 0xff, 0xff - (seq & 0xff)), data]
+    if len(data) < size:
+        frame.append(pad * (size - len(data)))
+    payload = b"".join(frame[1:])
+    frame = frame[0] + payload + (_crc16(payload) if use_crc else _checksum(payload))
+    for attempt in range(retries):
+        if attempt:
+            result.errors += 1
+        ch.write(frame)
+        deadline = time.time() + timeout
+        try:
+            while True:  # anything but ACK/NAK/CAN is noise (e.g. a "C" sent twice)
+                c = ch.getc(deadline - time.time())
+                if c == ACK:
+                    return
+                if c == NAK:
+                    break
+                if c == CAN and ch.getc(1) == CAN:
+                    raise TransferCancelled("the receiver cancelled")
+        except TransferTimeout:
+            continue
+    _cancel(ch)
+    raise TransferError("block {} not acknowledged after {} tries".format(seq, retries))
+
+
+def _send_eot(ch, timeout, retries):
+    """EOT until ACKed (YMODEM receivers NAK the first one)."""
+    for _ in range(retries):
+        ch.write(struct.pack("B", EOT))
+        try:
+            if ch.getc(timeout) == ACK:
+                return
+        except TransferTimeout:
+            pass
+    raise TransferError("end of file not acknowledged")
+
+
+def _send_data(ch, f, block_size, use_crc, timeout, retries, result, seq=1):
+    pos = 0
+    while pos < f.size:
+        size = block_size if f.size - pos > 128 else 128
+        _send_block(ch, seq, f.view(pos, pos + size), size, use_crc, timeout, retries, result)
+        pos += size
+        seq += 1
+
+
+def send_xmodem(conn, path, block_size=128, timeout=TIMEOUT, retries=RETRIES):
+    """Sends a file with XMODEM (block_size 1024: XMODEM-1K).  The remote must be receiving."""
+    ch = _channel(conn)
+    result = TransferResult("xmodem")
+    f = MappedFile(path)
+    try:
+        use_crc = _wait_start(ch, timeout, retries)
+        _send_data(ch, f, block_size if use_crc else 128, use_crc, timeout, retries, result)
+        _send_eot(ch, timeout, retries)
+        result._add(path, f.size)
+    finally:
+        f.close()
+    return result._done()
+
+
+def send_ymodem(conn, paths, timeout=TIMEOUT, retries=RETRIES):
+    """Sends files with YMODEM batch.  The remote must be receiving (e.g. "rb")."""
+    ch = _channel(conn)
+    result = TransferResult("ymodem")
+    for path in paths:
+        f = MappedFile(path)
+        try:
+            header = "{}\0{} {:o} {:o}".format(os.path.basename(path), f.size, f.mtime, f.mode).encode("utf-8")
+            _wait_start(ch, timeout, retries)
+            _send_block(ch, 0, header, 128 if len(header) <= 128 else 1024, True, timeout, retries, result,
+                        pad=b"\0")
+            _wait_start(ch, timeout, retries)
+            _send_data(ch, f, 1024, True, timeout, retries, result)
+            _send_eot(ch, timeout, retries)
+            result._add(path, f.size)
+        finally:
+            f.close()
+    _wait_start(ch, timeout, retries)
+    _send_block(ch, 0, b"", 128, True, timeout, retries, result, pad=b"\0")  # end of batch
+    return result._done()
+
+
+def _receive_blocks(ch, out, use_crc, timeout, retries, result, limit=None, seq=1, ymodem=False):
+    """Receives data blocks into file out, until EOT.  With limit (YMODEM), writes at most
+    that many bytes; otherwise (XMODEM) the last block's ^Z padding is dropped.  Returns
+    the bytes written."""
+    written = 0
+    held = None  # XMODEM: the latest block, held back in case it's the last
+    eots = 0
+    tries = 0
+    trailer = 2 if use_crc else 1
+    while True:
+        try:
+            c = ch.getc(timeout)
+        except TransferTimeout:
+            tries += 1
+            if tries >= retries:
+                _cancel(ch)
+                raise
+            ch.write(struct.pack("B", NAK))
+            continue
+        if c in (SOH, STX):
+            size = 1024 if c == STX else 128
+            block = ch.read(2 + size + trailer, timeout)
+            payload = block[2:2 + size]
+            check = _crc16(payload) if use_crc else _checksum(payload)
+            number, inverse = bytearray(block[:2])
+            if number + inverse != 0xff or block[2 + size:] != check:
+                result.errors += 1
+                ch.purge()
+                ch.write(struct.pack("B", NAK))
+                continue
+            tries = eots = 0
+            if number == (seq - 1) & 0xff:  # our ACK got lost: it's sent again
+                ch.write(struct.pack("B", ACK))
+                continue
+            if number != seq & 0xff:
+                _cancel(ch)
+                raise TransferError("block {} out of sequence (expected {})".format(number, seq & 0xff))
+            seq += 1
+            if limit is not None:
+                payload = payload[:max(limit - written, 0)]
+                out.write(payload)
+                written += len(payload)
+            else:
+                if held is not None:
+                    out.write(held)
+                    written += len(held)
+                held = payload
+            ch.write(struct.pack("B", ACK))
+        elif c == EOT:
+            if ymodem and not eots:
+                eots += 1
+                ch.write(struct.pack("B", NAK))
+                continue
+            if held is not None:
+                held = held.rstrip(b"\x1a")
+                out.write(held)
+                written += len(held)
+            ch.write(struct.pack("B", ACK))
+            return written
+        elif c == CAN:
+            if ch.getc(1) == CAN:
+                raise TransferCancelled("the sender cancelled")
+
+
+def _start_receiving(ch, use_crc, timeout, retries):
+    """Sends "C" (or NAK) until the first block starts coming."""
+    for _ in range(retries):
+        ch.write(struct.pack("B", CRC if use_crc else NAK))
+        try:
+            ch.need(1, timeout / 3.0)
+        except TransferTimeout:
+            continue
+        if ch.buf[ch.pos] in (SOH, STX, EOT, CAN):
+            return
+        ch.pos += 1  # noise
+    raise TransferTimeout("the sender didn't start")
+
+
+def receive_xmodem(conn, path, use_crc=True, timeout=TIMEOUT, retries=RETRIES):
+    """Receives a file with XMODEM (128 or 1K blocks).  The remote must be sending."""
+    ch = _channel(conn)
+    result = TransferResult("xmodem")
+    make_folder(os.path.dirname(path))
+    with open(path, "wb") as out:
+        _start_receiving(ch, use_crc, timeout, retries)
+        result._add(path, _receive_blocks(ch, out, use_crc, timeout, retries, result))
+    return result._done()
+
+
+def receive_ymodem(conn, folder, timeout=TIMEOUT, retries=RETRIES):
+    """Receives files with YMODEM batch into folder.  The remote must be sending (e.g. "sb")."""
+    ch = _channel(conn)
+    result = TransferResult("ymodem")
+    make_folder(folder)
+    while True:
+        _start_receiving(ch, True, timeout, retries)
+        header = _FileInfo()
+        _receive_blocks_zero(ch, header, timeout, retries, result)
+        if not header.name:
+            return result._done()
+        path = os.path.join(folder, header.name)
+        with open(path, "wb") as out:
+            _start_receiving(ch, True, timeout, retries)
+            written = _receive_blocks(ch, out, True, timeout, retries, result, limit=header.size, ymodem=True)
+        if header.mtime:
+            os.utime(path, (header.mtime, header.mtime))
+        result._add(path, written)
+
+
+class _FileInfo(object):
+    """A YMODEM block 0 / ZMODEM ZFILE subpacket: file name (no folders), size, mtime."""
+    name = None
+    size = None
+    mtime = None
+
+    def parse(self, data):
+        name, _, rest = data.partition(b"\0")
+        self.name = os.path.basename(name.decode("utf-8", "replace").replace("\\", "/"))
+        fields = rest.split(b"\0")[0].split()
+        if fields:
+            self.size = int(fields[0])
+        if len(fields) > 1:
+            self.mtime = int(fields[1], 8)
+
+
+def _receive_blocks_zero(ch, header, timeout, retries, result):
+    """Receives the block 0 that starts each YMODEM file (or ends the batch)."""
+    while True:
+        c = ch.getc(timeout)
+        if c not in (SOH, STX):
+            continue
+        size = 1024 if c == STX else 128
+        block = ch.read(2 + size + 2, timeout)
+        payload = block[2:2 + size]
+        if block[:2] != b"\x00\xff" or block[2 + size:] != _crc16(payload):
+            result.errors += 1
+            ch.purge()
+            ch.write(struct.pack("B", NAK))
+            continue
+        header.parse(payload)
+        ch.write(struct.pack("B", ACK))
+        return
+
+
+#####
+# ZMODEM
+
+ZPAD, ZDLE, ZDLEE = 0x2a, 0x18, 0x58
+ZBIN, ZHEX, ZBIN32 = 0x41, 0x42, 0x43
+(ZRQINIT, ZRINIT, ZSINIT, ZACK, ZFILE, ZSKIP, ZNAK, ZABORT, ZFIN, ZRPOS, ZDATA, ZEOF, ZFERR, ZCRC,
+ ZCHALLENGE, ZCOMPL, ZCAN, ZFREECNT, ZCOMMAND, ZSTDERR) = range(20)
+ZCRCE, ZCRCG, ZCRCQ, ZCRCW = 0x68, 0x69, 0x6a, 0x6b  # data subpacket ends
+CANFDX, CANOVIO, CANFC32, ESCCTL = 0x01, 0x02, 0x20, 0x40  # ZRINIT flags
+ZCBIN, ZCRESUM = 1, 3  # ZFILE conversion options
+
+_ZEROS = b"\0\0\0\0"
+_BATCH = 64 * 1024  # the sender writes subpackets this many bytes at a time
+_FLOW_CONTROL = b"\x11\x13\x91\x93"  # XON/XOFF, which the receiver ignores unless escaped
+_ESCAPED = [b"\x18", b"\x10", b"\x11", b"\x13", b"\x90", b"\x91", b"\x93"]  # ZDLE first
+_ESCAPED_CTL = [struct.pack("B", c) for c in list(range(0x20)) + list(range(0x80, 0xa0))
+                if struct.pack("B", c) not in _ESCAPED]
+_FRAME_END_RE = re.compile(b"\x18[h-k]")
+
+
+def _escape_pairs(chars):
+    return [(c, b"\x18" + struct.pack("B", bytearray(c)[0] ^ 0x40)) for c in chars]
+
+
+_ESCAPES = _escape_pairs(_ESCAPED)
+_ESCAPES_CTL = _ESCAPES + _escape_pairs(_ESCAPED_CTL)
+_UNESCAPE = dict((struct.pack("B", c ^ 0x40), struct.pack("B", c)) for c in range(256))
+_UNESCAPE.update({b"l": b"\x7f", b"m": b"\xff"})  # ZRUB0, ZRUB1
+
+
+def _zescape(data, ctl=False):
+    """ZDLE-escapes data (bytes.replace does the scanning, in C)."""
+    data = bytes(data)
+    for c, escaped in _ESCAPES_CTL if ctl else _ESCAPES:
+        data = data.replace(c, escaped)
+    return data
+
+
+def _zunescape(data):
+    parts = data.translate(None, _FLOW_CONTROL).split(b"\x18")
+    if len(parts) == 1:
+        return parts[0]
+    out = [parts[0]]
+    for part in parts[1:]:  # each starts with an escaped byte
+        if not part:
+            raise _BadCRC("ZDLE ZDLE")  # line noise
+        out.append(_UNESCAPE[part[:1]])
+        out.append(part[1:])
+    return b"".join(out)
+
+
+def _position(pos):
+    return struct.pack("<I", pos)
+
+
+def _flags(f0, f1=0):
+    return struct.pack("BBBB", 0, 0, f1, f0)
+
+
+def _hex_header(ftype, data=_ZEROS):
+    body = struct.pack("B", ftype) + data
+    out = b"**\x18B" + binascii.hexlify(body + _crc16(body)) + b"\r\x8a"
+    return out if ftype in (ZACK, ZFIN) else out + b"\x11"
+
+
+def _bin_header(ftype, data, crc32, ctl=False):
+    body = struct.pack("B", ftype) + data
+    if crc32:
+        return b"*\x18C" + _zescape(body + struct.pack("<I", binascii.crc32(body) & 0xffffffff), ctl)
+    return b"*\x18A" + _zescape(body + _crc16(body), ctl)
+
+
+def _subpacket(data, end, crc32, ctl=False):
+    """A data subpacket: escaped data, ZDLE + end, escaped CRC (of data and end)."""
+    marker = struct.pack("B", end)
+    if crc32:
+        crc = struct.pack("<I", binascii.crc32(marker, binascii.crc32(data)) & 0xffffffff)
+    else:
+        crc = struct.pack(">H", binascii.crc_hqx(marker, binascii.crc_hqx(data, 0)))
+    return b"".join([_zescape(data, ctl), b"\x18", marker, _zescape(crc, ctl)])
+
+
+class _BadCRC(TransferError):
+    pass
+
+
+def _zgetc(ch, timeout):
+    """The next byte of a binary header or CRC, unescaped.  Frame ends come back as 0x100 + end."""
+    while True:
+        c = ch.getc(timeout)
+        if c == ZDLE:
+            c = ch.getc(timeout)
+            if c in (0x11, 0x13, 0x91, 0x93):
+                continue
+            if ZCRCE <= c <= ZCRCW:
+                return 0x100 | c
+            if c == 0x6c:
+                return 0x7f
+            if c == 0x6d:
+                return 0xff
+            return c ^ 0x40
+        if c in (0x11, 0x13, 0x91, 0x93):
+            continue
+        return c
+
+
+def _read_header(ch, timeout):
+    """Skips to the next header and reads it.  Returns (type, 4 data bytes, crc32: whether
+    it was a 32-bit binary header, so its data subpackets have CRC32 too)."""
+    deadline = time.time() + timeout
+    cans = 0
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TransferTimeout("no ZMODEM header within {}s".format(timeout))
+        c = ch.getc(remaining)
+        if c == CAN:
+            cans += 1
+            if cans >= 5:
+                raise TransferCancelled("the other end cancelled")
+            continue
+        cans = 0
+        if c != ZPAD:
+            continue
+        while c == ZPAD:
+            c = ch.getc(timeout)
+        if c != ZDLE:
+            continue
+        kind = ch.getc(timeout)
+        try:
+            if kind == ZHEX:
+                body = binascii.unhexlify(ch.read(14, timeout))
+                if _crc16(body[:5]) != body[5:]:
+                    raise _BadCRC("bad header CRC")
+                crc32 = False
+            elif kind in (ZBIN, ZBIN32):
+                crc32 = kind == ZBIN32
+                raw = bytearray()
+                for _ in range(9 if crc32 else 7):
+                    c = _zgetc(ch, timeout)
+                    if c > 0xff:
+                        raise _BadCRC("frame end in a header")
+                    raw.append(c)
+                body = bytes(raw)
+                if crc32:
+                    ok = struct.pack("<I", binascii.crc32(body[:5]) & 0xffffffff) == body[5:]
+                else:
+                    ok = _crc16(body[:5]) == body[5:]
+                if not ok:
+                    raise _BadCRC("bad header CRC")
+            else:
+                continue
+        except (_BadCRC, binascii.Error, TypeError):
+            continue  # garbled: wait for the sender to try again
+        return bytearray(body)[0], body[1:5], crc32
+
+
+def _read_subpacket(ch, crc32, timeout):
+    """Reads a data subpacket.  Returns (data, frame end); raises _BadCRC."""
+    scanned = 0  # bytes after ch.pos searched for the frame end already
+    while True:
+        m = _FRAME_END_RE.search(ch.buf, ch.pos + scanned)
+        if m:
+            break
+        scanned = max(len(ch.buf) - ch.pos - 1, 0)
+        if scanned > 4 * 8192:
+            raise _BadCRC("no end to the data subpacket")
+        ch.need(scanned + 2, timeout)
+    data = _zunescape(bytes(ch.buf[ch.pos:m.start()]))
+    end = ch.buf[m.start() + 1]
+    ch.pos = m.end()
+    crc = bytearray()
+    for _ in range(4 if crc32 else 2):
+        c = _zgetc(ch, timeout)
+        if c > 0xff:
+            raise _BadCRC("frame end in a CRC")
+        crc.append(c)
+    marker = struct.pack("B", end)
+    if crc32:
+        ok = struct.pack("<I", binascii.crc32(marker, binascii.crc32(data)) & 0xffffffff) == crc
+    else:
+        ok = struct.pack(">H", binascii.crc_hqx(marker, binascii.crc_hqx(data, 0))) == crc
+    if not ok:
+        raise _BadCRC("bad data CRC")
+    return data, end
+
+
+def _poll_header(ch, timeout):
+    """A header that has (started to) arrive, or None (also if the rest of it doesn't come)."""
+    if not ch.available():
+        return None
+    start = ch.buf.find(b"*", ch.pos)
+    if start < 0:
+        ch.pos = len(ch.buf)  # noise
+        return None
+    ch.pos = start
+    try:
+        return _read_header(ch, timeout)
+    except TransferTimeout:
+        return None
+
+
+def send_zmodem(conn, paths, window=WINDOW, block_size=ZMODEM_BLOCK, resume=False, timeout=TIMEOUT,
+                retries=RETRIES):
+    """Sends files with ZMODEM.  The remote must be receiving (e.g. "rz").
+
+    Args:
+        conn: transport or Channel
+        paths (list): files to send
+        window (int): bytes that may be sent before the receiver acknowledges them; None:
+            stream without waiting
+        block_size (int): data subpacket size, up to 8192
+        resume (bool): ask the receiver to carry on from the end of partial files
+    """
+    ch = _channel(conn)
+    result = TransferResult("zmodem")
+    for attempt in range(retries):
+        ch.write(_hex_header(ZRQINIT))
+        try:
+            ftype, data, _ = _read_header(ch, timeout)
+        except TransferTimeout:
+            continue
+        if ftype == ZRINIT:
+            break
+    else:
+        raise TransferTimeout("the receiver didn't start")
+    flags = bytearray(data)[3]
+    buffer_size = struct.unpack("<H", data[:2])[0]  # non-zero: the receiver can't overlap I/O
+    options = dict(crc32=bool(flags & CANFC32), ctl=bool(flags & ESCCTL), buffer_size=buffer_size,
+                   window=window, block_size=min(block_size, 8192), timeout=timeout, retries=retries)
+    total = sum(os.path.getsize(path) for path in paths)
+    for i, path in enumerate(paths):
+        f = MappedFile(path)
+        try:
+            info = "{}\0{} {:o} {:o} 0 {} {}\0".format(os.path.basename(path), f.size, f.mtime, f.mode,
+                                                       len(paths) - i, total).encode("utf-8")
+            total -= f.size
+            sent = _zsend_file(ch, f, info, ZCRESUM if resume else ZCBIN, result, **options)
+            if sent is not None:
+                result._add(path, sent)
+        finally:
+            f.close()
+    for attempt in range(retries):
+        ch.write(_hex_header(ZFIN))
+        try:
+            if _read_header(ch, timeout)[0] == ZFIN:
+                break
+        except TransferTimeout:
+            pass
+    ch.write(b"OO")
+    return result._done()
+
+
+def _zsend_file(ch, f, info, conversion, result, crc32, ctl, buffer_size, window, block_size, timeout,
+                retries):
+    """Offers a file, and sends it from where the receiver asks.  Returns the bytes sent (less
+    than the file's size when resuming), or None if skipped."""
+    offer = _bin_header(ZFILE, _flags(conversion), crc32, ctl) + _subpacket(info, ZCRCW, crc32, ctl)
+    ch.write(offer)
+    attempts = 0
+    while True:
+        try:
+            ftype, data, _ = _read_header(ch, timeout)
+        except TransferTimeout:
+            attempts += 1
+            if attempts >= retries:
+                raise TransferError("{} wasn't accepted".format(f.path))
+            ch.write(offer)
+            continue
+        if ftype == ZRPOS:
+            break
+        if ftype == ZSKIP:
+            return None
+        if ftype == ZNAK:
+            ch.write(offer)
+        elif ftype == ZCRC:
+            ch.write(_hex_header(ZCRC, _position(binascii.crc32(f.view(0, f.size)) & 0xffffffff)))
+        # anything else (e.g. a ZRINIT answering our ZRQINIT too) is stale
+    pos = acked = start = struct.unpack("<I", data)[0]
+    ack_every = max(window // 4, block_size) if window else None
+    asked = pos  # where an ack was last asked for
+    waits = 0
+    ch.write(_bin_header(ZDATA, _position(pos), crc32, ctl))
+    while True:
+        if pos >= f.size:
+            ch.write(_subpacket(b"", ZCRCE, crc32, ctl) + _bin_header(ZEOF, _position(pos), crc32, ctl))
+            try:
+                ftype, data, _ = _read_header(ch, timeout)
+            except TransferTimeout:
+                waits += 1
+                if waits >= retries:
+                    raise
+                continue
+            if ftype == ZRINIT:
+                return f.size - start
+            if ftype == ZSKIP:
+                return None
+            if ftype == ZRPOS:
+                pos = acked = asked = _zrestart(ch, data, crc32, ctl, result)
+            continue
+        # subpackets up to the next one that wants an ack go out in one write
+        batch = []
+        size = 0
+        end = ZCRCG
+        while end == ZCRCG and size < _BATCH and pos < f.size:
+            chunk = f.view(pos, min(pos + block_size, f.size))
+            pos += len(chunk)
+            size += len(chunk)
+            if buffer_size and pos - acked >= buffer_size:
+                end = ZCRCW
+            elif ack_every and pos - asked >= ack_every:
+                end = ZCRCQ
+                asked = pos
+            batch.append(_subpacket(chunk, end, crc32, ctl))
+        ch.write(b"".join(batch))
+        # take in acks (and error reports); wait for them if the window is full
+        while True:
+            full = end == ZCRCW or (window and pos - acked >= window)
+            if full:
+                try:
+                    header = _read_header(ch, timeout)
+                except TransferTimeout:  # lost acks: start again from the last one
+                    waits += 1
+                    if waits >= retries:
+                        raise
+                    pos = asked = _zrestart(ch, _position(acked), crc32, ctl, result)
+                    break
+            else:
+                header = _poll_header(ch, timeout)
+                if header is None:
+                    break
+            ftype, data, _ = header
+            if ftype == ZACK:
+                acked = max(acked, struct.unpack("<I", data)[0])
+                waits = 0
+                if end == ZCRCW and acked >= pos:
+                    ch.write(_bin_header(ZDATA, _position(pos), crc32, ctl))
+                    break
+            elif ftype == ZRPOS:
+                pos = acked = asked = _zrestart(ch, data, crc32, ctl, result)
+                break
+            elif ftype == ZSKIP:
+                return None
+            elif ftype in (ZABORT, ZFIN, ZCAN):
+                raise TransferCancelled("the receiver aborted")
+
+
+def _zrestart(ch, data, crc32, ctl, result):
+    """The receiver asked for data again from a position (ZRPOS): starts a new frame there."""
+    pos = struct.unpack("<I", data)[0]
+    result.errors += 1
+    ch.write(_bin_header(ZDATA, _position(pos), crc32, ctl))
+    return pos
+
+
+def receive_zmodem(conn, folder, resume=False, timeout=TIMEOUT, retries=RETRIES):
+    """Receives files with ZMODEM into folder.  The remote must be sending (e.g. "sz").
+
+    Args:
+        conn: transport or Channel
+        folder (str): where the files go (the sender's folder names are dropped)
+        resume (bool): carry on from the end of files that are already there (as if the
+            sender had asked to)
+    """
+    ch = _channel(conn)
+    result = TransferResult("zmodem")
+    make_folder(folder)
+    rinit = _hex_header(ZRINIT, _flags(CANFDX | CANOVIO | CANFC32))
+    ch.write(rinit)
+    waits = 0
+    while True:
+        try:
+            ftype, data, crc32 = _read_header(ch, timeout)
+        except TransferTimeout:
+            waits += 1
+            if waits >= retries:
+                raise
+            ch.write(rinit)
+            continue
+        waits = 0
+        if ftype == ZRQINIT:
+            ch.write(rinit)
+        elif ftype == ZSINIT:
+            try:
+                _read_subpacket(ch, crc32, timeout)
+                ch.write(_hex_header(ZACK))
+            except (_BadCRC, TransferTimeout):
+                ch.write(_hex_header(ZNAK))
+        elif ftype == ZFILE:
+            try:
+                info, _ = _read_subpacket(ch, crc32, timeout)
+            except (_BadCRC, TransferTimeout):
+                ch.write(_hex_header(ZNAK))
+                continue
+            header = _FileInfo()
+            header.parse(info)
+            conversion = bytearray(data)[3]
+            _zreceive_file(ch, folder, header, resume or conversion == ZCRESUM, result, timeout, retries)
+            ch.write(rinit)
+        elif ftype == ZFIN:
+            ch.write(_hex_header(ZFIN))
+            try:  # "over and out"
+                ch.need(2, 1.0)
+                if ch.buf[ch.pos:ch.pos + 2] == b"OO":
+                    ch.pos += 2
+            except TransferTimeout:
+                pass
+            return result._done()
+        elif ftype in (ZDATA, ZEOF):
+            ch.write(rinit)  # left over from a file we're done with
+        elif ftype in (ZABORT, ZCAN):
+            raise TransferCancelled("the sender aborted")
+
+
+def _zreceive_file(ch, folder, header, resume, result, timeout, retries):
+    path = os.path.join(folder, header.name)
+    pos = start = os.path.getsize(path) if resume and os.path.exists(path) else 0
+    if not header.name or (header.size is not None and pos and pos >= header.size):
+        ch.write(_hex_header(ZSKIP))
+        return
+    out = open(path, "ab" if pos else "wb")
+    try:
+        ch.write(_hex_header(ZRPOS, _position(pos)))
+        waits = 0
+        while True:
+            try:
+                ftype, data, crc32 = _read_header(ch, timeout)
+            except TransferTimeout:
+                waits += 1
+                if waits >= retries:
+                    raise
+                ch.write(_hex_header(ZRPOS, _position(pos)))
+                continue
+            waits = 0
+            at = struct.unpack("<I", data)[0]
+            if ftype == ZDATA:
+                if at != pos:
+                    ch.write(_hex_header(ZRPOS, _position(pos)))
+                    continue
+                while True:
+                    try:
+                        chunk, end = _read_subpacket(ch, crc32, timeout)
+                    except (_BadCRC, TransferTimeout):  # garbled, or the rest of it got lost
+                        result.errors += 1
+                        ch.write(_hex_header(ZRPOS, _position(pos)))
+                        break
+                    out.write(chunk)
+                    pos += len(chunk)
+                    if end in (ZCRCQ, ZCRCW):
+                        ch.write(_hex_header(ZACK, _position(pos)))
+                    if end in (ZCRCE, ZCRCW):
+                        break
+            elif ftype == ZEOF:
+                if at == pos:
+                    break
+            elif ftype == ZFILE:  # our ZRPOS got lost
+                try:
+                    _read_subpacket(ch, crc32, timeout)
+                except (_BadCRC, TransferTimeout):
+                    pass
+                ch.write(_hex_header(ZRPOS, _position(pos)))
+            elif ftype in (ZABORT, ZCAN, ZFIN):
+                raise TransferCancelled("the sender aborted")
+    finally:
+        out.close()
+    if header.mtime:
+        os.utime(path, (header.mtime, header.mtime))
+    result._add(path, pos - start)
+
+
+#####
+# loopback benchmark
+
+def loopback():
+    """A connected pair of transports (transport.SocketTransport), e.g. for a transfer to
+    another thread."""
+    a, b = socket.socketpair()
+    return transport.SocketTransport(a), transport.SocketTransport(b)
+
+
+def bench(megabytes=16, protocols=("xmodem", "ymodem", "zmodem"), folder=None):
+    """Sends a file of random data over a loopback pair with each protocol.  Returns
+    {protocol: TransferResult}, for the sending side (cpu covers both sides)."""
+    import tempfile
+    folder = folder or tempfile.mkdtemp(prefix="xyzmodem-")
+    source = os.path.join(folder, "image.bin")
+    with open(source, "wb") as f:
+        for _ in range(megabytes):
+            f.write(os.urandom(1024 * 1024))
+    received = os.path.join(folder, "received")
+    if not os.path.isdir(received):
+        os.makedirs(received)
+    receivers = {"xmodem": lambda conn: receive_xmodem(conn, os.path.join(received, "image.bin")),
+                 "ymodem": lambda conn: receive_ymodem(conn, received),
+                 "zmodem": lambda conn: receive_zmodem(conn, received)}
+    senders = {"xmodem": lambda conn: send_xmodem(conn, source, block_size=1024),
+               "ymodem": lambda conn: send_ymodem(conn, [source]),
+               "zmodem": lambda conn: send_zmodem(conn, [source])}
+    results = {}
+    for protocol in protocols:
+        ours, theirs = loopback()
+        thread = threading.Thread(target=receivers[protocol], args=(theirs,))
+        thread.start()
+        try:
+            results[protocol] = senders[protocol](ours)
+        finally:
+            thread.join()
+            ours.close()
+            theirs.close()
+        if os.path.getsize(os.path.join(received, "image.bin")) != os.path.getsize(source):
+            raise TransferError("{}: the received file is the wrong size".format(protocol))
+    return results
+
+
+def main(argv):
+    if len(argv) not in (2, 3) or argv[1] != "bench":
+        print(__doc__.split("\n\n")[-1])
+        return 2
+    megabytes = int(argv[2]) if len(argv) > 2 else 16
+    for protocol, result in sorted(bench(megabytes).items()):
+        print("{:8} {:8.1f} MB/s {:8.3f} CPU s/MB".format(protocol, result.rate, result.cpu_per_mb))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))